@@ -1,16 +1,71 @@
-from fastapi import FastAPI
+from fastapi import FastAPI, HTTPException, Response
 from fastapi.middleware.cors import CORSMiddleware
+from fastapi.responses import StreamingResponse
 from pydantic import BaseModel
-import requests
-from bs4 import BeautifulSoup
-import urllib.parse
+from contextlib import asynccontextmanager
+import asyncio
+import logging
 import os
 import json
+import time
 from typing import Optional, List
 from datetime import datetime
 import multiprocessing
-from groq import Groq 
-app = FastAPI(title="Astral Server")
+import search
+from http_pool import outbound
+from memory_index import MemoryIndex, MemoryNamespaces
+from completion_cache import CompletionCache
+from prompt_assembler import PromptAssembler
+from conversation import ConversationStore
+from llm_backends import backend_from_env
+from singleflight import SingleFlight
+import deadlines
+import metrics
+import result_extract
+import tracing
+from admission import AdmissionController, AdmissionMiddleware, RateLimiter
+from web_router import router_from_env
+
+log = logging.getLogger('astral')
+
+
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    # the first provider health probes also open the search connections
+    search.health.start()
+    warming = asyncio.get_running_loop().create_task(warm_up()) if WARMUP else None
+    yield
+    if warming is not None and not warming.done():
+        warming.cancel()
+    await conversations.aclose()
+    await search.health.stop()
+    await outbound.aclose()
+    search.web_cache.close()
+    result_extract.shutdown()
+    await llm.aclose()
+    tracing.tracer.flush()
+
+
+app = FastAPI(title="Astral Server", lifespan=lifespan)
+
+# Admission control for the chat endpoints: at most ADMISSION_MAX_IN_FLIGHT requests are
+# worked on at once, up to ADMISSION_MAX_QUEUE more wait up to ADMISSION_MAX_WAIT seconds,
+# the rest get a fast 503. Each client (IP, or X-Session-Id with RATE_LIMIT_KEY=session)
+# gets RATE_LIMIT_RPS requests/second with bursts of RATE_LIMIT_BURST, then 429. The IP is
+# read from X-Forwarded-For behind TRUSTED_PROXY_HOPS proxies (1 on Render, 0 when exposed directly).
+admission = AdmissionController(
+    max_in_flight=int(os.environ.get('ADMISSION_MAX_IN_FLIGHT', 32)),
+    max_queue=int(os.environ.get('ADMISSION_MAX_QUEUE', 64)),
+    max_wait=float(os.environ.get('ADMISSION_MAX_WAIT', 5)),
+)
+rate_limiter = RateLimiter(
+    rate=float(os.environ.get('RATE_LIMIT_RPS', 0.5)),
+    burst=float(os.environ.get('RATE_LIMIT_BURST', 10)),
+)
+# added before CORS so rejections still carry CORS headers
+app.add_middleware(AdmissionMiddleware, controller=admission, limiter=rate_limiter,
+                   key_by=os.environ.get('RATE_LIMIT_KEY', 'ip'),
+                   trusted_proxies=int(os.environ.get('TRUSTED_PROXY_HOPS', 1)))
 
 # Allow browser-based frontends to call this API (adjust origins as needed)
 app.add_middleware(
@@ -21,6 +76,13 @@ app.add_middleware(
     allow_headers=["*"],
 )
 
+# Outermost: counts every request, including ones rejected by admission control
+app.add_middleware(metrics.MetricsMiddleware, paths=['/chat', '/chat/stream', '/memory', '/stats', '/metrics'])
+
+# Around everything: every response carries X-Request-ID, and with TRACE_EXPORT set the
+# request's span tree is exported (see tracing.py for sampling and where traces go)
+app.add_middleware(tracing.TracingMiddleware)
+
 # Resolve model path relative to this `scripts/` directory (models/ is inside `scripts/`)
 SCRIPT_DIR = os.path.abspath(os.path.dirname(__file__))
 PROJECT_ROOT = os.path.abspath(os.path.join(SCRIPT_DIR, '..'))
@@ -31,15 +93,36 @@ BATCH_SIZE = 128
 TEMPERATURE = 0.7
 TOP_P = 0.9
 CPU_THREADS = min(4, multiprocessing.cpu_count())
-REPLY_MAX_TOKENS = 512
-
-# Load Groq API key from environment variable (for Render deployment)
-api_key = os.environ.get('GROQ_API_KEY')
-if not api_key:
-    raise ValueError("GROQ_API_KEY environment variable is required")
+# Smallest reply allowance for a turn with web findings (200 without); the actual
+# max_tokens is whatever PROMPT_TOKEN_BUDGET the prompt leaves unused, if that is more
+REPLY_MIN_TOKENS = 512
+# Every chat request must finish within REQUEST_DEADLINE seconds. Each stage (memory
+# retrieval, web search, provider fetches, completion) gets what is left of it, and
+# search stops early enough to leave COMPLETION_RESERVE seconds for the model.
+REQUEST_DEADLINE = float(os.environ.get('REQUEST_DEADLINE', 30))
+COMPLETION_RESERVE = float(os.environ.get('COMPLETION_RESERVE', 10))
+RETRIEVAL_TIMEOUT = 2.0
 
-client = Groq(api_key=api_key)
 MODEL_NAME = "llama-3.3-70b-versatile"
+# LLM_BACKEND: 'groq' (default, needs GROQ_API_KEY), 'llama_cpp' (local GGUF at LLAMA_MODEL_PATH)
+# or 'fake' (deterministic, for benchmarks and offline runs). LLM_FALLBACK names a backend
+# to fail over to when the primary one errors.
+llm = backend_from_env(MODEL_NAME)
+# Input tokens (system prompt + context + user text) a single turn may use
+PROMPT_TOKEN_BUDGET = int(os.environ.get('PROMPT_TOKEN_BUDGET', 3000))
+prompt_assembler = PromptAssembler(input_budget=PROMPT_TOKEN_BUDGET, context_window=MAX_CONTEXT)
+
+# Replies to repeated prompts are served from memory instead of calling the model again.
+# 'exact' (default), 'normalized' (also match context-free requests on normalized text) or 'off'
+COMPLETION_CACHE_POLICY = os.environ.get('COMPLETION_CACHE_POLICY', 'exact')
+completion_cache = CompletionCache(
+    policy=COMPLETION_CACHE_POLICY,
+    max_entries=int(os.environ.get('COMPLETION_CACHE_SIZE', 1000)),
+    ttl=float(os.environ.get('COMPLETION_CACHE_TTL', 3600)),
+)
+# Identical cacheable requests that arrive while one is being generated wait for it
+# instead of calling the model again (keyed like the completion cache)
+completion_flights = SingleFlight()
 
 SYSTEM_PROMPT = """
 You are Astral — an AI assistant specialized in addiction support and emotional guidance.
@@ -184,314 +267,491 @@ class Message(BaseModel):
     text: str
     use_web: Optional[bool] = False
     web_query: Optional[str] = None
+    session_id: Optional[str] = None
+    # client-side chat id; turns in the same chat (and session) are sent back to the model as history
+    chat_id: Optional[str] = None
+    # skip the completion cache for this request (always ask the model)
+    bypass_cache: Optional[bool] = False
 
 
 class MemoryItem(BaseModel):
     role: str
     text: str
+    session_id: Optional[str] = None
+
+
+# In-memory storage for memories (ephemeral on Render), one BM25-indexed ring per session
+MAX_MEMORIES = 1000           # per session
+MAX_MEMORY_SESSIONS = 5000    # idle sessions beyond this are dropped, least recently used first
+DEFAULT_SESSION = 'default'
+# 'bm25' (keyword inverted index) or 'vector' (offline hashed-n-gram embeddings, needs numpy)
+MEMORY_BACKEND = os.environ.get('MEMORY_BACKEND', 'bm25')
+
 
+def _memory_backend():
+    if MEMORY_BACKEND == 'vector':
+        from vector_memory import VectorIndex
+        return VectorIndex
+    return MemoryIndex
 
-# In-memory storage for memories (ephemeral on Render)
-_memories = []
 
+_memories = MemoryNamespaces(capacity=MAX_MEMORIES, max_namespaces=MAX_MEMORY_SESSIONS, factory=_memory_backend())
 
-def load_memories() -> List[dict]:
-    return _memories
 
+def load_memories(session_id: Optional[str] = None) -> List[dict]:
+    index = _memories.get(session_id or DEFAULT_SESSION, create=False)
+    return index.items() if index else []
 
-def append_memory(role: str, text: str):
+
+def append_memory(role: str, text: str, session_id: Optional[str] = None):
     item = {
         'role': role,
         'text': text,
         'ts': datetime.utcnow().isoformat()
     }
-    _memories.append(item)
-    # Keep only last 1000 memories to prevent memory bloat
-    if len(_memories) > 1000:
-        _memories.pop(0)
+    # the session's ring drops its oldest memory once it holds MAX_MEMORIES
+    _memories.get(session_id or DEFAULT_SESSION).add(item)
 
 
-def retrieve_relevant_memories(query: str, limit: int = 5):
-    # Very simple keyword overlap based retrieval.
+def retrieve_relevant_memories(query: str, limit: int = 5, session_id: Optional[str] = None):
+    index = _memories.get(session_id or DEFAULT_SESSION, create=False)
+    if index is None:
+        return []
     if not query:
-        return load_memories()[-limit:]
-
-    qwords = set([w for w in ''.join([c.lower() if c.isalnum() else ' ' for c in query]).split() if len(w) > 2])
-    mems = load_memories()
-    scored = []
-    for m in mems:
-        mwords = set([w for w in ''.join([c.lower() if c.isalnum() else ' ' for c in m.get('text','')]).split() if len(w) > 2])
-        score = len(qwords & mwords)
-        scored.append((score, m))
-
-    scored.sort(key=lambda x: x[0], reverse=True)
+        return index.recent(limit)
     # return only those with some overlap, otherwise return most recent
-    results = [m for s, m in scored if s > 0]
+    results = index.search(query, limit)
     if not results:
-        return mems[-limit:]
-    return results[:limit]
+        return index.recent(limit)
+    return results
 
 
-def is_internet_available(timeout: int = 3) -> bool:
-    try:
-        requests.get('https://www.wikipedia.org', timeout=timeout, headers={'User-Agent': 'Mozilla/5.0'})
-        return True
-    except Exception:
-        return False
+# Multi-turn history: the last HISTORY_TURNS turns of a chat are sent verbatim,
+# older ones are folded into a rolling summary in the background
+HISTORY_TURNS = int(os.environ.get('HISTORY_TURNS', 8))
+HISTORY_TOKEN_BUDGET = int(os.environ.get('HISTORY_TOKEN_BUDGET', 1500))
+SUMMARY_MAX_TOKENS = 300
 
+SUMMARY_PROMPT = (
+    "You maintain a running summary of a conversation between a user and Astral, "
+    "an addiction support and emotional guidance assistant. Update the summary with the new turns. "
+    "Keep what matters for continuing the conversation: the user's situation, goals, feelings, "
+    "facts they shared, advice already given and any open questions. "
+    "Write plain prose in the third person, under 200 words. Reply with the summary only."
+)
 
-def wiki_search(query: str, max_results: int = 3):
-    """Search Wikipedia via the public API and return list of dicts with 'url' and 'text'."""
-    out = []
-    try:
-        api = 'https://en.wikipedia.org/w/api.php'
-        params = {
-            'action': 'query',
-            'list': 'search',
-            'srsearch': query,
-            'format': 'json',
-            'srlimit': max_results,
-        }
-        r = requests.get(api, params=params, timeout=10, headers={'User-Agent': 'Mozilla/5.0'})
-        data = r.json()
-        for item in data.get('query', {}).get('search', []):
-            pageid = item.get('pageid')
-            title = item.get('title')
-            # get extract for the page
-            extract = ''
-            try:
-                # request a longer plain-text extract (approx up to exchars)
-                ex_params = {'action': 'query', 'prop': 'extracts', 'explaintext': 1, 'format': 'json', 'pageids': pageid, 'exchars': 2000}
-                er = requests.get(api, params=ex_params, timeout=10, headers={'User-Agent': 'Mozilla/5.0'})
-                ed = er.json()
-                pages = ed.get('query', {}).get('pages', {})
-                extract = pages.get(str(pageid), {}).get('extract', '')
-            except Exception:
-                extract = ''
 
-            if not extract:
-                snippet = item.get('snippet', '')
-                extract = BeautifulSoup(snippet, 'html.parser').get_text()
+async def summarize_turns(summary: str, turns: List[dict]) -> str:
+    transcript = "\n".join(f"{'User' if t['role'] == 'user' else 'Astral'}: {t['content']}" for t in turns)
+    result = await llm.acomplete(
+        [
+            {"role": "system", "content": SUMMARY_PROMPT},
+            {"role": "user", "content": f"Current summary:\n{summary or '(none)'}\n\nNew turns:\n{transcript}"},
+        ],
+        max_tokens=SUMMARY_MAX_TOKENS,
+        temperature=0.2,
+    )
+    return result['text']
 
-            url = f'https://en.wikipedia.org/?curid={pageid}'
-            out.append({'url': url, 'text': extract})
-    except Exception:
-        pass
-    return out
 
+conversations = ConversationStore(
+    summarizer=summarize_turns,
+    counter=prompt_assembler.counter,
+    keep_turns=HISTORY_TURNS,
+    history_tokens=HISTORY_TOKEN_BUDGET,
+    summary_tokens=SUMMARY_MAX_TOKENS,
+    max_conversations=MAX_MEMORY_SESSIONS,
+)
 
-# Simple in-memory cache for recent web queries
-_web_cache = {}
 
+def chat_key(msg: Message) -> Optional[tuple]:
+    """Conversation key for a request: (session id, chat id), or None to keep no history.
 
-def duckduckgo_search(query: str, max_results: int = 5):
-    """Perform a lightweight DuckDuckGo HTML search (no API key required).
-    Returns list of {'url':..., 'text':...}
+    The chat id alone is a client timestamp, easy to guess and shared by chats started
+    in the same millisecond, so history is only kept for requests carrying a session id.
     """
-    out = []
-    try:
-        url = 'https://html.duckduckgo.com/html/'
-        params = {'q': query}
-        r = requests.post(url, data=params, timeout=12, headers={'User-Agent': 'Mozilla/5.0'})
-        soup = BeautifulSoup(r.text, 'html.parser')
-        # Try to find the more structured results first
-        anchors = soup.find_all('a', attrs={'class': 'result__a'})
-        if not anchors:
-            anchors = soup.find_all('a')
-
-        for a in anchors:
-            href = a.get('href')
-            text = a.get_text().strip()
-            if not href or not href.startswith('http'):
-                continue
-            # try to find a nearby snippet
-            snippet = ''
-            parent = a.find_parent()
-            if parent:
-                s = parent.find('a', {'class': 'result__snippet'}) or parent.find('div', {'class': 'result__snippet'})
-                if s:
-                    snippet = s.get_text().strip()
-            out.append({'url': href, 'text': (snippet or text)[:1600]})
-            if len(out) >= max_results:
-                break
-    except Exception:
-        pass
-    return out
-
-
-def bing_search(query: str, max_results: int = 5):
-    """Use Bing Web Search API if `BING_API_KEY` env var is set. Returns same shape as other search fns."""
-    out = []
-    key = os.environ.get('BING_API_KEY')
-    if not key:
-        return out
+    if not msg.session_id or not msg.chat_id:
+        return None
+    return msg.session_id, msg.chat_id
+
+
+def remember_exchange(msg: Message, reply: str):
+    """Record a finished exchange in the session's memories and the chat's history."""
+    with tracing.span('memory_write') as span:
+        try:
+            append_memory('user', msg.text, msg.session_id)
+            append_memory('ai', reply, msg.session_id)
+            conversations.record(chat_key(msg), msg.text, reply)
+        except Exception as e:
+            span.record_exception(e)
+
+
+# Word-boundary trigger rules, plus the classifier at WEB_ROUTER_MODEL when set
+web_router = router_from_env()
+
+
+async def gather_web_findings(msg: Message) -> List[dict]:
+    # Use web findings when the client requests it or heuristics indicate it's useful
+    if not msg.use_web:
+        route = web_router.route(msg.text)
+        tracing.current_span().set(web_confidence=route['confidence'], web_reason=route['reason'])
+        if not route['use_web']:
+            return []
     try:
-        endpoint = 'https://api.bing.microsoft.com/v7.0/search'
-        headers = {'Ocp-Apim-Subscription-Key': key, 'User-Agent': 'Mozilla/5.0'}
-        params = {'q': query, 'count': max_results}
-        r = requests.get(endpoint, headers=headers, params=params, timeout=12)
-        data = r.json()
-        for item in data.get('webPages', {}).get('value', []):
-            out.append({'url': item.get('url'), 'text': (item.get('snippet') or '')[:1600]})
-    except Exception:
-        pass
-    return out
-
-
-def general_search(query: str, max_results: int = 5):
-    """Wrapper that tries Bing (if key present) then DuckDuckGo as fallback.
-    Uses a short in-memory cache to avoid repeated requests.
-    """
-    key = query.strip().lower()
-    cache_key = f"gs:{key}:{max_results}"
-    if cache_key in _web_cache:
-        return _web_cache[cache_key]
+        q = (msg.web_query or msg.text)[:800]
+        return await search.search_all(q, max_results=6, reserve=COMPLETION_RESERVE)
+    except Exception as e:
+        tracing.current_span().record_exception(e)
+        log.warning('web search failed: %s', e)
+    return []
+
+
+# Encourage the model to use web findings when present to produce a complete answer
+WEB_INSTRUCTIONS = (
+    "\nNote: The assistant has access to the Web findings above. "
+    "Use those sources to produce a thorough, self-contained answer that cites or references the sources when useful. "
+    "If sources disagree, summarize the differences and indicate uncertainty. "
+    "Prefer to give a complete, clear explanation rather than a short or partial reply.\n\n"
+)
 
-    results = []
-    # Prefer Bing when available
-    if os.environ.get('BING_API_KEY'):
-        results = bing_search(query, max_results=max_results)
 
-    if not results:
-        results = duckduckgo_search(query, max_results=max_results)
+async def retrieve_memories_within_deadline(msg: Message) -> List[dict]:
+    try:
+        return await deadlines.within(asyncio.to_thread(retrieve_relevant_memories, msg.text, 5, msg.session_id),
+                                      RETRIEVAL_TIMEOUT, reserve=COMPLETION_RESERVE)
+    except deadlines.DeadlineExceeded:
+        return []
+
 
-    # also include a few wiki results for authoritative references
+async def timed(timings: dict, stage: str, aw):
+    """Await `aw` in a trace span named `stage`, recording its duration in seconds as timings[stage]."""
+    t0 = time.perf_counter()
     try:
-        w = wiki_search(query, max_results=2)
-        # merge unique urls
-        seen = {r['url'] for r in results}
-        for r in w:
-            if r['url'] not in seen:
-                results.append(r)
-                seen.add(r['url'])
-                if len(results) >= max_results:
-                    break
-    except Exception:
-        pass
-
-    _web_cache[cache_key] = results
-    # keep cache small
-    if len(_web_cache) > 128:
-        # pop an arbitrary item
-        _web_cache.pop(next(iter(_web_cache)))
-    return results
+        with tracing.span(stage):
+            return await aw
+    finally:
+        timings[stage] = time.perf_counter() - t0
+
+
+def server_timing(timings: dict) -> str:
+    return ', '.join(f'{stage};dur={seconds * 1000:.1f}' for stage, seconds in timings.items())
+
 
+def timings_ms(timings: dict) -> dict:
+    return {stage: round(seconds * 1000, 1) for stage, seconds in timings.items()}
 
-def should_use_web(text: str) -> bool:
-    """Heuristic to decide whether a query likely needs up-to-date web info.
-    The client can still force the web via `use_web` flag.
+
+async def build_messages(msg: Message):
+    """Assemble the chat messages for `msg`.
+    Returns (messages, params, meta) shared by /chat and /chat/stream: `params` are the
+    sampling arguments for the completion call, `meta` says which context was included
+    and how long each stage took (meta['timings'], seconds).
     """
-    if not text:
-        return False
-    lower = text.lower()
-    # explicit user flag words
-    triggers = ['latest', 'recent', 'current', 'news', 'update', 'updates', 'version', 'versions', 'released', 'release', 'announced', 'trend', 'trending', 'today']
-    for t in triggers:
-        if t in lower:
-            return True
-    # common version/year patterns
-    import re
-    if re.search(r'20\d{2}', text):
-        return True
-    # technical queries about packages, install, or compatibility
-    tech_triggers = ['install', 'how to install', 'compatibl', 'compatibility', 'npm', 'pypi', 'github', 'stack overflow', 'stackoverflow']
-    for t in tech_triggers:
-        if t in lower:
-            return True
-    return False
+    timings = {}
+    # Memory retrieval (simple RAG) and web search don't depend on each other, so run them together
+    relevant, web_results = await asyncio.gather(
+        timed(timings, 'retrieval', retrieve_memories_within_deadline(msg)),
+        timed(timings, 'search', gather_web_findings(msg)),
+    )
+    t0 = time.perf_counter()
+    assemble_span = tracing.span('assemble')
+    history = conversations.window(chat_key(msg))
+    # turns already in the history window don't need to come back as memories
+    in_window = {t['content'] for t in history['turns']}
+    mem_lines = [f"- ({m.get('role','mem')}) {m.get('text','')}" for m in relevant or [] if m.get('text') not in in_window]
+    web_lines = [f"- Source: {s.get('url')}\n  Excerpt: {s.get('text','')}" for s in web_results]
+
+    # Web findings, then memories, are packed into PROMPT_TOKEN_BUDGET, truncated at sentence boundaries
+    reply_floor = REPLY_MIN_TOKENS if web_lines else 200
+    prompt = prompt_assembler.assemble(SYSTEM_PROMPT, msg.text, web_lines, WEB_INSTRUCTIONS, mem_lines, reply_floor,
+                                       history_tokens=history['tokens'])
+
+    messages = [{"role": "system", "content": SYSTEM_PROMPT}]
+    if history['summary']:
+        messages.append({"role": "system", "content": "Summary of the earlier conversation:\n" + history['summary']})
+    messages.extend(history['turns'])
+    messages.append({"role": "user", "content": prompt['user_content']})
+    timings['assemble'] = time.perf_counter() - t0
+    assemble_span.set(web=len(web_results), memories=prompt['memories'], history=len(history['turns']),
+                      prompt_tokens=prompt['prompt_tokens'])
+    assemble_span.end()
+    params = {
+        'max_tokens': prompt['max_tokens'],
+        'temperature': TEMPERATURE,
+        'top_p': TOP_P,
+        'stop': ["User:", "Astral:"],
+    }
+    meta = {'web': bool(prompt['web']), 'memories': prompt['memories'], 'history': len(history['turns']),
+            'prompt_tokens': prompt['prompt_tokens'], 'timings': timings}
+    return messages, params, meta
+
+
+def completion_cache_key(msg: Message, messages: list, params: dict, meta: dict) -> Optional[str]:
+    if msg.bypass_cache:
+        return None
+    has_context = bool(meta['web'] or meta['memories'] or meta['history'])
+    return completion_cache.key_for(messages, llm.model, params, has_context, msg.text)
+
 
 @app.post("/chat")
-def chat(msg: Message):
-    # Retrieve relevant memories and include them in the prompt (simple RAG)
-    relevant = retrieve_relevant_memories(msg.text, limit=5)
-    mem_text = ''
-    if relevant:
-        mem_lines = []
-        for m in relevant:
-            mem_lines.append(f"- ({m.get('role','mem')}) {m.get('text','')}")
-        mem_text = "Relevant memories:\n" + "\n".join(mem_lines) + "\n\n"
-
-    web_findings = ''
-    # Use web findings when the client requests it or heuristics indicate it's useful
-    use_web_flag = bool(msg.use_web) or should_use_web(msg.text)
-    if use_web_flag and is_internet_available(timeout=5):
+async def chat(msg: Message, response: Response):
+    with deadlines.scope(REQUEST_DEADLINE):
+        messages, params, meta = await build_messages(msg)
+
+        cache_key = completion_cache_key(msg, messages, params, meta)
+        reply = completion_cache.get(cache_key)
+        if reply is None:
+            own = {}
+
+            async def generate():
+                with tracing.span('llm', backend=llm.name, model=llm.model) as span:
+                    try:
+                        result = await llm.acomplete(messages, **params)
+                    except Exception:
+                        metrics.UPSTREAM_ERRORS.inc(provider=llm.name)
+                        raise
+                    span.set(finish_reason=result['finish_reason'], **(result['usage'] or {}))
+                metrics.record_usage(result['usage'])
+                own['reply'] = result['text'].strip()
+                # like /chat/stream, only a complete reply is cached and shared with coalesced requests
+                if result['finish_reason'] != 'stop':
+                    return None
+                completion_cache.set(cache_key, own['reply'])
+                return own['reply']
+
+            async def complete():
+                shared = await completion_flights.do(cache_key, generate)
+                if shared is None and 'reply' not in own:
+                    # the flight we joined (a truncated or abandoned reply) has nothing to share
+                    await generate()
+                return shared if shared is not None else own['reply']
+
+            try:
+                reply = await timed(meta['timings'], 'completion', deadlines.within(complete()))
+            except deadlines.DeadlineExceeded:
+                raise HTTPException(status_code=504, detail='request deadline exceeded')
+            finally:
+                metrics.observe_stages(meta['timings'])
+        else:
+            tracing.current_span().set(cached=True)
+            metrics.observe_stages(meta['timings'])
+
+    # Save user message and the generated reply to memory for future RAG
+    remember_exchange(msg, reply)
+
+    response.headers['Server-Timing'] = server_timing(meta['timings'])
+    return {"reply": reply}
+
+
+def sse_event(event: str, data: dict) -> str:
+    return f"event: {event}\ndata: {json.dumps(data, ensure_ascii=False)}\n\n"
+
+
+@app.post("/chat/stream")
+async def chat_stream(msg: Message):
+    """Same as /chat, but sends the reply as Server-Sent Events while the model generates it.
+    `delta` events carry text chunks, a final `done` event carries metadata.
+    """
+    with deadlines.scope(REQUEST_DEADLINE) as deadline:
+        messages, params, meta = await build_messages(msg)
+    cache_key = completion_cache_key(msg, messages, params, meta)
+
+    async def events():
+        timings = meta['timings']
+        t0 = time.perf_counter()
+        span = tracing.span('completion', backend=llm.name, model=llm.model, streamed=True)
+        cached = completion_cache.get(cache_key)
+        if cached is None and completion_flights.running(cache_key):
+            # the same request is already being generated; take its reply
+            try:
+                cached = await asyncio.wait_for(completion_flights.wait(cache_key), deadline.budget())
+            except Exception:
+                cached = None  # it failed: generate our own (a reply cut short resolves to None)
+        if cached is not None:
+            timings['first_token'] = timings['completion'] = time.perf_counter() - t0
+            span.set(cached=True)
+            span.end()
+            metrics.observe_stages(timings)
+            remember_exchange(msg, cached)
+            yield sse_event('delta', {'text': cached})
+            yield sse_event('done', {'reply': cached, 'model': llm.model, 'finish_reason': 'stop',
+                                     'web': meta['web'], 'usage': None, 'cached': True,
+                                     'timings_ms': timings_ms(timings)})
+            return
+
+        parts = []
+        finish_reason = None
+        usage = None
+        flight = completion_flights.begin(cache_key) if cache_key is not None else None
+        stream = llm.astream(messages, **params)
+        # If the client disconnects, starlette cancels this generator at the next
+        # await; closing the upstream stream in `finally` frees the backend connection.
         try:
-            q = (msg.web_query or msg.text)[:800]
-            snippets = wiki_search(q, max_results=2)
-            other = general_search(q, max_results=4)
-            combined = []
-            seen = set()
-            for s in (snippets or []) + (other or []):
-                url = s.get('url') or ''
-                if url in seen:
-                    continue
-                seen.add(url)
-                combined.append(s)
-
-            if combined:
-                parts = ["Web findings:"]
-                for s in combined:
-                    parts.append(f"- Source: {s.get('url')}\n  Excerpt: {s.get('text','')[:800]}")
-                web_findings = "\n" + "\n\n".join(parts) + "\n\n"
+            while True:
+                # the deadline bounds the wait for every chunk, the first one included
+                try:
+                    chunk = await asyncio.wait_for(stream.__anext__(), deadline.budget())
+                except StopAsyncIteration:
+                    break
+                if chunk['usage'] is not None:
+                    usage = chunk['usage']
+                if chunk['finish_reason']:
+                    finish_reason = chunk['finish_reason']
+                if chunk['text']:
+                    if not parts:
+                        timings['first_token'] = time.perf_counter() - t0
+                        span.event('first_token')
+                    parts.append(chunk['text'])
+                    yield sse_event('delta', {'text': chunk['text']})
+        except asyncio.TimeoutError as e:
+            span.record_exception(e)
+            yield sse_event('error', {'error': 'request deadline exceeded'})
+            return
         except Exception as e:
-            print(f"Web search error: {e}")  # Log for debugging on Render
-            web_findings = ''
-    else:
-        web_findings = ''
-
-    # Encourage the model to use web findings when present to produce a complete answer
-    web_instructions = ''
-    if web_findings:
-        web_instructions = (
-            "\nNote: The assistant has access to the Web findings above. "
-            "Use those sources to produce a thorough, self-contained answer that cites or references the sources when useful. "
-            "If sources disagree, summarize the differences and indicate uncertainty. "
-            "Prefer to give a complete, clear explanation rather than a short or partial reply.\n\n"
-        )
-
-    system_content = SYSTEM_PROMPT
-    user_content = mem_text + web_findings + web_instructions + "User:\n" + msg.text + "\n\nAstral:"
-
-    messages = [
-        {"role": "system", "content": system_content},
-        {"role": "user", "content": user_content}
-    ]
-
-    # compute a safe max_tokens so prompt + reply <= MAX_CONTEXT
-    requested = REPLY_MAX_TOKENS if web_findings else 200
-
-    # For Groq, we can use higher max_tokens since context is larger
-    reply_max = max(20, requested)
-
-    response = client.chat.completions.create(
-        model=MODEL_NAME,
-        messages=messages,
-        max_tokens=reply_max,
-        temperature=TEMPERATURE,
-        top_p=TOP_P,
-        stop=["User:", "Astral:"]
+            metrics.UPSTREAM_ERRORS.inc(provider=llm.name)
+            span.record_exception(e)
+            yield sse_event('error', {'error': str(e)})
+            return
+        finally:
+            await stream.aclose()
+            timings['completion'] = time.perf_counter() - t0
+            span.set(finish_reason=finish_reason, **(usage or {}))
+            span.end()
+            metrics.observe_stages(timings)
+            if flight is not None and not flight.done():
+                # a reply cut short (length limit, disconnect, error) is not shared: followers generate their own
+                flight.set_result(''.join(parts).strip() if finish_reason == 'stop' else None)
+
+        reply = ''.join(parts).strip()
+        metrics.record_usage(usage)
+        if finish_reason == 'stop':
+            completion_cache.set(cache_key, reply)
+        # Save only complete replies; a disconnect or upstream error never reaches here
+        remember_exchange(msg, reply)
+
+        yield sse_event('done', {
+            'reply': reply,
+            'model': llm.model,
+            'finish_reason': finish_reason,
+            'web': meta['web'],
+            'usage': usage,
+            'cached': False,
+            'timings_ms': timings_ms(timings),
+        })
+
+    return StreamingResponse(
+        events(),
+        media_type='text/event-stream',
+        headers={'Cache-Control': 'no-cache', 'X-Accel-Buffering': 'no'},
     )
 
-    reply = response.choices[0].message.content.strip()
 
-    # Save user message and the generated reply to memory for future RAG
-    try:
-        append_memory('user', msg.text)
-        append_memory('ai', reply)
-    except Exception:
-        pass
+# Values other components already count are read when /metrics is scraped
+metrics.REGISTRY.callback('astral_cache_lookups_total', 'Cache lookups by cache and result (hit ratio = hit / all).',
+                          'counter', lambda: [
+    ({'cache': name, 'result': result}, count)
+    for name, cache in (('completion', completion_cache), ('web', search.web_cache))
+    for result, count in (('hit', cache.hits), ('miss', cache.misses))])
+metrics.REGISTRY.callback('astral_cache_entries', 'Entries held by each cache.', 'gauge', lambda: [
+    ({'cache': 'completion'}, completion_cache.stats()['entries']), ({'cache': 'web'}, search.web_cache.stats()['entries'])])
+metrics.REGISTRY.callback('astral_memory_items', 'Memories held across all sessions.', 'gauge',
+                          lambda: [({}, _memories.total())])
+metrics.REGISTRY.callback('astral_memory_sessions', 'Sessions with a memory store.', 'gauge',
+                          lambda: [({}, len(_memories))])
+metrics.REGISTRY.callback('astral_conversations', 'Chats with server-side history.', 'gauge',
+                          lambda: [({}, conversations.stats()['conversations'])])
+metrics.REGISTRY.callback('astral_admission_in_flight', 'Chat requests holding an admission slot.', 'gauge',
+                          lambda: [({}, admission.in_flight)])
+metrics.REGISTRY.callback('astral_admission_queue_depth', 'Chat requests waiting for an admission slot.', 'gauge',
+                          lambda: [({}, admission.queue_depth)])
+metrics.REGISTRY.callback('astral_shed_total', 'Requests rejected before any work, by reason.', 'counter', lambda: [
+    ({'reason': 'queue_full'}, admission.shed_queue_full), ({'reason': 'timeout'}, admission.shed_timeout),
+    ({'reason': 'rate_limited'}, rate_limiter.limited)])
+metrics.REGISTRY.callback('astral_coalesced_total', 'Calls that joined an identical in-flight call.', 'counter', lambda: [
+    ({'kind': 'completion'}, completion_flights.coalesced), ({'kind': 'search'}, search.searches.coalesced)])
+metrics.REGISTRY.callback('astral_hedges_total', 'Hedged web searches, by outcome.', 'counter', lambda: [
+    ({'outcome': k}, v) for k, v in search.hedge_stats.items()])
+metrics.REGISTRY.callback('astral_circuit_open', '1 while a provider\'s circuit breaker is not closed.', 'gauge', lambda: [
+    ({'provider': name}, int(b.state != 'closed')) for name, b in search.health.breakers.items()])
+
+
+@app.get('/metrics')
+def get_metrics():
+    return Response(metrics.REGISTRY.render(), media_type=metrics.CONTENT_TYPE)
+
+
+# Opt-in warm-up (WARMUP=1): once the port is bound, do in the background the
+# first-use work a cold start would otherwise put on the first chat request.
+# /readyz answers 503 until it has finished.
+WARMUP = os.environ.get('WARMUP', '').lower() in ('1', 'true', 'yes')
+warmup_state = {'done': not WARMUP, 'seconds': None, 'errors': {}}
+
+
+async def warm_up():
+    t0 = time.perf_counter()
+    steps = {
+        # client construction plus the TLS connection to the LLM API (or the local model load)
+        'llm': llm.warmup(),
+        # tiktoken's BPE file and the token counts of the static prompt parts
+        'prompt': asyncio.to_thread(prompt_assembler.assemble, SYSTEM_PROMPT, 'warm up', [], WEB_INSTRUCTIONS, [],
+                                    REPLY_MIN_TOKENS),
+        # lxml import and the parse pool's worker
+        'parser': result_extract.run_parse(result_extract.parse_duckduckgo, '<a href="https://example.org">x</a>', 1),
+    }
+    results = await asyncio.gather(*steps.values(), return_exceptions=True)
+    for name, result in zip(steps, results):
+        if isinstance(result, Exception):
+            warmup_state['errors'][name] = str(result)
+            log.warning('warm-up step %s failed: %s', name, result)
+    warmup_state['seconds'] = round(time.perf_counter() - t0, 3)
+    warmup_state['done'] = True
 
-    return {"reply": reply}
+
+@app.get('/healthz')
+def healthz():
+    """Liveness: the process is up and serving."""
+    return {'status': 'ok'}
+
+
+@app.get('/readyz')
+def readyz(response: Response):
+    """Readiness: the LLM backend is configured and the warm-up (if enabled) has finished."""
+    problems = {}
+    try:
+        llm.check()
+    except Exception as e:
+        problems['llm'] = str(e)
+    if not warmup_state['done']:
+        problems['warmup'] = 'in progress'
+    if problems:
+        response.status_code = 503
+    return {'ready': not problems, 'problems': problems, 'warmup': warmup_state}
+
+
+@app.get('/stats')
+def get_stats():
+    return {
+        'admission': {**admission.stats(), **rate_limiter.stats()},
+        'completion_cache': completion_cache.stats(),
+        'completion_flights': completion_flights.stats(),
+        'web_cache': search.web_cache.stats(),
+        'search_flights': search.searches.stats(),
+        'hedging': dict(search.hedge_stats),
+        'providers': search.health.snapshot(),
+        'outbound': outbound.stats(),
+        'conversations': conversations.stats(),
+        'tracing': tracing.tracer.stats(),
+    }
 
 
 @app.get('/memory')
-def get_memory(query: Optional[str] = None, limit: int = 5):
-    return retrieve_relevant_memories(query or '', limit)
+def get_memory(query: Optional[str] = None, limit: int = 5, session_id: Optional[str] = None):
+    return retrieve_relevant_memories(query or '', limit, session_id)
 
 
 @app.post('/memory')
 def post_memory(item: MemoryItem):
-    append_memory(item.role, item.text)
+    append_memory(item.role, item.text, item.session_id)
     return {'ok': True}
 
 
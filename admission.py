@@ -0,0 +1,196 @@
+import asyncio
+import json
+import math
+import time
+from collections import OrderedDict, deque
+from typing import Iterable, Optional
+
+
+class TokenBucket:
+    __slots__ = ('tokens', 'updated')
+
+    def __init__(self, burst: float):
+        self.tokens = burst
+        self.updated = time.monotonic()
+
+
+class RateLimiter:
+    """Per-client token buckets: `rate` requests/second sustained, bursts up to `burst`.
+    Buckets for at most `max_clients` keys are kept, least recently seen dropped first."""
+
+    def __init__(self, rate: float = 0.5, burst: float = 10, max_clients: int = 10000):
+        self.rate = rate
+        self.burst = burst
+        self.max_clients = max_clients
+        self._buckets = OrderedDict()
+        self.limited = 0
+
+    def check(self, key: str) -> float:
+        """Take a token for `key`. Returns 0 if allowed, else seconds until one is available."""
+        if self.rate <= 0:
+            return 0.0
+        now = time.monotonic()
+        bucket = self._buckets.get(key)
+        if bucket is None:
+            bucket = self._buckets[key] = TokenBucket(self.burst)
+            while len(self._buckets) > self.max_clients:
+                self._buckets.popitem(last=False)
+        else:
+            bucket.tokens = min(self.burst, bucket.tokens + (now - bucket.updated) * self.rate)
+            bucket.updated = now
+            self._buckets.move_to_end(key)
+        if bucket.tokens >= 1:
+            bucket.tokens -= 1
+            return 0.0
+        self.limited += 1
+        return (1 - bucket.tokens) / self.rate
+
+    def stats(self) -> dict:
+        return {'rate_limited': self.limited, 'tracked_clients': len(self._buckets)}
+
+
+class AdmissionController:
+    """Global cap on requests being worked on, with a bounded FIFO wait queue.
+
+    Up to `max_in_flight` requests run at once. Up to `max_queue` more wait for a
+    slot, for at most `max_wait` seconds. Anything beyond that is shed straight
+    away, so a burst turns into fast rejections instead of a pile-up that times
+    everyone out.
+    """
+
+    def __init__(self, max_in_flight: int = 32, max_queue: int = 64, max_wait: float = 5.0):
+        self.max_in_flight = max_in_flight
+        self.max_queue = max_queue
+        self.max_wait = max_wait
+        self.in_flight = 0
+        self._waiters = deque()
+        self.admitted = 0
+        self.queued = 0
+        self.shed_queue_full = 0
+        self.shed_timeout = 0
+        self.peak_queue_depth = 0
+
+    @property
+    def queue_depth(self) -> int:
+        return len(self._waiters)
+
+    async def acquire(self) -> Optional[str]:
+        """Wait for a slot. Returns None once admitted, or why the request was shed."""
+        if self.in_flight < self.max_in_flight and not self._waiters:
+            self.in_flight += 1
+            self.admitted += 1
+            return None
+        if len(self._waiters) >= self.max_queue:
+            self.shed_queue_full += 1
+            return 'queue_full'
+        fut = asyncio.get_running_loop().create_future()
+        self._waiters.append(fut)
+        self.queued += 1
+        self.peak_queue_depth = max(self.peak_queue_depth, len(self._waiters))
+        try:
+            await asyncio.wait_for(fut, self.max_wait)
+        except BaseException as e:
+            if fut.done() and not fut.cancelled():
+                # a slot was handed over just as we gave up waiting
+                if isinstance(e, asyncio.TimeoutError):
+                    self.admitted += 1
+                    return None
+                self.release()
+                raise
+            try:
+                self._waiters.remove(fut)
+            except ValueError:
+                pass
+            if isinstance(e, asyncio.TimeoutError):
+                self.shed_timeout += 1
+                return 'timeout'
+            raise
+        self.admitted += 1
+        return None
+
+    def release(self):
+        # hand the slot straight to the oldest waiter, if any
+        while self._waiters:
+            fut = self._waiters.popleft()
+            if not fut.done():
+                fut.set_result(None)
+                return
+        self.in_flight -= 1
+
+    def stats(self) -> dict:
+        return {
+            'in_flight': self.in_flight,
+            'max_in_flight': self.max_in_flight,
+            'queue_depth': self.queue_depth,
+            'peak_queue_depth': self.peak_queue_depth,
+            'admitted': self.admitted,
+            'queued': self.queued,
+            'shed_queue_full': self.shed_queue_full,
+            'shed_timeout': self.shed_timeout,
+        }
+
+
+class AdmissionMiddleware:
+    """ASGI middleware applying rate limits and admission control to `paths`.
+
+    The slot is held until the response has been fully sent, streams included.
+    Clients are keyed by their address, or by the X-Session-Id header when
+    `key_by='session'` and the header is set. Behind `trusted_proxies` reverse
+    proxies the address is the X-Forwarded-For hop the outermost trusted proxy
+    appended, counted from the right: hops to the left of it are whatever the
+    client sent and are ignored. With `trusted_proxies=0` the header is ignored.
+    Rate-limited requests get 429 and shed requests 503, both with Retry-After.
+    """
+
+    def __init__(self, app, controller: AdmissionController, limiter: RateLimiter,
+                 paths: Iterable[str] = ('/chat', '/chat/stream'), key_by: str = 'ip', trusted_proxies: int = 1):
+        self.app = app
+        self.controller = controller
+        self.limiter = limiter
+        self.paths = frozenset(paths)
+        self.key_by = key_by
+        self.trusted_proxies = trusted_proxies
+
+    def client_key(self, scope) -> str:
+        headers = dict(scope.get('headers') or [])
+        if self.key_by == 'session':
+            session = headers.get(b'x-session-id')
+            if session:
+                return 's:' + session.decode('latin-1')[:128]
+        forwarded = headers.get(b'x-forwarded-for') if self.trusted_proxies > 0 else None
+        if forwarded:
+            hops = [h.strip() for h in forwarded.decode('latin-1').split(',') if h.strip()]
+            if hops:
+                return hops[max(0, len(hops) - self.trusted_proxies)]
+        client = scope.get('client')
+        return client[0] if client else 'unknown'
+
+    @staticmethod
+    async def _reject(send, status: int, retry_after: float, error: str):
+        body = json.dumps({'error': error}).encode('utf-8')
+        await send({
+            'type': 'http.response.start',
+            'status': status,
+            'headers': [
+                (b'content-type', b'application/json'),
+                (b'content-length', str(len(body)).encode()),
+                (b'retry-after', str(max(1, math.ceil(retry_after))).encode()),
+            ],
+        })
+        await send({'type': 'http.response.body', 'body': body})
+
+    async def __call__(self, scope, receive, send):
+        if scope['type'] != 'http' or scope['path'] not in self.paths or scope['method'] == 'OPTIONS':
+            return await self.app(scope, receive, send)
+
+        wait = self.limiter.check(self.client_key(scope))
+        if wait:
+            return await self._reject(send, 429, wait, 'rate limit exceeded, slow down')
+
+        shed = await self.controller.acquire()
+        if shed is not None:
+            return await self._reject(send, 503, self.controller.max_wait, 'server busy, try again shortly')
+        try:
+            await self.app(scope, receive, send)
+        finally:
+            self.controller.release()
@@ -0,0 +1,184 @@
+"""Speed of search-result extraction: BeautifulSoup html.parser vs lxml + XPath.
+
+Parses saved DuckDuckGo result pages (--pages), or generated pages laid out like
+DDG's HTML endpoint, with the old BeautifulSoup code and with
+result_extract.parse_duckduckgo. Also measures the worst event-loop stall while
+several pages are parsed concurrently, inline on the loop vs on the parse pool,
+and the snippet tag-stripper against BeautifulSoup.get_text.
+
+    python bench/bench_extract.py --pages saved/*.html --json out.json
+"""
+import argparse
+import asyncio
+import glob
+import json
+import os
+import random
+import sys
+import time
+from urllib.parse import quote
+
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+
+from bs4 import BeautifulSoup  # noqa: E402
+
+import result_extract  # noqa: E402
+
+WORDS = ('recovery', 'craving', 'python', 'release', 'support', 'habit', 'version', 'guide', 'study', 'sleep',
+         'install', 'news', 'health', 'mind', 'library', 'update', 'community', 'research', 'the', 'and', 'of')
+
+
+def ddg_page(rng: random.Random, results: int = 30, structured: bool = True) -> str:
+    """A page with DDG's HTML result markup, header/footer forms and hidden inputs included."""
+    def words(n):
+        return ' '.join(rng.choice(WORDS) for _ in range(n))
+    head = ('<!DOCTYPE html><html><head><meta charset="utf-8"><title>q at DuckDuckGo</title>'
+            + ''.join(f'<link rel="stylesheet" href="/dist/s{i}.css">' for i in range(4))
+            + '</head><body class="body--html"><div class="header"><form action="/html/" method="post">'
+            + ''.join(f'<input type="hidden" name="p{i}" value="{words(3)}">' for i in range(20))
+            + '</form></div><div class="serp__results"><div id="links" class="results">')
+    body = []
+    for i in range(results):
+        url = f'https://example{i}.org/{words(2).replace(" ", "/")}'
+        link_class = 'result__a' if structured else 'r-title'
+        body.append(
+            f'<div class="result results_links results_links_deep web-result"><div class="links_main links_deep result__body">'
+            f'<h2 class="result__title"><a rel="nofollow" class="{link_class}" '
+            f'href="//duckduckgo.com/l/?uddg={quote(url, safe="")}&amp;rut=abc{i}">{words(6)}</a></h2>'
+            f'<div class="result__extras"><div class="result__extras__url"><span class="result__icon">'
+            f'<img class="result__icon__img" src="//external-content.duckduckgo.com/ip3/x{i}.ico"></span>'
+            f'<a class="result__url" href="{url}">{url}</a></div></div>'
+            f'<a class="result__snippet" href="{url}">{words(12)} <b>{words(1)}</b> {words(20)}</a>'
+            f'<div class="clear"></div></div></div>')
+    tail = ('</div></div><div class="footer">' + ''.join(f'<a href="/settings#{i}">{words(2)}</a>' for i in range(40))
+            + '</div></body></html>')
+    return head + ''.join(body) + tail
+
+
+def bs4_parse(page: str, max_results: int = 5) -> list:
+    """The BeautifulSoup extraction duckduckgo_search used before, kept for comparison."""
+    out = []
+    soup = BeautifulSoup(page, 'html.parser')
+    anchors = soup.find_all('a', attrs={'class': 'result__a'})
+    if not anchors:
+        anchors = soup.find_all('a')
+    for a in anchors:
+        href = a.get('href')
+        text = a.get_text().strip()
+        if not href or not href.startswith('http'):
+            continue
+        snippet = ''
+        parent = a.find_parent()
+        if parent:
+            s = parent.find('a', {'class': 'result__snippet'}) or parent.find('div', {'class': 'result__snippet'})
+            if s:
+                snippet = s.get_text().strip()
+        out.append({'url': href, 'text': (snippet or text)[:1600]})
+        if len(out) >= max_results:
+            break
+    return out
+
+
+def per_call_ms(fn, pages, repeat):
+    t0 = time.perf_counter()
+    for _ in range(repeat):
+        for page in pages:
+            fn(page, 5)
+    return (time.perf_counter() - t0) / (repeat * len(pages)) * 1000
+
+
+async def max_loop_stall(pages, offload: bool) -> float:
+    """Longest gap between 1 ms ticks of a ticker task while every page is parsed at once."""
+    stall = 0.0
+    done = False
+
+    async def ticker():
+        nonlocal stall
+        last = time.perf_counter()
+        while not done:
+            await asyncio.sleep(0.001)
+            now = time.perf_counter()
+            stall = max(stall, now - last - 0.001)
+            last = now
+
+    async def parse(page):
+        if offload:
+            return await result_extract.run_parse(result_extract.parse_duckduckgo, page, 5)
+        await asyncio.sleep(0)
+        return result_extract.parse_duckduckgo(page, 5)
+
+    if offload:
+        await result_extract.run_parse(result_extract.parse_duckduckgo, pages[0], 5)  # pool startup is not a stall
+    tick = asyncio.ensure_future(ticker())
+    await asyncio.sleep(0.01)
+    await asyncio.gather(*(parse(p) for p in pages))
+    done = True
+    await tick
+    return stall * 1000
+
+
+def main():
+    ap = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    ap.add_argument('--pages', nargs='*', help='saved DuckDuckGo HTML result pages (globs ok)')
+    ap.add_argument('--generated', type=int, default=8, help='pages to generate when --pages is not given')
+    ap.add_argument('--repeat', type=int, default=5)
+    ap.add_argument('--seed', type=int, default=7)
+    ap.add_argument('--json', help='write results to this file')
+    args = ap.parse_args()
+
+    rng = random.Random(args.seed)
+    if args.pages:
+        paths = [p for pattern in args.pages for p in glob.glob(pattern)]
+        sets = {'saved': [open(p, encoding='utf-8', errors='replace').read() for p in paths]}
+    else:
+        sets = {
+            'ddg layout': [ddg_page(rng) for _ in range(args.generated)],
+            'fallback (no result__a)': [ddg_page(rng, structured=False) for _ in range(args.generated)],
+        }
+
+    report = {}
+    print(f"{'pages':<24} {'KB/page':>8} {'bs4 ms':>8} {'lxml ms':>8} {'speedup':>8} {'bs4 hits':>8} {'lxml hits':>9}")
+    for name, pages in sets.items():
+        bs4_ms = per_call_ms(bs4_parse, pages, args.repeat)
+        lxml_ms = per_call_ms(result_extract.parse_duckduckgo, pages, args.repeat)
+        row = {
+            'kb_per_page': round(sum(map(len, pages)) / len(pages) / 1024, 1),
+            'bs4_ms': round(bs4_ms, 3),
+            'lxml_ms': round(lxml_ms, 3),
+            'speedup': round(bs4_ms / lxml_ms, 1),
+            'bs4_results': sum(len(bs4_parse(p)) for p in pages),
+            'lxml_results': sum(len(result_extract.parse_duckduckgo(p)) for p in pages),
+        }
+        report[name] = row
+        print(f"{name:<24} {row['kb_per_page']:>8} {row['bs4_ms']:>8} {row['lxml_ms']:>8} {row['speedup']:>7}x "
+              f"{row['bs4_results']:>8} {row['lxml_results']:>9}")
+
+    pages = next(iter(sets.values()))
+    report['loop_stall_ms'] = {
+        'inline': round(asyncio.run(max_loop_stall(pages, offload=False)), 2),
+        'pool': round(asyncio.run(max_loop_stall(pages, offload=True)), 2),
+    }
+    print(f"worst event-loop stall parsing {len(pages)} pages at once: "
+          f"inline {report['loop_stall_ms']['inline']} ms, parse pool {report['loop_stall_ms']['pool']} ms")
+
+    snippet = 'The <span class="searchmatch">Python</span> 3.13 release &amp; its <b>new</b> features, see &quot;docs&quot;'
+    n = 20000
+    t0 = time.perf_counter()
+    for _ in range(n):
+        BeautifulSoup(snippet, 'html.parser').get_text()
+    bs4_us = (time.perf_counter() - t0) / n * 1e6
+    t0 = time.perf_counter()
+    for _ in range(n):
+        result_extract.strip_tags(snippet)
+    strip_us = (time.perf_counter() - t0) / n * 1e6
+    report['snippet_us'] = {'bs4': round(bs4_us, 2), 'strip_tags': round(strip_us, 2)}
+    print(f'wikipedia snippet: bs4 get_text {bs4_us:.1f} us, strip_tags {strip_us:.2f} us')
+    result_extract.shutdown()
+
+    if args.json:
+        with open(args.json, 'w') as f:
+            json.dump(report, f, indent=2)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,75 @@
+"""Cold-start cost of importing the server, measured with `python -X importtime`.
+
+Imports Server in fresh interpreters (as `uvicorn Server:app` does on a cold
+start) and reports the median total plus the slowest top-level imports. With
+--max-ms it exits non-zero when the median is over budget, so it can guard
+against import-time regressions in CI.
+
+    python bench/bench_importtime.py --runs 5 --max-ms 900 --json out.json
+"""
+import argparse
+import json
+import os
+import statistics
+import subprocess
+import sys
+
+ROOT = os.path.abspath(os.path.join(os.path.dirname(__file__), '..'))
+
+
+def importtime(module: str, env: dict) -> dict:
+    """{module: (self_us, cumulative_us)} for one fresh `import module`."""
+    proc = subprocess.run([sys.executable, '-X', 'importtime', '-c', f'import {module}'], cwd=ROOT, env=env,
+                          capture_output=True, text=True)
+    if proc.returncode != 0:
+        raise SystemExit(f'import {module} failed:\n{proc.stderr[-2000:]}')
+    times = {}
+    for line in proc.stderr.splitlines():
+        if not line.startswith('import time:') or 'self [us]' in line:
+            continue
+        self_part, cumulative_us, name = line.split('|', 2)
+        self_us = int(self_part.split(':')[1])
+        cumulative_us = int(cumulative_us)
+        depth = (len(name) - len(name.lstrip())) // 2
+        times.setdefault(name.strip(), (self_us, cumulative_us, depth))
+    return times
+
+
+def main():
+    ap = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    ap.add_argument('--module', default='Server')
+    ap.add_argument('--runs', type=int, default=5)
+    ap.add_argument('--top', type=int, default=12)
+    ap.add_argument('--max-ms', type=float, help='fail if the median import takes longer than this')
+    ap.add_argument('--json', help='write results to this file')
+    args = ap.parse_args()
+
+    # production-like settings: the Groq backend with a (dummy) key, no warm-up
+    env = {**os.environ, 'LLM_BACKEND': os.environ.get('LLM_BACKEND', 'groq'),
+           'GROQ_API_KEY': os.environ.get('GROQ_API_KEY', 'importtime-dummy-key')}
+    runs = [importtime(args.module, env) for _ in range(args.runs)]
+    total_ms = statistics.median(r[args.module][1] for r in runs) / 1000
+
+    # direct imports of the module (one level below it), by median cumulative time
+    last = runs[-1]
+    direct = [name for name, (_, _, depth) in last.items() if depth == 1 and all(name in r for r in runs)]
+    top = sorted(((statistics.median(r[name][1] for r in runs) / 1000, name) for name in direct), reverse=True)
+    top = top[:args.top]
+    own_ms = statistics.median(r[args.module][0] for r in runs) / 1000
+
+    print(f'import {args.module}: median {total_ms:.1f} ms over {args.runs} runs '
+          f'({own_ms:.1f} ms in its own module body)')
+    for ms, name in top:
+        print(f'  {ms:8.1f} ms  {name}')
+    report = {'module': args.module, 'runs': args.runs, 'median_ms': round(total_ms, 1), 'own_ms': round(own_ms, 1),
+              'top': {name: round(ms, 1) for ms, name in top}}
+    if args.json:
+        with open(args.json, 'w') as f:
+            json.dump(report, f, indent=2)
+    if args.max_ms is not None and total_ms > args.max_ms:
+        print(f'FAIL: {total_ms:.1f} ms is over the {args.max_ms:.0f} ms budget')
+        sys.exit(1)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,367 @@
+"""Load test of the chat endpoints against local stand-ins for every upstream.
+
+Starts one fake upstream server that answers like Groq's OpenAI-compatible API,
+Wikipedia's w/api.php, the DuckDuckGo HTML endpoint and Bing Web Search, each
+with its own latency and error profile. It then serves Server.app with uvicorn
+and drives /chat and /chat/stream over real HTTP at each concurrency level.
+
+Reports request rate, client-side latency and per-stage server timings
+(retrieval, search, assemble, completion, first_token) at p50/p95/p99, plus
+process memory growth. --json writes the same numbers, with the git commit, to
+a file for comparing commits.
+
+    python bench/bench_load.py --concurrency 1 8 32 --requests 400 --json load.json
+    python bench/bench_load.py --latency groq=0.8 ddg=0.4 --errors ddg=0.05 --bing
+"""
+import argparse
+import asyncio
+import gc
+import json
+import os
+import random
+import socket
+import subprocess
+import sys
+import threading
+import time
+from urllib.parse import parse_qs
+
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+
+import httpx  # noqa: E402
+import uvicorn  # noqa: E402
+from starlette.applications import Starlette  # noqa: E402
+from starlette.responses import HTMLResponse, JSONResponse, Response, StreamingResponse  # noqa: E402
+from starlette.routing import Route  # noqa: E402
+
+SERVICES = ('groq', 'wiki', 'ddg', 'bing')
+DEFAULT_LATENCY = {'groq': 0.35, 'wiki': 0.12, 'ddg': 0.25, 'bing': 0.15}
+STAGES = ('total', 'first_token', 'retrieval', 'search', 'assemble', 'completion')
+
+TOPICS = ['sleep and anxiety', 'quitting vaping', 'latest news on sober apps', 'how to install python 3.12',
+          'gaming late at night', 'cravings after work', 'current research on dopamine', 'motivation to exercise',
+          'social media detox', 'recent release of a meditation app', 'stress before exams', 'talking to my family']
+
+
+class Profile:
+    """Latency (log-normal around `latency` seconds) and error rate of one fake upstream."""
+
+    def __init__(self, latency: float, jitter: float, error_rate: float, rng: random.Random):
+        self.latency = latency
+        self.jitter = jitter
+        self.error_rate = error_rate
+        self.rng = rng
+
+    async def wait(self):
+        await asyncio.sleep(self.latency * self.rng.lognormvariate(0, self.jitter) if self.jitter else self.latency)
+
+    def fails(self) -> bool:
+        return self.error_rate > 0 and self.rng.random() < self.error_rate
+
+
+def fake_upstream(profiles: dict, token_delay: float, reply_tokens: int) -> Starlette:
+    """One app answering for all four upstreams, routed by path."""
+
+    def words(seed: str, n: int):
+        rng = random.Random(seed)
+        return [rng.choice(['calm', 'steady', 'breathe', 'small', 'steps', 'today', 'progress', 'rest', 'water',
+                            'walk', 'notice', 'gentle', 'support', 'plan']) for _ in range(n)]
+
+    async def groq(request):
+        p = profiles['groq']
+        body = await request.json()
+        await p.wait()
+        if p.fails():
+            return JSONResponse({'error': {'message': 'fake upstream error', 'type': 'server_error'}}, status_code=503)
+        prompt = ' '.join(m.get('content') or '' for m in body['messages'])
+        n = min(reply_tokens, body.get('max_tokens') or reply_tokens)
+        tokens = words(prompt[-200:], n)
+        usage = {'prompt_tokens': len(prompt) // 4, 'completion_tokens': n, 'total_tokens': len(prompt) // 4 + n}
+        base = {'id': 'chatcmpl-bench', 'created': int(time.time()), 'model': body['model']}
+        if not body.get('stream'):
+            await asyncio.sleep(token_delay * n)
+            return JSONResponse({**base, 'object': 'chat.completion', 'usage': usage, 'choices': [
+                {'index': 0, 'message': {'role': 'assistant', 'content': ' '.join(tokens)}, 'finish_reason': 'stop',
+                 'logprobs': None}]})
+
+        async def sse():
+            for i, tok in enumerate(tokens):
+                if i and token_delay:
+                    await asyncio.sleep(token_delay)
+                chunk = {**base, 'object': 'chat.completion.chunk', 'choices': [
+                    {'index': 0, 'delta': {'content': tok if i == 0 else ' ' + tok}, 'finish_reason': None}]}
+                yield f'data: {json.dumps(chunk)}\n\n'
+            last = {**base, 'object': 'chat.completion.chunk', 'x_groq': {'id': 'req_bench', 'usage': usage},
+                    'choices': [{'index': 0, 'delta': {}, 'finish_reason': 'stop'}]}
+            yield f'data: {json.dumps(last)}\n\n'
+            yield 'data: [DONE]\n\n'
+        return StreamingResponse(sse(), media_type='text/event-stream')
+
+    async def wiki(request):
+        p = profiles['wiki']
+        await p.wait()
+        if request.method == 'HEAD':
+            return Response()
+        if p.fails():
+            return Response('fake upstream error', status_code=503)
+        q = request.query_params
+        if q.get('list') == 'search':
+            hits = [{'pageid': i + 1, 'snippet': f'<span class="searchmatch">{q.get("srsearch")}</span> snippet {i}'}
+                    for i in range(int(q.get('srlimit', 3)))]
+            return JSONResponse({'query': {'search': hits}})
+        term = q.get('gsrsearch', '')
+        pages = {str(i + 1): {'pageid': i + 1, 'index': i + 1, 'title': f'{term} {i}',
+                              'extract': f'{term.capitalize()} is a topic. ' + ' '.join(words(term + str(i), 120)) + '.'}
+                 for i in range(int(q.get('gsrlimit', 3)))}
+        return JSONResponse({'query': {'pages': pages}})
+
+    async def ddg(request):
+        p = profiles['ddg']
+        term = parse_qs((await request.body()).decode()).get('q', [''])[0]
+        await p.wait()
+        if request.method == 'HEAD':
+            return Response()
+        if p.fails():
+            return Response('fake upstream error', status_code=503)
+        results = ''.join(
+            f'<div class="result"><a class="result__a" href="https://example.org/{i}?q={len(term)}">{term} result {i}</a>'
+            f'<a class="result__snippet">{" ".join(words(term + str(i), 30))}</a></div>' for i in range(10))
+        return HTMLResponse(f'<html><body><div class="results">{results}</div></body></html>')
+
+    async def bing(request):
+        p = profiles['bing']
+        await p.wait()
+        if p.fails():
+            return JSONResponse({'error': 'fake upstream error'}, status_code=503)
+        q = request.query_params
+        value = [{'url': f'https://bing.example.org/{i}', 'snippet': ' '.join(words(q.get('q', '') + str(i), 30))}
+                 for i in range(int(q.get('count', 5)))]
+        return JSONResponse({'webPages': {'value': value}})
+
+    return Starlette(routes=[
+        Route('/openai/v1/chat/completions', groq, methods=['POST']),
+        Route('/w/api.php', wiki, methods=['GET', 'HEAD']),
+        Route('/html/', ddg, methods=['POST', 'HEAD']),
+        Route('/v7.0/search', bing, methods=['GET']),
+    ])
+
+
+def free_port() -> int:
+    with socket.socket() as s:
+        s.bind(('127.0.0.1', 0))
+        return s.getsockname()[1]
+
+
+def serve_in_thread(app, port: int) -> uvicorn.Server:
+    server = uvicorn.Server(uvicorn.Config(app, host='127.0.0.1', port=port, log_level='warning', lifespan='auto'))
+    threading.Thread(target=server.run, daemon=True).start()
+    while not server.started:
+        time.sleep(0.01)
+    return server
+
+
+def rss_bytes() -> int:
+    try:
+        with open('/proc/self/statm') as f:
+            return int(f.read().split()[1]) * os.sysconf('SC_PAGE_SIZE')
+    except OSError:
+        import resource
+        return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss * 1024  # peak, not current, off Linux
+
+
+def percentiles(values):
+    if not values:
+        return None
+    values = sorted(values)
+    pick = lambda q: round(values[min(len(values) - 1, int(q * len(values)))], 1)  # noqa: E731
+    return {'n': len(values), 'p50': pick(0.50), 'p95': pick(0.95), 'p99': pick(0.99), 'max': round(values[-1], 1)}
+
+
+def parse_server_timing(header: str) -> dict:
+    out = {}
+    for part in filter(None, (p.strip() for p in (header or '').split(','))):
+        name, _, dur = part.partition(';dur=')
+        if dur:
+            out[name] = float(dur)
+    return out
+
+
+def make_request(rng: random.Random, args, i: int) -> dict:
+    if rng.random() < args.repeat_ratio:
+        text = 'how do I stay calm tonight'
+    else:
+        text = f'{rng.choice(TOPICS)} ({i})'
+    body = {'text': text, 'session_id': f'bench-{rng.randrange(args.sessions)}'}
+    if rng.random() < args.web_ratio:
+        body['use_web'] = True
+    if args.chat_ids:
+        body['chat_id'] = body['session_id']
+    return body
+
+
+async def one(client: httpx.AsyncClient, body: dict, stream: bool, samples: dict, counts: dict):
+    t0 = time.perf_counter()
+    try:
+        if not stream:
+            r = await client.post('/chat', json=body)
+            stages = parse_server_timing(r.headers.get('server-timing'))
+            status = r.status_code
+        else:
+            stages, status = {}, None
+            async with client.stream('POST', '/chat/stream', json=body) as r:
+                status = r.status_code
+                event = None
+                async for line in r.aiter_lines():
+                    if line.startswith('event:'):
+                        event = line[6:].strip()
+                    elif line.startswith('data:') and event == 'delta' and 'client_first_token' not in stages:
+                        stages['client_first_token'] = (time.perf_counter() - t0) * 1000
+                    elif line.startswith('data:') and event == 'done':
+                        stages.update(json.loads(line[5:]).get('timings_ms') or {})
+                    elif line.startswith('data:') and event == 'error':
+                        status = 'stream_error'
+    except Exception as e:
+        counts[type(e).__name__] = counts.get(type(e).__name__, 0) + 1
+        return
+    counts[str(status)] = counts.get(str(status), 0) + 1
+    if status != 200:
+        return
+    samples['total'].append((time.perf_counter() - t0) * 1000)
+    for stage, ms in stages.items():
+        samples.setdefault(stage, []).append(ms)
+
+
+async def run_level(base_url: str, concurrency: int, args, seed: int) -> dict:
+    rng = random.Random(seed)
+    samples = {'total': []}
+    counts = {}
+    queue = asyncio.Queue()
+    for i in range(args.requests):
+        queue.put_nowait((make_request(rng, args, i), rng.random() < args.stream_ratio))
+    limits = httpx.Limits(max_connections=concurrency, max_keepalive_connections=concurrency)
+    async with httpx.AsyncClient(base_url=base_url, timeout=120, limits=limits) as client:
+        async def worker():
+            while not queue.empty():
+                body, stream = queue.get_nowait()
+                await one(client, body, stream, samples, counts)
+
+        start = time.perf_counter()
+        await asyncio.gather(*[worker() for _ in range(concurrency)])
+        elapsed = time.perf_counter() - start
+        stats = (await client.get('/stats')).json()
+    ok = len(samples['total'])
+    return {
+        'concurrency': concurrency,
+        'requests': args.requests,
+        'ok': ok,
+        'elapsed_s': round(elapsed, 3),
+        'req_per_s': round(ok / elapsed, 2) if elapsed else None,
+        'status_counts': counts,
+        'latency_ms': {stage: percentiles(v) for stage, v in sorted(samples.items())},
+        'server_stats': stats,
+    }
+
+
+def git_commit():
+    try:
+        return subprocess.check_output(['git', 'rev-parse', '--short', 'HEAD'], text=True,
+                                       cwd=os.path.dirname(os.path.abspath(__file__))).strip()
+    except Exception:
+        return None
+
+
+def parse_pairs(pairs, defaults, cast=float):
+    out = dict(defaults)
+    for pair in pairs or []:
+        name, _, value = pair.partition('=')
+        if name not in SERVICES:
+            raise SystemExit(f'unknown service {name!r}, expected one of {SERVICES}')
+        out[name] = cast(value)
+    return out
+
+
+def main():
+    ap = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    ap.add_argument('--concurrency', type=int, nargs='+', default=[1, 8, 32])
+    ap.add_argument('--requests', type=int, default=200, help='requests per concurrency level')
+    ap.add_argument('--stream-ratio', type=float, default=0.5, help='share of requests sent to /chat/stream')
+    ap.add_argument('--web-ratio', type=float, default=0.3, help='share of requests forcing web search')
+    ap.add_argument('--repeat-ratio', type=float, default=0.1, help='share of requests repeating one prompt')
+    ap.add_argument('--sessions', type=int, default=50)
+    ap.add_argument('--chat-ids', action='store_true', help='send chat ids so multi-turn history is exercised')
+    ap.add_argument('--latency', nargs='*', metavar='SERVICE=SECONDS', help=f'defaults: {DEFAULT_LATENCY}')
+    ap.add_argument('--errors', nargs='*', metavar='SERVICE=RATE', help='error rate per upstream, default 0')
+    ap.add_argument('--jitter', type=float, default=0.3, help='log-normal sigma applied to every latency')
+    ap.add_argument('--token-delay', type=float, default=0.005, help='seconds between streamed tokens')
+    ap.add_argument('--reply-tokens', type=int, default=60)
+    ap.add_argument('--bing', action='store_true', help='enable the Bing provider (hedged with DuckDuckGo)')
+    ap.add_argument('--seed', type=int, default=7)
+    ap.add_argument('--json', help='write results to this file')
+    args = ap.parse_args()
+
+    rng = random.Random(args.seed)
+    latency = parse_pairs(args.latency, DEFAULT_LATENCY)
+    errors = parse_pairs(args.errors, {s: 0.0 for s in SERVICES})
+    profiles = {s: Profile(latency[s], args.jitter, errors[s], random.Random(rng.random())) for s in SERVICES}
+
+    upstream_port = free_port()
+    upstream = serve_in_thread(fake_upstream(profiles, args.token_delay, args.reply_tokens), upstream_port)
+    fake = f'http://127.0.0.1:{upstream_port}'
+    # Server reads its configuration at import time; admission limits are lifted so
+    # the numbers measure the pipeline itself (set ADMISSION_*/RATE_LIMIT_* to test them)
+    os.environ.update({
+        'LLM_BACKEND': 'groq', 'GROQ_API_KEY': 'bench', 'GROQ_BASE_URL': fake,
+        'WIKI_API': fake + '/w/api.php', 'DDG_URL': fake + '/html/', 'BING_ENDPOINT': fake + '/v7.0/search',
+    })
+    os.environ.setdefault('RATE_LIMIT_RPS', '0')
+    os.environ.setdefault('ADMISSION_MAX_IN_FLIGHT', str(max(args.concurrency)))
+    if args.bing:
+        os.environ['BING_API_KEY'] = 'bench'
+    else:
+        os.environ.pop('BING_API_KEY', None)
+    import Server  # noqa: E402
+
+    app_port = free_port()
+    app_server = serve_in_thread(Server.app, app_port)
+    base_url = f'http://127.0.0.1:{app_port}'
+
+    gc.collect()
+    rss_start = rss_bytes()
+    levels = []
+    try:
+        for i, c in enumerate(args.concurrency):
+            result = asyncio.run(run_level(base_url, c, args, args.seed + i))
+            gc.collect()
+            result['rss_mb'] = round(rss_bytes() / 2 ** 20, 1)
+            levels.append(result)
+            lat = result['latency_ms']
+            cell = lambda st, q: (lat.get(st) or {}).get(q, '-')  # noqa: E731
+            print(f"c={c:<4} {result['req_per_s']:>8} req/s  ok={result['ok']}/{result['requests']}  "
+                  f"total p50/p95/p99={cell('total', 'p50')}/{cell('total', 'p95')}/{cell('total', 'p99')} ms  "
+                  f"rss={result['rss_mb']} MB  status={result['status_counts']}")
+            for stage in STAGES[1:]:
+                if stage in lat and lat[stage]:
+                    print(f"       {stage:<12} p50={cell(stage, 'p50')} p95={cell(stage, 'p95')} p99={cell(stage, 'p99')}")
+    finally:
+        app_server.should_exit = True
+        upstream.should_exit = True
+    rss_end = rss_bytes()
+
+    report = {
+        'commit': git_commit(),
+        'python': sys.version.split()[0],
+        'config': {**{k: v for k, v in vars(args).items() if k not in ('latency', 'errors', 'json')},
+                   'latency': latency, 'errors': errors},
+        'memory': {'rss_start_mb': round(rss_start / 2 ** 20, 1), 'rss_end_mb': round(rss_end / 2 ** 20, 1),
+                   'rss_growth_mb': round((rss_end - rss_start) / 2 ** 20, 1)},
+        'levels': levels,
+    }
+    print(f"rss growth: {report['memory']['rss_growth_mb']} MB")
+    if args.json:
+        with open(args.json, 'w') as f:
+            json.dump(report, f, indent=2)
+        print(f'wrote {args.json}')
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,107 @@
+"""Recall@k and query latency of the memory retrieval backends.
+
+Builds a synthetic memory store, then queries it with words taken from a known
+target memory, either verbatim or perturbed (inflections, typos) the way real
+users rephrase. Prints a table and optionally writes the numbers as JSON.
+
+    python bench/bench_memory_retrieval.py --sizes 1000 10000 50000 --json out.json
+"""
+import argparse
+import json
+import os
+import random
+import sys
+import time
+
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+
+from memory_index import MemoryIndex  # noqa: E402
+from vector_memory import VectorIndex  # noqa: E402
+
+SYLLABLES = ['ka', 'lo', 'mi', 're', 'sa', 'tu', 'ven', 'dor', 'pli', 'gra', 'nes', 'bat', 'fi', 'qu', 'zel', 'hon']
+
+
+def make_vocab(rng, size):
+    words = set()
+    while len(words) < size:
+        words.add(''.join(rng.choice(SYLLABLES) for _ in range(rng.randint(2, 4))))
+    return sorted(words)
+
+
+def perturb(rng, word):
+    r = rng.random()
+    if r < 0.4:
+        return word + rng.choice(['s', 'ing', 'ed'])
+    if r < 0.7 and len(word) > 4:
+        i = rng.randrange(1, len(word) - 2)
+        return word[:i] + word[i + 1] + word[i] + word[i + 2:]
+    return word
+
+
+def build(backend, texts):
+    store = backend()
+    for t in texts:
+        store.add({'role': 'user', 'text': t})
+    return store
+
+
+def run(size, queries, k, seed):
+    rng = random.Random(seed)
+    vocab = make_vocab(rng, 20000)
+    weights = [1.0 / (i + 1) for i in range(len(vocab))]  # zipf-ish word frequencies
+    texts = [' '.join(rng.choices(vocab, weights=weights, k=rng.randint(15, 40))) for _ in range(size)]
+
+    cases = []
+    for _ in range(queries):
+        target = rng.randrange(size)
+        words = sorted(set(texts[target].split()), key=lambda w: vocab.index(w), reverse=True)[:4]
+        cases.append((target, ' '.join(words), ' '.join(perturb(rng, w) for w in words)))
+
+    backends = {
+        'bm25': MemoryIndex,
+        'vector': VectorIndex,
+    }
+
+    results = {}
+    for name, backend in backends.items():
+        t0 = time.perf_counter()
+        store = build(backend, texts)
+        store.search('warmup', 1)  # flushes pending embeddings
+        build_s = time.perf_counter() - t0
+        row = {'build_s': round(build_s, 3)}
+        for kind, col in (('exact', 1), ('perturbed', 2)):
+            hits = 0
+            t0 = time.perf_counter()
+            for case in cases:
+                found = store.search(case[col], k)
+                hits += any(m['text'] is texts[case[0]] for m in found)
+            elapsed = time.perf_counter() - t0
+            row[f'recall_{kind}'] = round(hits / len(cases), 3)
+            row[f'ms_per_query_{kind}'] = round(elapsed / len(cases) * 1000, 3)
+        results[name] = row
+    return results
+
+
+def main():
+    ap = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    ap.add_argument('--sizes', type=int, nargs='+', default=[1000, 10000, 50000])
+    ap.add_argument('--queries', type=int, default=200)
+    ap.add_argument('-k', type=int, default=5)
+    ap.add_argument('--seed', type=int, default=7)
+    ap.add_argument('--json', help='write results to this file')
+    args = ap.parse_args()
+
+    report = {}
+    print(f"{'size':>8} {'backend':<11} {'recall exact':>12} {'recall pert.':>12} {'ms/q exact':>10} {'ms/q pert.':>10} {'build s':>8}")
+    for size in args.sizes:
+        report[size] = run(size, args.queries, args.k, args.seed)
+        for name, r in report[size].items():
+            print(f"{size:>8} {name:<11} {r['recall_exact']:>12} {r['recall_perturbed']:>12} "
+                  f"{r['ms_per_query_exact']:>10} {r['ms_per_query_perturbed']:>10} {r['build_s']:>8}")
+    if args.json:
+        with open(args.json, 'w') as f:
+            json.dump(report, f, indent=2)
+
+
+if __name__ == '__main__':
+    main()
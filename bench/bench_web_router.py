@@ -0,0 +1,185 @@
+"""Precision/recall and per-call latency of the web-need router.
+
+Scores the old substring heuristic, the word-boundary rules in web_router, and the
+rules plus the naive Bayes classifier (5-fold cross-validated on the labelled set,
+or trained on a memory.json-style log with --log) against hand-labelled messages
+of the kind Astral gets. A false positive costs a multi-second web search.
+
+    python bench/bench_web_router.py --log memory.json --json out.json
+"""
+import argparse
+import json
+import os
+import random
+import re
+import sys
+import time
+
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+
+from web_router import WebClassifier, WebRouter, examples_from_log  # noqa: E402
+
+YEAR = time.localtime().tm_year
+
+# (message, needs fresh web results)
+LABELLED = [
+    ('hi', False),
+    ('hello astral, how are you?', False),
+    ('I relapsed last night and I feel ashamed', False),
+    ('how do I stop craving cigarettes after meals', False),
+    ('I updated my journal with how I felt today', False),
+    ('today was hard, I almost gave in', False),
+    ('I have been sober since 2019', False),
+    ('my current streak is 40 days!', False),
+    ('I keep refreshing social media, I cannot stop', False),
+    ('what are some grounding techniques for anxiety', False),
+    ('can you help me with my math homework: solve 2x + 5 = 17', False),
+    ('explain recursion like I am five', False),
+    ('I feel overwhelmed by school and work', False),
+    ('how can I talk to my parents about my gaming addiction', False),
+    ('write a python function that reverses a string', False),
+    ('I was born in 2004 and I feel behind everyone', False),
+    ('I got an update from my therapist, she says I am improving', False),
+    ('tonight I want to stay off my phone, any tips?', False),
+    ('what is the difference between a list and a tuple in python', False),
+    ('is it normal to feel empty after quitting porn', False),
+    ('recently I have been sleeping badly', False),
+    ('I feel like I am releasing a lot of anger', False),
+    ('my new year resolution is to quit vaping', False),
+    ('help me plan a study schedule for exams', False),
+    ('what does it mean when I dream about using again', False),
+    ('I have 2000 reasons to quit', False),
+    ('how do I deal with a friend who pressures me to drink', False),
+    ('why do I procrastinate so much', False),
+    ('give me a calming breathing exercise', False),
+    ('I deleted tiktok today, feeling proud', False),
+    ('today I feel sad and current mood is low', False),
+    ('what is the current version of python', True),
+    ('latest news on fentanyl regulations', True),
+    (f'what happened in the {YEAR} election', True),
+    ('how to install pytorch on windows', True),
+    ('is numpy 2 compatible with pandas 1.5', True),
+    ('what changed in the newest react release', True),
+    ('any recent updates on the opioid settlement', True),
+    ('pip install fails with error: externally managed environment', True),
+    ('what is trending on github this week', True),
+    ('when was iOS 18 released', True),
+    (f'best laptops for programming in {YEAR}', True),
+    ('is the gpt api deprecated', True),
+    ('what is the latest version of node', True),
+    ('news about new addiction treatment drugs', True),
+    ('how do I install llama-cpp-python with cuda', True),
+    ('stackoverflow answer for cors error fastapi', True),
+    ('which npm package is best for dates now', True),
+    ('was the vaping ban announced yet', True),
+    ('current world chess champion', True),
+    (f'tax deadline {YEAR}', True),
+    ('what is in the latest fastapi changelog', True),
+    ('is tensorflow compatible with python 3.12', True),
+    ('recent research on gaming disorder treatment, any updates?', True),
+    ('who won the match today? any news?', True),
+    ('pypi package for parsing html quickly', True),
+]
+
+
+def legacy_should_use_web(text: str) -> bool:
+    """The substring heuristic the router replaced, kept verbatim for comparison."""
+    if not text:
+        return False
+    lower = text.lower()
+    triggers = ['latest', 'recent', 'current', 'news', 'update', 'updates', 'version', 'versions', 'released', 'release', 'announced', 'trend', 'trending', 'today']
+    for t in triggers:
+        if t in lower:
+            return True
+    if re.search(r'20\d{2}', text):
+        return True
+    tech_triggers = ['install', 'how to install', 'compatibl', 'compatibility', 'npm', 'pypi', 'github', 'stack overflow', 'stackoverflow']
+    for t in tech_triggers:
+        if t in lower:
+            return True
+    return False
+
+
+def score(decide, cases, repeat):
+    tp = fp = fn = tn = 0
+    for text, label in cases:
+        got = decide(text)
+        tp += got and label
+        fp += got and not label
+        fn += label and not got
+        tn += not got and not label
+    t0 = time.perf_counter()
+    for _ in range(repeat):
+        for text, _ in cases:
+            decide(text)
+    us = (time.perf_counter() - t0) / (repeat * len(cases)) * 1e6
+    return {
+        'precision': round(tp / (tp + fp), 3) if tp + fp else 0.0,
+        'recall': round(tp / (tp + fn), 3) if tp + fn else 0.0,
+        'false_positives': fp,
+        'false_negatives': fn,
+        'us_per_call': round(us, 2),
+    }
+
+
+def cross_validated(cases, folds, seed, repeat):
+    """Rules + classifier, each fold scored by a classifier trained on the other folds."""
+    rng = random.Random(seed)
+    shuffled = cases[:]
+    rng.shuffle(shuffled)
+    totals = {'tp': 0, 'fp': 0, 'fn': 0}
+    us = 0.0
+    for i in range(folds):
+        test = shuffled[i::folds]
+        train = [c for j, c in enumerate(shuffled) if j % folds != i]
+        router = WebRouter(WebClassifier.fit(train, min_count=1))
+        r = score(lambda t: router.route(t)['use_web'], test, repeat)
+        totals['fp'] += r['false_positives']
+        totals['fn'] += r['false_negatives']
+        totals['tp'] += sum(label for _, label in test) - r['false_negatives']
+        us += r['us_per_call'] / folds
+    tp, fp, fn = totals['tp'], totals['fp'], totals['fn']
+    return {
+        'precision': round(tp / (tp + fp), 3) if tp + fp else 0.0,
+        'recall': round(tp / (tp + fn), 3) if tp + fn else 0.0,
+        'false_positives': fp,
+        'false_negatives': fn,
+        'us_per_call': round(us, 2),
+    }
+
+
+def main():
+    ap = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    ap.add_argument('--log', help='memory.json-style log to train the classifier on (instead of cross-validation)')
+    ap.add_argument('--folds', type=int, default=5)
+    ap.add_argument('--repeat', type=int, default=200, help='timing passes over the labelled set')
+    ap.add_argument('--seed', type=int, default=7)
+    ap.add_argument('--json', help='write results to this file')
+    args = ap.parse_args()
+
+    rules = WebRouter()
+    report = {
+        'substring (old)': score(legacy_should_use_web, LABELLED, args.repeat),
+        'rules': score(lambda t: rules.route(t)['use_web'], LABELLED, args.repeat),
+    }
+    if args.log:
+        with open(args.log, encoding='utf-8') as f:
+            examples = examples_from_log(json.load(f))
+        router = WebRouter(WebClassifier.fit(examples))
+        report[f'rules+nb ({len(examples)} logged)'] = score(lambda t: router.route(t)['use_web'], LABELLED, args.repeat)
+    else:
+        report[f'rules+nb ({args.folds}-fold)'] = cross_validated(LABELLED, args.folds, args.seed, args.repeat)
+
+    positives = sum(label for _, label in LABELLED)
+    print(f'{len(LABELLED)} labelled messages, {positives} need the web')
+    print(f"{'router':<24} {'precision':>9} {'recall':>7} {'FP':>4} {'FN':>4} {'us/call':>8}")
+    for name, r in report.items():
+        print(f"{name:<24} {r['precision']:>9} {r['recall']:>7} {r['false_positives']:>4} {r['false_negatives']:>4} "
+              f"{r['us_per_call']:>8}")
+    if args.json:
+        with open(args.json, 'w') as f:
+            json.dump(report, f, indent=2)
+
+
+if __name__ == '__main__':
+    main()
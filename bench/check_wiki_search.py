@@ -0,0 +1,142 @@
+"""search.wiki_search against a local server replaying saved Wikipedia API responses.
+
+Serves bench/fixtures/wiki_search.json from a local w/api.php stand-in, points
+search.WIKI_API at it and checks that:
+
+  - when every page has an extract, one generator=search request is made;
+  - when a page has none, one more list=search request fills it from the snippet;
+  - results come back in search rank order, not in the pageid order of the payload.
+
+Exits non-zero if any check fails. The fixtures follow the API's JSON layout
+(pages keyed by pageid, `index` carrying the rank); --record replaces them with
+the live API's answers for the same queries.
+
+    python bench/check_wiki_search.py
+    python bench/check_wiki_search.py --record
+"""
+import argparse
+import asyncio
+import json
+import os
+import sys
+import threading
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import parse_qs, urlparse
+
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+
+import result_extract  # noqa: E402
+import search  # noqa: E402
+
+FIXTURES = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'fixtures', 'wiki_search.json')
+LIVE_API = 'https://en.wikipedia.org/w/api.php'
+
+
+def replay_server(fixtures: dict, calls: list) -> ThreadingHTTPServer:
+    """w/api.php stand-in answering from `fixtures`, keyed by search term; each query is logged to `calls`."""
+    by_term = {case['query']: case for case in fixtures.values()}
+
+    class Handler(BaseHTTPRequestHandler):
+        def do_GET(self):
+            q = {k: v[0] for k, v in parse_qs(urlparse(self.path).query).items()}
+            calls.append(q)
+            case = by_term.get(q.get('gsrsearch') or q.get('srsearch'), {})
+            payload = case.get('generator' if 'generator' in q else 'list' if 'list' in q else None)
+            body = json.dumps(payload if payload is not None else {'batchcomplete': ''}).encode('utf-8')
+            self.send_response(200)
+            self.send_header('Content-Type', 'application/json; charset=utf-8')
+            self.send_header('Content-Length', str(len(body)))
+            self.end_headers()
+            self.wfile.write(body)
+
+        def log_message(self, *args):
+            pass
+
+    server = ThreadingHTTPServer(('127.0.0.1', 0), Handler)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    return server
+
+
+def ranked(payload: dict) -> list:
+    pages = sorted(payload['query']['pages'].values(), key=lambda p: p['index'])
+    return [f"https://en.wikipedia.org/?curid={p['pageid']}" for p in pages]
+
+
+async def run_checks(fixtures: dict) -> list:
+    calls = []
+    server = replay_server(fixtures, calls)
+    search.WIKI_API = f'http://127.0.0.1:{server.server_port}/w/api.php'
+    failures = []
+
+    def check(ok: bool, what: str):
+        print(('ok    ' if ok else 'FAIL  ') + what)
+        if not ok:
+            failures.append(what)
+
+    try:
+        case = fixtures['complete']
+        del calls[:]
+        results = await search.wiki_search(case['query'], 3)
+        check([c.get('generator') or c.get('list') for c in calls] == ['search'],
+              'all extracts present: a single generator=search request')
+        check([r['url'] for r in results] == ranked(case['generator']), 'all extracts present: results in rank order')
+        check(all(r['text'] for r in results), 'all extracts present: every result has text')
+
+        case = fixtures['missing_extract']
+        del calls[:]
+        results = await search.wiki_search(case['query'], 3)
+        check([c.get('generator') or c.get('list') for c in calls] == ['search', 'search']
+              and 'generator' in calls[0] and calls[1].get('list') == 'search',
+              'missing extract: generator=search, then one list=search request')
+        check([r['url'] for r in results] == ranked(case['generator']), 'missing extract: results in rank order')
+        missing = [p['pageid'] for p in case['generator']['query']['pages'].values() if not p.get('extract')]
+        snippets = {h['pageid']: result_extract.strip_tags(h['snippet']) for h in case['list']['query']['search']}
+        by_url = {r['url']: r['text'] for r in results}
+        check(all(by_url.get(f'https://en.wikipedia.org/?curid={pid}') == snippets[pid] for pid in missing),
+              'missing extract: filled from the search snippet, tags stripped')
+
+        del calls[:]
+        await search.wiki_search(case['query'], 3)
+        check(not calls, 'repeat query: served from the web cache')
+    finally:
+        server.shutdown()
+        await search.outbound.aclose()
+    return failures
+
+
+async def record(fixtures: dict):
+    """Re-fetch every fixture payload from the live API with the parameters wiki_search sends."""
+    import httpx
+    async with httpx.AsyncClient(timeout=15, headers={'User-Agent': 'astral-fixture-recorder'}) as client:
+        for case in fixtures.values():
+            r = await client.get(LIVE_API, params={
+                'action': 'query', 'generator': 'search', 'gsrsearch': case['query'], 'gsrlimit': 3,
+                'prop': 'extracts', 'exintro': 1, 'explaintext': 1, 'exchars': 2000, 'exlimit': 3, 'format': 'json'})
+            case['generator'] = r.json()
+            if 'list' in case:
+                r = await client.get(LIVE_API, params={'action': 'query', 'list': 'search', 'srsearch': case['query'],
+                                                       'format': 'json', 'srlimit': 3})
+                case['list'] = r.json()
+    with open(FIXTURES, 'w', encoding='utf-8') as f:
+        json.dump(fixtures, f, indent=2, ensure_ascii=False)
+        f.write('\n')
+    print(f'recorded {len(fixtures)} cases -> {FIXTURES}')
+
+
+def main():
+    ap = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    ap.add_argument('--record', action='store_true', help='refresh the fixtures from the live API')
+    args = ap.parse_args()
+
+    with open(FIXTURES, encoding='utf-8') as f:
+        fixtures = json.load(f)
+    if args.record:
+        asyncio.run(record(fixtures))
+        return
+    failures = asyncio.run(run_checks(fixtures))
+    if failures:
+        sys.exit(f'{len(failures)} check(s) failed')
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,78 @@
+import hashlib
+import json
+import threading
+import time
+from collections import OrderedDict
+from typing import Optional
+
+from web_cache import normalize_query
+
+POLICIES = ('off', 'exact', 'normalized')
+
+
+class CompletionCache:
+    """TTL + LRU cache of model replies, keyed by a hash of the full request.
+
+    policy 'exact' keys on the assembled messages, model and sampling params, so a
+    hit means the upstream call would have seen byte-identical input. 'normalized'
+    additionally lets requests that carry no memory or web context match on their
+    normalized user text (so "Hi", "hi " and "hi!" share one entry). 'off' disables it.
+    """
+
+    def __init__(self, policy: str = 'exact', max_entries: int = 1000, ttl: float = 3600.0):
+        if policy not in POLICIES:
+            raise ValueError(f"completion cache policy must be one of {POLICIES}, got {policy!r}")
+        self.policy = policy
+        self.max_entries = max_entries
+        self.ttl = ttl
+        self._entries = OrderedDict()  # key -> (expires_at, reply)
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+
+    @staticmethod
+    def _digest(payload) -> str:
+        return hashlib.sha256(json.dumps(payload, sort_keys=True, ensure_ascii=False).encode('utf-8')).hexdigest()
+
+    def key_for(self, messages: list, model: str, params: dict, has_context: bool, user_text: str) -> Optional[str]:
+        """Cache key for a request, or None when caching doesn't apply."""
+        if self.policy == 'off':
+            return None
+        if self.policy == 'normalized' and not has_context:
+            system = [m['content'] for m in messages if m.get('role') == 'system']
+            return 'n:' + self._digest({'model': model, 'params': params, 'system': system,
+                                        'text': normalize_query(user_text)})
+        return 'e:' + self._digest({'model': model, 'params': params, 'messages': messages})
+
+    def get(self, key: Optional[str]) -> Optional[str]:
+        if key is None:
+            return None
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None or entry[0] < time.time():
+                if entry is not None:
+                    del self._entries[key]
+                self.misses += 1
+                return None
+            self._entries.move_to_end(key)
+            self.hits += 1
+            return entry[1]
+
+    def set(self, key: Optional[str], reply: str):
+        if key is None or not reply:
+            return
+        with self._lock:
+            self._entries[key] = (time.time() + self.ttl, reply)
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+
+    def stats(self) -> dict:
+        lookups = self.hits + self.misses
+        return {
+            'policy': self.policy,
+            'entries': len(self._entries),
+            'hits': self.hits,
+            'misses': self.misses,
+            'hit_ratio': round(self.hits / lookups, 3) if lookups else None,
+        }
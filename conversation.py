@@ -0,0 +1,153 @@
+import asyncio
+import logging
+import threading
+import time
+from collections import OrderedDict, deque
+from typing import Awaitable, Callable, Hashable, List, Optional
+
+from prompt_assembler import TokenCounter, truncate_at_sentence
+
+# summarizer(previous_summary, turns) -> new summary; turns are {'role', 'content'} dicts
+Summarizer = Callable[[str, List[dict]], Awaitable[str]]
+
+log = logging.getLogger('astral.conversation')
+
+
+class Conversation:
+    """One chat's state: recent turns verbatim plus a summary of everything older."""
+
+    __slots__ = ('turns', 'summary', 'summarized_turns', 'folding', 'last_used')
+
+    def __init__(self):
+        self.turns = deque()        # {'role', 'content', 'tokens'}, oldest first
+        self.summary = ''
+        self.summarized_turns = 0   # how many turns the summary covers
+        self.folding = False        # a background summary update is running
+        self.last_used = time.monotonic()
+
+
+class ConversationStore:
+    """Server-side multi-turn state, keyed by whatever identifies one user's chat.
+
+    Keys must not be guessable from the client alone: the server keys by
+    (session id, chat id), never by a bare client chat id.
+
+    `window` returns what a new turn should see: the running summary and the last
+    `keep_turns` turns verbatim, further capped at `history_tokens`. Once more than
+    `keep_turns + fold_every` turns are held, the oldest ones beyond the window are
+    folded into the summary by `summarizer` in a background task, so the prompt stays
+    bounded however long the chat runs. If summarizing keeps failing, turns beyond
+    `max_pending` are dropped rather than letting the chat grow without limit.
+    """
+
+    def __init__(self, summarizer: Optional[Summarizer] = None, counter: Optional[TokenCounter] = None,
+                 keep_turns: int = 8, fold_every: int = 4, history_tokens: int = 1500,
+                 summary_tokens: int = 300, max_pending: int = 64, max_conversations: int = 5000):
+        self.summarizer = summarizer
+        self.counter = counter or TokenCounter()
+        self.keep_turns = keep_turns
+        self.fold_every = fold_every
+        self.history_tokens = history_tokens
+        self.summary_tokens = summary_tokens
+        self.max_pending = max_pending
+        self.max_conversations = max_conversations
+        self._chats = OrderedDict()  # key -> Conversation, least recently used first
+        self._lock = threading.Lock()
+        self._tasks = set()
+        self.folds = 0
+        self.fold_errors = 0
+        self.dropped_turns = 0
+
+    def get(self, key: Hashable, create: bool = True) -> Optional[Conversation]:
+        with self._lock:
+            conv = self._chats.get(key)
+            if conv is None:
+                if not create:
+                    return None
+                conv = self._chats[key] = Conversation()
+                while len(self._chats) > self.max_conversations:
+                    self._chats.popitem(last=False)
+            self._chats.move_to_end(key)
+            conv.last_used = time.monotonic()
+            return conv
+
+    def window(self, key: Optional[Hashable]) -> dict:
+        """{'summary', 'turns', 'tokens'} to put in front of the next user message."""
+        conv = self.get(key, create=False) if key else None
+        if conv is None:
+            return {'summary': '', 'turns': [], 'tokens': 0}
+        with self._lock:
+            recent = list(conv.turns)[-self.keep_turns:]
+            summary = conv.summary
+        tokens = self.counter.count(summary)
+        turns = []
+        # newest first, so the turns closest to the question survive the cap
+        for turn in reversed(recent):
+            if tokens + turn['tokens'] > self.history_tokens:
+                break
+            tokens += turn['tokens']
+            turns.append({'role': turn['role'], 'content': turn['content']})
+        turns.reverse()
+        return {'summary': summary, 'turns': turns, 'tokens': tokens}
+
+    def record(self, key: Optional[Hashable], user_text: str, reply: str):
+        """Append a completed exchange; may schedule a background summary update."""
+        if not key:
+            return
+        conv = self.get(key)
+        with self._lock:
+            for role, content in (('user', user_text), ('assistant', reply)):
+                conv.turns.append({'role': role, 'content': content, 'tokens': self.counter.count(content) + 4})
+            while len(conv.turns) > self.max_pending:
+                conv.turns.popleft()
+                self.dropped_turns += 1
+            fold = (self.summarizer is not None and not conv.folding
+                    and len(conv.turns) > self.keep_turns + self.fold_every)
+            if fold:
+                conv.folding = True
+        if fold:
+            task = asyncio.get_running_loop().create_task(self._fold(conv))
+            self._tasks.add(task)
+            task.add_done_callback(self._tasks.discard)
+
+    async def _fold(self, conv: Conversation):
+        try:
+            with self._lock:
+                older = list(conv.turns)[:len(conv.turns) - self.keep_turns]
+                previous = conv.summary
+            try:
+                summary = await self.summarizer(previous, [{'role': t['role'], 'content': t['content']} for t in older])
+            except Exception as e:
+                self.fold_errors += 1
+                log.warning('conversation summary failed: %s', e)
+                return
+            summary = truncate_at_sentence(self.counter, (summary or '').strip(), self.summary_tokens)
+            with self._lock:
+                # turns may have been dropped meanwhile; only remove the folded ones still present
+                for turn in older:
+                    if conv.turns and conv.turns[0] is turn:
+                        conv.turns.popleft()
+                conv.summary = summary
+                conv.summarized_turns += len(older)
+            self.folds += 1
+        finally:
+            conv.folding = False
+
+    def forget(self, key: Hashable):
+        with self._lock:
+            self._chats.pop(key, None)
+
+    def stats(self) -> dict:
+        return {
+            'conversations': len(self._chats),
+            'folds': self.folds,
+            'fold_errors': self.fold_errors,
+            'dropped_turns': self.dropped_turns,
+            'folds_in_flight': len(self._tasks),
+        }
+
+    async def aclose(self):
+        tasks = list(self._tasks)
+        for task in tasks:
+            task.cancel()
+        await asyncio.gather(*tasks, return_exceptions=True)
@@ -0,0 +1,68 @@
+import asyncio
+import contextvars
+import time
+from contextlib import contextmanager
+from typing import Optional
+
+_current = contextvars.ContextVar('request_deadline', default=None)
+
+
+class DeadlineExceeded(asyncio.TimeoutError):
+    """The request's deadline passed before a stage could start or finish."""
+
+
+class Deadline:
+    __slots__ = ('expires_at',)
+
+    def __init__(self, seconds: float):
+        self.expires_at = time.monotonic() + seconds
+
+    def remaining(self) -> float:
+        return max(0.0, self.expires_at - time.monotonic())
+
+    def budget(self, cap: Optional[float] = None, reserve: float = 0.0) -> float:
+        """Seconds a stage may take: what is left minus `reserve` for later stages, at most `cap`.
+        Raises DeadlineExceeded when nothing is left."""
+        left = self.remaining() - reserve
+        if left <= 0:
+            raise DeadlineExceeded()
+        return left if cap is None else min(cap, left)
+
+
+def current() -> Optional[Deadline]:
+    return _current.get()
+
+
+@contextmanager
+def scope(seconds: float):
+    """Run the enclosed code (and tasks and threads started from it) under a deadline.
+    A nested scope can only shrink the deadline it is nested in."""
+    d = Deadline(seconds)
+    parent = _current.get()
+    if parent is not None and parent.expires_at < d.expires_at:
+        d = parent
+    token = _current.set(d)
+    try:
+        yield d
+    finally:
+        _current.reset(token)
+
+
+def budget(cap: Optional[float] = None, reserve: float = 0.0) -> Optional[float]:
+    """Like Deadline.budget for the current deadline; just `cap` when no deadline is set."""
+    d = _current.get()
+    return cap if d is None else d.budget(cap, reserve)
+
+
+async def within(aw, cap: Optional[float] = None, reserve: float = 0.0):
+    """Await `aw`, giving up with DeadlineExceeded once its share of the deadline is used."""
+    try:
+        timeout = budget(cap, reserve)
+    except DeadlineExceeded:
+        if asyncio.iscoroutine(aw):
+            aw.close()
+        raise
+    try:
+        return await asyncio.wait_for(aw, timeout)
+    except asyncio.TimeoutError:
+        raise DeadlineExceeded() from None
@@ -0,0 +1,129 @@
+import os
+from typing import Dict, Optional
+from urllib.parse import urlsplit
+
+import httpx
+
+import deadlines
+
+try:
+    import h2  # noqa: F401  (httpx only speaks HTTP/2 when h2 is installed)
+    HTTP2_AVAILABLE = True
+except ImportError:
+    HTTP2_AVAILABLE = False
+
+USER_AGENT = 'Mozilla/5.0'
+
+# Pool sizing is per upstream host; override through the environment on Render
+POOL_MAX_CONNECTIONS = int(os.environ.get('HTTP_POOL_MAX_CONNECTIONS', 50))
+POOL_MAX_KEEPALIVE = int(os.environ.get('HTTP_POOL_MAX_KEEPALIVE', 20))
+POOL_KEEPALIVE_EXPIRY = float(os.environ.get('HTTP_POOL_KEEPALIVE_EXPIRY', 60))
+DEFAULT_TIMEOUT = float(os.environ.get('HTTP_DEFAULT_TIMEOUT', 10))
+
+
+class HostStats:
+    __slots__ = ('requests', 'errors', 'in_flight', 'connections_opened', 'tls_handshakes')
+
+    def __init__(self):
+        self.requests = 0
+        self.errors = 0
+        self.in_flight = 0
+        self.connections_opened = 0
+        self.tls_handshakes = 0
+
+    def as_dict(self) -> dict:
+        d = {name: getattr(self, name) for name in self.__slots__}
+        # share of requests that reused an already-open connection
+        d['reuse_ratio'] = round(1 - self.connections_opened / self.requests, 3) if self.requests else None
+        return d
+
+
+class OutboundHTTP:
+    """Process-wide outbound HTTP layer: one keep-alive pool (httpx.AsyncClient) per host.
+
+    Every search provider goes through `request`, so repeated calls to the same host
+    reuse warm TCP/TLS connections (multiplexed over HTTP/2 when h2 is installed).
+    Default headers and timeouts are shared, timeouts are cut to the current request
+    deadline (see deadlines.py), and per-host counters are kept.
+    """
+
+    def __init__(self, max_connections: int = POOL_MAX_CONNECTIONS, max_keepalive: int = POOL_MAX_KEEPALIVE,
+                 keepalive_expiry: float = POOL_KEEPALIVE_EXPIRY, timeout: float = DEFAULT_TIMEOUT,
+                 http2: Optional[bool] = None, headers: Optional[dict] = None):
+        self.limits = httpx.Limits(max_connections=max_connections, max_keepalive_connections=max_keepalive,
+                                   keepalive_expiry=keepalive_expiry)
+        self.timeout = timeout
+        self.http2 = HTTP2_AVAILABLE if http2 is None else (http2 and HTTP2_AVAILABLE)
+        self.headers = {'User-Agent': USER_AGENT, **(headers or {})}
+        self._clients: Dict[str, httpx.AsyncClient] = {}
+        self._stats: Dict[str, HostStats] = {}
+
+    def _client_for(self, host: str) -> httpx.AsyncClient:
+        client = self._clients.get(host)
+        if client is None:
+            client = httpx.AsyncClient(headers=self.headers, timeout=self.timeout, limits=self.limits,
+                                       http2=self.http2, follow_redirects=True)
+            self._clients[host] = client
+            self._stats[host] = HostStats()
+        return client
+
+    async def request(self, method: str, url: str, **kwargs) -> httpx.Response:
+        host = urlsplit(url).netloc
+        client = self._client_for(host)
+        stats = self._stats[host]
+
+        async def trace(event: str, info: dict):
+            if event == 'connection.connect_tcp.complete':
+                stats.connections_opened += 1
+            elif event == 'connection.start_tls.complete':
+                stats.tls_handshakes += 1
+
+        # never wait past the request's deadline, whatever timeout the caller asked for
+        timeout = kwargs.get('timeout', self.timeout)
+        clamped = False
+        if isinstance(timeout, (int, float)):
+            kwargs['timeout'] = deadlines.budget(timeout)
+            clamped = kwargs['timeout'] < timeout
+
+        extensions = kwargs.pop('extensions', None) or {}
+        extensions.setdefault('trace', trace)
+        stats.requests += 1
+        stats.in_flight += 1
+        try:
+            return await client.request(method, url, extensions=extensions, **kwargs)
+        except httpx.TimeoutException:
+            stats.errors += 1
+            if clamped:
+                raise deadlines.DeadlineExceeded() from None  # the request's budget ran out, not the host's timeout
+            raise
+        except Exception:
+            stats.errors += 1
+            raise
+        finally:
+            stats.in_flight -= 1
+
+    async def get(self, url: str, **kwargs) -> httpx.Response:
+        return await self.request('GET', url, **kwargs)
+
+    async def post(self, url: str, **kwargs) -> httpx.Response:
+        return await self.request('POST', url, **kwargs)
+
+    async def head(self, url: str, **kwargs) -> httpx.Response:
+        return await self.request('HEAD', url, **kwargs)
+
+    def stats(self) -> dict:
+        return {
+            'http2': self.http2,
+            'max_connections_per_host': self.limits.max_connections,
+            'max_keepalive_per_host': self.limits.max_keepalive_connections,
+            'hosts': {host: s.as_dict() for host, s in self._stats.items()},
+        }
+
+    async def aclose(self):
+        clients, self._clients = self._clients, {}
+        for client in clients.values():
+            await client.aclose()
+
+
+# Shared by every outbound call in the process
+outbound = OutboundHTTP()
@@ -0,0 +1,345 @@
+import asyncio
+import hashlib
+import logging
+import os
+import threading
+import time
+from typing import AsyncIterator, List, Optional
+
+import tracing
+
+# Every backend takes OpenAI-style chat messages and the sampling params built by
+# Server.build_messages (max_tokens, temperature, top_p, stop).
+#
+#   complete(messages, **params)        -> {'text', 'finish_reason', 'usage'}
+#   await acomplete(messages, **params) -> same
+#   astream(messages, **params)         -> async iterator of {'text', 'finish_reason', 'usage'}
+#
+# In a stream, 'text' is the next piece of the reply. 'finish_reason' and 'usage'
+# are None until the chunk that carries them. Closing the iterator early
+# (`await stream.aclose()`) releases the upstream request.
+
+BACKENDS = ('groq', 'llama_cpp', 'fake')
+
+log = logging.getLogger('astral.llm')
+
+
+def _chunk(text: str = '', finish_reason: Optional[str] = None, usage: Optional[dict] = None) -> dict:
+    return {'text': text, 'finish_reason': finish_reason, 'usage': usage}
+
+
+class LLMBackend:
+    name = 'base'
+    model = ''
+
+    def complete(self, messages: List[dict], **params) -> dict:
+        raise NotImplementedError
+
+    async def acomplete(self, messages: List[dict], **params) -> dict:
+        return await asyncio.to_thread(self.complete, messages, **params)
+
+    async def astream(self, messages: List[dict], **params) -> AsyncIterator[dict]:
+        result = await self.acomplete(messages, **params)
+        yield _chunk(result['text'], result['finish_reason'], result['usage'])
+
+    def check(self):
+        """Raise if the backend cannot serve requests (missing credentials, missing model file)."""
+
+    async def warmup(self):
+        """Do the first-use work (clients, connections, model load) ahead of the first request."""
+
+    async def aclose(self):
+        pass
+
+
+class GroqBackend(LLMBackend):
+    """Hosted inference through the Groq API (the production default).
+
+    The groq package is imported and the client built on first use, keeping both off
+    the import path of a cold start; a missing key is reported by check() (/readyz)
+    and by the first request rather than by a crash at import.
+    """
+
+    name = 'groq'
+
+    def __init__(self, api_key: Optional[str] = None, model: str = 'llama-3.3-70b-versatile'):
+        self.api_key = api_key or os.environ.get('GROQ_API_KEY')
+        self.model = model
+        self._client = None
+        self._sync_client = None
+
+    def check(self):
+        if not self.api_key:
+            raise ValueError("GROQ_API_KEY environment variable is required")
+
+    @property
+    def client(self):
+        if self._client is None:
+            self.check()
+            from groq import AsyncGroq
+            self._client = AsyncGroq(api_key=self.api_key)
+        return self._client
+
+    async def warmup(self):
+        # a cheap authenticated call opens (and keeps) the TLS connection to the API
+        await self.client.models.list()
+
+    @staticmethod
+    def _result(response) -> dict:
+        choice = response.choices[0]
+        usage = response.usage.model_dump() if getattr(response, 'usage', None) is not None else None
+        return {'text': choice.message.content or '', 'finish_reason': choice.finish_reason, 'usage': usage}
+
+    def complete(self, messages: List[dict], **params) -> dict:
+        if self._sync_client is None:
+            self.check()
+            from groq import Groq
+            self._sync_client = Groq(api_key=self.api_key)
+        return self._result(self._sync_client.chat.completions.create(model=self.model, messages=messages, **params))
+
+    async def acomplete(self, messages: List[dict], **params) -> dict:
+        return self._result(await self.client.chat.completions.create(model=self.model, messages=messages, **params))
+
+    async def astream(self, messages: List[dict], **params) -> AsyncIterator[dict]:
+        stream = await self.client.chat.completions.create(model=self.model, messages=messages, stream=True, **params)
+        try:
+            async for chunk in stream:
+                usage = None
+                if chunk.x_groq is not None and chunk.x_groq.usage is not None:
+                    usage = chunk.x_groq.usage.model_dump()
+                if not chunk.choices:
+                    if usage is not None:
+                        yield _chunk(usage=usage)
+                    continue
+                choice = chunk.choices[0]
+                yield _chunk(choice.delta.content or '', choice.finish_reason, usage)
+        finally:
+            await stream.close()
+
+    async def aclose(self):
+        if self._client is not None:
+            await self._client.close()
+
+
+class LlamaCppBackend(LLMBackend):
+    """Local inference on a GGUF model through llama-cpp-python.
+
+    The model is loaded on first use. llama.cpp contexts are not thread-safe, so
+    generations run one at a time in a worker thread and do not block the event loop.
+    """
+
+    name = 'llama_cpp'
+
+    def __init__(self, model_path: str, n_ctx: int = 4096, n_threads: Optional[int] = None,
+                 chat_format: Optional[str] = None):
+        self.model_path = model_path
+        self.model = os.path.basename(model_path)
+        self.n_ctx = n_ctx
+        self.n_threads = n_threads
+        self.chat_format = chat_format
+        self._llm = None
+        self._lock = threading.Lock()
+
+    @property
+    def llm(self):
+        if self._llm is None:
+            from llama_cpp import Llama
+            self._llm = Llama(model_path=self.model_path, n_ctx=self.n_ctx, n_threads=self.n_threads,
+                              chat_format=self.chat_format, verbose=False)
+        return self._llm
+
+    def check(self):
+        if not os.path.exists(self.model_path):
+            raise FileNotFoundError(f"LLAMA_MODEL_PATH {self.model_path!r} does not exist")
+
+    async def warmup(self):
+        def load():
+            with self._lock:
+                return self.llm
+        await asyncio.to_thread(load)
+
+    def complete(self, messages: List[dict], **params) -> dict:
+        with self._lock:
+            response = self.llm.create_chat_completion(messages=messages, **params)
+        choice = response['choices'][0]
+        return {'text': choice['message'].get('content') or '', 'finish_reason': choice.get('finish_reason'),
+                'usage': response.get('usage')}
+
+    async def astream(self, messages: List[dict], **params) -> AsyncIterator[dict]:
+        loop = asyncio.get_running_loop()
+        queue = asyncio.Queue()
+        stop = threading.Event()
+        done = object()
+
+        def produce():
+            try:
+                with self._lock:
+                    for chunk in self.llm.create_chat_completion(messages=messages, stream=True, **params):
+                        if stop.is_set():
+                            break
+                        choice = chunk['choices'][0]
+                        item = _chunk(choice['delta'].get('content') or '', choice.get('finish_reason'))
+                        loop.call_soon_threadsafe(queue.put_nowait, item)
+            except Exception as e:
+                loop.call_soon_threadsafe(queue.put_nowait, e)
+            finally:
+                loop.call_soon_threadsafe(queue.put_nowait, done)
+
+        worker = loop.run_in_executor(None, produce)
+        try:
+            while True:
+                item = await queue.get()
+                if item is done:
+                    break
+                if isinstance(item, Exception):
+                    raise item
+                yield item
+        finally:
+            # tell the worker to stop generating if the consumer went away early
+            stop.set()
+            await asyncio.shield(worker)
+
+
+class FakeBackend(LLMBackend):
+    """Deterministic stand-in for benchmarks, load tests and offline development.
+
+    The reply depends only on the last user message, so runs are reproducible.
+    `latency` is the time to first token and `token_delay` the gap between tokens.
+    """
+
+    name = 'fake'
+
+    def __init__(self, latency: float = 0.05, token_delay: float = 0.0, reply_words: int = 40):
+        self.model = 'fake'
+        self.latency = latency
+        self.token_delay = token_delay
+        self.reply_words = reply_words
+
+    def _reply(self, messages: List[dict], max_tokens: Optional[int] = None) -> List[str]:
+        user = next((m['content'] for m in reversed(messages) if m.get('role') == 'user'), '')
+        seed = hashlib.sha256(user.encode('utf-8')).hexdigest()
+        n = min(self.reply_words, max_tokens or self.reply_words)
+        return [seed[(i * 7) % 58:(i * 7) % 58 + 6] for i in range(n)]
+
+    def _usage(self, messages: List[dict], words: List[str]) -> dict:
+        prompt = sum(len(m.get('content') or '') for m in messages) // 4
+        return {'prompt_tokens': prompt, 'completion_tokens': len(words), 'total_tokens': prompt + len(words)}
+
+    def _finish(self, max_tokens: Optional[int]) -> str:
+        return 'length' if max_tokens is not None and max_tokens < self.reply_words else 'stop'
+
+    def complete(self, messages: List[dict], max_tokens: Optional[int] = None, **params) -> dict:
+        words = self._reply(messages, max_tokens)
+        time.sleep(self.latency + self.token_delay * len(words))
+        return {'text': ' '.join(words), 'finish_reason': self._finish(max_tokens),
+                'usage': self._usage(messages, words)}
+
+    async def acomplete(self, messages: List[dict], max_tokens: Optional[int] = None, **params) -> dict:
+        words = self._reply(messages, max_tokens)
+        await asyncio.sleep(self.latency + self.token_delay * len(words))
+        return {'text': ' '.join(words), 'finish_reason': self._finish(max_tokens),
+                'usage': self._usage(messages, words)}
+
+    async def astream(self, messages: List[dict], max_tokens: Optional[int] = None, **params) -> AsyncIterator[dict]:
+        words = self._reply(messages, max_tokens)
+        await asyncio.sleep(self.latency)
+        for i, word in enumerate(words):
+            if i and self.token_delay:
+                await asyncio.sleep(self.token_delay)
+            yield _chunk(word if i == 0 else ' ' + word)
+        yield _chunk(finish_reason=self._finish(max_tokens), usage=self._usage(messages, words))
+
+
+class FailoverBackend(LLMBackend):
+    """Uses `primary`, switching to `fallback` for any call where the primary fails
+    before producing output (e.g. Groq unreachable -> local llama.cpp)."""
+
+    name = 'failover'
+
+    def __init__(self, primary: LLMBackend, fallback: LLMBackend):
+        self.primary = primary
+        self.fallback = fallback
+        self.model = primary.model
+        self.failovers = 0
+
+    def _failed_over(self, e: Exception):
+        self.failovers += 1
+        tracing.current_span().event('llm_failover', failed=self.primary.name, error=str(e), using=self.fallback.name)
+        log.warning('LLM backend %s failed, using %s: %s', self.primary.name, self.fallback.name, e)
+
+    def complete(self, messages: List[dict], **params) -> dict:
+        try:
+            return self.primary.complete(messages, **params)
+        except Exception as e:
+            self._failed_over(e)
+            return self.fallback.complete(messages, **params)
+
+    async def acomplete(self, messages: List[dict], **params) -> dict:
+        try:
+            return await self.primary.acomplete(messages, **params)
+        except Exception as e:
+            self._failed_over(e)
+            return await self.fallback.acomplete(messages, **params)
+
+    async def astream(self, messages: List[dict], **params) -> AsyncIterator[dict]:
+        stream = self.primary.astream(messages, **params)
+        try:
+            first = await stream.__anext__()
+        except StopAsyncIteration:
+            return
+        except Exception as e:
+            self._failed_over(e)
+            await stream.aclose()
+            stream, first = self.fallback.astream(messages, **params), None
+        try:
+            if first is not None:
+                yield first
+            async for chunk in stream:
+                yield chunk
+        finally:
+            await stream.aclose()
+
+    def check(self):
+        # serviceable while either side is
+        try:
+            self.primary.check()
+        except Exception:
+            self.fallback.check()
+
+    async def warmup(self):
+        results = await asyncio.gather(self.primary.warmup(), self.fallback.warmup(), return_exceptions=True)
+        for result in results:
+            if isinstance(result, Exception):
+                raise result
+
+    async def aclose(self):
+        await self.primary.aclose()
+        await self.fallback.aclose()
+
+
+def make_backend(name: str, model: Optional[str] = None) -> LLMBackend:
+    """Build a backend from its name and LLM_* / GROQ_* environment settings."""
+    if name == 'groq':
+        return GroqBackend(model=model or os.environ.get('GROQ_MODEL', 'llama-3.3-70b-versatile'))
+    if name == 'llama_cpp':
+        path = os.environ.get('LLAMA_MODEL_PATH')
+        if not path:
+            raise ValueError("LLAMA_MODEL_PATH environment variable is required for the llama_cpp backend")
+        threads = os.environ.get('LLAMA_N_THREADS')
+        return LlamaCppBackend(path, n_ctx=int(os.environ.get('LLAMA_N_CTX', 4096)),
+                               n_threads=int(threads) if threads else None,
+                               chat_format=os.environ.get('LLAMA_CHAT_FORMAT'))
+    if name == 'fake':
+        return FakeBackend(latency=float(os.environ.get('FAKE_LLM_LATENCY', 0.05)),
+                           token_delay=float(os.environ.get('FAKE_LLM_TOKEN_DELAY', 0.0)),
+                           reply_words=int(os.environ.get('FAKE_LLM_REPLY_WORDS', 40)))
+    raise ValueError(f"LLM backend must be one of {BACKENDS}, got {name!r}")
+
+
+def backend_from_env(model: Optional[str] = None) -> LLMBackend:
+    """LLM_BACKEND picks the backend (default groq); LLM_FALLBACK optionally names a second one."""
+    backend = make_backend(os.environ.get('LLM_BACKEND', 'groq'), model)
+    fallback = os.environ.get('LLM_FALLBACK')
+    if fallback:
+        backend = FailoverBackend(backend, make_backend(fallback, model))
+    return backend
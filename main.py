@@ -1,15 +1,16 @@
-from fastapi import FastAPI
+from fastapi import FastAPI, Response
 from fastapi.middleware.cors import CORSMiddleware
 from pydantic import BaseModel
 import requests
-from bs4 import BeautifulSoup
+import atexit
 import os
-import json
 from typing import Optional, List
 from datetime import datetime
 import multiprocessing
-from groq import Groq
 from mangum import Mangum  # WSGI/ASGI handler for PythonAnywhere
+import metrics
+from memory_journal import JournalStore
+from result_extract import strip_tags
 
 # -------------------------------
 # CONFIGURATION
@@ -42,11 +43,18 @@ CPU_THREADS = 1  # reduce for PythonAnywhere free
 REPLY_MAX_TOKENS = 512
 MODEL_NAME = "llama-3.3-70b-versatile"
 
-# Load Groq API key
-with open(API_KEY_PATH, 'r') as f:
-    api_key = f.read().strip()
+_client = None
 
-client = Groq(api_key=api_key)
+
+def groq_client():
+    """Groq client, built on the first chat request so a cold start skips the groq import
+    and a missing key file fails that request instead of the whole app at import."""
+    global _client
+    if _client is None:
+        from groq import Groq
+        with open(API_KEY_PATH, 'r') as f:
+            _client = Groq(api_key=f.read().strip())
+    return _client
 
 # -------------------------------
 # SYSTEM PROMPT
@@ -208,12 +216,23 @@ class MemoryItem(BaseModel):
 # MEMORY FUNCTIONS
 # -------------------------------
 
+# Snapshot + append-only journal: appends are one line each, reads hit the in-process index.
+# Appends only queue the write; a background thread batches them into the journal, and
+# whatever is still queued is written when the worker exits.
+_store = JournalStore(MEMORY_PATH)
+atexit.register(_store.close)
+
+metrics.REGISTRY.callback('astral_memory_write_queue', 'Memories accepted but not yet written to disk.', 'gauge',
+                          lambda: [({}, _store.queue_depth)])
+metrics.REGISTRY.callback('astral_memory_writes_total', 'Memories written to the journal, and the batches they went in.',
+                          'counter', lambda: [({'kind': 'memories'}, _store.flushed), ({'kind': 'batches'}, _store.flushes)])
+metrics.REGISTRY.callback('astral_memory_write_backpressure_total', 'Appends that found the write queue full.',
+                          'counter', lambda: [({}, _store.backpressured)])
+metrics.REGISTRY.callback('astral_memory_write_errors_total', 'Failed journal writes (the batch is retried).',
+                          'counter', lambda: [({}, _store.flush_errors)])
+
 def load_memories() -> List[dict]:
-    try:
-        with open(MEMORY_PATH, 'r', encoding='utf-8') as f:
-            return json.load(f)
-    except Exception:
-        return []
+    return _store.items()
 
 def append_memory(role: str, text: str):
     item = {
@@ -221,29 +240,18 @@ def append_memory(role: str, text: str):
         'text': text,
         'ts': datetime.utcnow().isoformat()
     }
-    mems = load_memories()
-    mems.append(item)
     try:
-        with open(MEMORY_PATH, 'w', encoding='utf-8') as f:
-            json.dump(mems, f, ensure_ascii=False, indent=2)
+        _store.append(item)
     except Exception:
         pass
 
 def retrieve_relevant_memories(query: str, limit: int = 5):
     if not query:
-        return load_memories()[-limit:]
-    qwords = set([w for w in ''.join([c.lower() if c.isalnum() else ' ' for c in query]).split() if len(w) > 2])
-    mems = load_memories()
-    scored = []
-    for m in mems:
-        mwords = set([w for w in ''.join([c.lower() if c.isalnum() else ' ' for c in m.get('text','')]).split() if len(w) > 2])
-        score = len(qwords & mwords)
-        scored.append((score, m))
-    scored.sort(key=lambda x: x[0], reverse=True)
-    results = [m for s, m in scored if s > 0]
+        return _store.recent(limit)
+    results = _store.search(query, limit)
     if not results:
-        return mems[-limit:]
-    return results[:limit]
+        return _store.recent(limit)
+    return results
 
 # -------------------------------
 # INTERNET / WIKI FUNCTIONS
@@ -277,7 +285,7 @@ def wiki_search(query: str, max_results: int = 3):
                 extract = ''
             if not extract:
                 snippet = item.get('snippet', '')
-                extract = BeautifulSoup(snippet, 'html.parser').get_text()
+                extract = strip_tags(snippet)
             url = f'https://en.wikipedia.org/?curid={pageid}'
             out.append({'url': url, 'text': extract})
     except Exception:
@@ -329,7 +337,7 @@ def chat(msg: Message):
     requested = REPLY_MAX_TOKENS if web_findings else 200
     reply_max = max(20, requested)
 
-    response = client.chat.completions.create(
+    response = groq_client().chat.completions.create(
         model=MODEL_NAME,
         messages=messages,
         max_tokens=reply_max,
@@ -348,6 +356,10 @@ def chat(msg: Message):
 
     return {"reply": reply}
 
+@app.get('/metrics')
+def get_metrics():
+    return Response(metrics.REGISTRY.render(), media_type=metrics.CONTENT_TYPE)
+
 @app.get('/memory')
 def get_memory(query: Optional[str] = None, limit: int = 5):
     return retrieve_relevant_memories(query or '', limit)
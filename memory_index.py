@@ -0,0 +1,174 @@
+import heapq
+import math
+import re
+import threading
+from collections import OrderedDict, Counter
+from typing import Callable, List, Optional
+
+_WORD_RE = re.compile(r'[^\W_]+')
+
+
+def tokenize(text: str) -> List[str]:
+    """Lowercased alphanumeric words longer than 2 chars (same rule the old keyword scorer used)."""
+    return [w for w in _WORD_RE.findall((text or '').lower()) if len(w) > 2]
+
+
+class MemoryIndex:
+    """Insertion-ordered memory store with an incrementally maintained BM25 inverted index.
+
+    Each memory is tokenized once in `add`; postings are updated on `add` and on
+    eviction, so a query only touches the postings of its own terms.
+    """
+
+    def __init__(self, k1: float = 1.5, b: float = 0.75, max_postings: int = 2000, capacity: Optional[int] = None):
+        self.k1 = k1
+        self.b = b
+        # cap on postings scanned per query term (newest first); very common terms
+        # carry almost no IDF weight, so this keeps query cost flat as the store grows
+        self.max_postings = max_postings
+        # when set, the store behaves like a ring buffer: the oldest memory is evicted on overflow
+        self.capacity = capacity
+        self._items = OrderedDict()   # doc_id -> memory dict
+        self._lengths = {}            # doc_id -> token count
+        self._terms = {}              # doc_id -> its distinct terms, so eviction needn't re-tokenize
+        self._postings = {}           # term -> {doc_id: term frequency}
+        self._total_len = 0
+        self._next_id = 0
+        self._idf = {}                # term -> cached idf
+        self._idf_n = 0               # document count the cache was built for
+        # retrieval runs in worker threads while appends happen on the event loop
+        self._lock = threading.RLock()
+
+    def __len__(self):
+        return len(self._items)
+
+    def items(self) -> List[dict]:
+        with self._lock:
+            return list(self._items.values())
+
+    def recent(self, limit: int) -> List[dict]:
+        out = []
+        with self._lock:
+            for doc_id in reversed(self._items):
+                if len(out) >= limit:
+                    break
+                out.append(self._items[doc_id])
+        out.reverse()
+        return out
+
+    def add(self, item: dict) -> int:
+        tf = Counter(tokenize(item.get('text', '')))
+        with self._lock:
+            doc_id = self._next_id
+            self._next_id += 1
+            self._items[doc_id] = item
+            self._lengths[doc_id] = sum(tf.values())
+            self._total_len += self._lengths[doc_id]
+            self._terms[doc_id] = tuple(tf)
+            for term, n in tf.items():
+                self._postings.setdefault(term, {})[doc_id] = n
+                self._idf.pop(term, None)
+            if self.capacity is not None:
+                while len(self._items) > self.capacity:
+                    self.pop_oldest()
+        return doc_id
+
+    def remove(self, doc_id: int) -> Optional[dict]:
+        with self._lock:
+            item = self._items.pop(doc_id, None)
+            if item is None:
+                return None
+            self._total_len -= self._lengths.pop(doc_id)
+            for term in self._terms.pop(doc_id):
+                posting = self._postings.get(term)
+                if posting is None:
+                    continue
+                posting.pop(doc_id, None)
+                if not posting:
+                    del self._postings[term]
+                self._idf.pop(term, None)
+            return item
+
+    def pop_oldest(self) -> Optional[dict]:
+        with self._lock:
+            if not self._items:
+                return None
+            return self.remove(next(iter(self._items)))
+
+    def _get_idf(self, term: str, df: int) -> float:
+        n = len(self._items)
+        # document count drifts on every insert; only drop the whole cache once it
+        # has moved enough to matter, per-term entries are dropped when df changes
+        if abs(n - self._idf_n) > max(1, self._idf_n // 100):
+            self._idf.clear()
+            self._idf_n = n
+        idf = self._idf.get(term)
+        if idf is None:
+            idf = math.log(1 + (n - df + 0.5) / (df + 0.5))
+            self._idf[term] = idf
+        return idf
+
+    def search(self, query: str, limit: int = 5) -> List[dict]:
+        """Return up to `limit` memories ranked by BM25; empty if no term overlaps."""
+        terms = set(tokenize(query))
+        if not terms:
+            return []
+        with self._lock:
+            if not self._items:
+                return []
+            avgdl = (self._total_len / len(self._items)) or 1.0
+            k1, b = self.k1, self.b
+            scores = {}
+            for term in terms:
+                posting = self._postings.get(term)
+                if not posting:
+                    continue
+                idf = self._get_idf(term, len(posting))
+                scanned = 0
+                for doc_id in reversed(posting):
+                    if scanned >= self.max_postings:
+                        break
+                    scanned += 1
+                    tf = posting[doc_id]
+                    norm = tf * (k1 + 1) / (tf + k1 * (1 - b + b * self._lengths[doc_id] / avgdl))
+                    scores[doc_id] = scores.get(doc_id, 0.0) + idf * norm
+            top = heapq.nlargest(limit, scores.items(), key=lambda kv: kv[1])
+            return [self._items[doc_id] for doc_id, _ in top]
+
+
+class MemoryNamespaces:
+    """One bounded MemoryIndex per user/session key.
+
+    Retrieval only ever touches the caller's own namespace. Namespaces are kept in
+    LRU order and the least recently used one is dropped once `max_namespaces` is
+    exceeded, so idle sessions don't hold memory forever.
+    """
+
+    def __init__(self, capacity: int = 1000, max_namespaces: int = 5000, factory: Optional[Callable[..., object]] = None):
+        self.capacity = capacity
+        self.max_namespaces = max_namespaces
+        # builds the per-namespace store; anything with MemoryIndex's surface works
+        self.factory = factory or MemoryIndex
+        self._spaces = OrderedDict()  # key -> MemoryIndex, least recently used first
+        self._lock = threading.Lock()
+
+    def __len__(self):
+        return len(self._spaces)
+
+    def get(self, key: str, create: bool = True):
+        with self._lock:
+            index = self._spaces.get(key)
+            if index is not None:
+                self._spaces.move_to_end(key)
+                return index
+            if not create:
+                return None
+            index = self.factory(capacity=self.capacity)
+            self._spaces[key] = index
+            while len(self._spaces) > self.max_namespaces:
+                self._spaces.popitem(last=False)
+            return index
+
+    def total(self) -> int:
+        with self._lock:
+            return sum(len(index) for index in self._spaces.values())
@@ -0,0 +1,319 @@
+import json
+import os
+import threading
+import time
+from typing import List
+
+try:
+    import fcntl
+except ImportError:  # Windows dev boxes: fall back to in-process locking only
+    fcntl = None
+
+from memory_index import MemoryIndex
+
+
+class JournalStore:
+    """Memory store backed by a JSON snapshot plus an append-only JSONL journal.
+
+    `memory.json` keeps its existing format and is only rewritten by compaction;
+    each append is a single line written to `memory.json.log`. All reads are served
+    from an in-process MemoryIndex, so nothing is re-parsed per request. Appends
+    and compaction take an flock on the journal so several workers can share it.
+
+    Writes are write-behind: `append` indexes the item (so reads see it at once) and
+    queues it, and a background thread writes the queue to the journal in one batch
+    every `flush_interval` seconds, or sooner once `flush_batch` items are waiting.
+    When `max_queue` items are waiting, `append` blocks for up to `max_wait` seconds
+    for the writer and then writes the batch itself. `close` flushes what is left.
+
+    Two locks: `_lock` guards the index and the queue and is only held for in-memory
+    work; `_io_lock` serializes journal writes, syncs and compaction, which swap the
+    queue out under `_lock` and then touch the disk without it, so an append never
+    waits on a write, an flock or an fsync.
+    """
+
+    def __init__(self, path: str, compact_every: int = 500, compact_interval: float = 60.0,
+                 flush_interval: float = 0.5, flush_batch: int = 64, max_queue: int = 2000, max_wait: float = 1.0):
+        self.path = path
+        self.journal_path = path + '.log'
+        self.compact_every = compact_every
+        self.compact_interval = compact_interval
+        self.flush_interval = flush_interval
+        self.flush_batch = flush_batch
+        self.max_queue = max_queue
+        self.max_wait = max_wait
+        self._lock = threading.RLock()
+        self._io_lock = threading.Lock()  # taken before _lock, never while holding it
+        self._drained = threading.Condition(self._lock)
+        self._index = MemoryIndex()
+        self._offset = 0          # bytes of the journal already applied to the index
+        self._pending = 0         # journal entries not yet folded into the snapshot
+        self._queue = []          # appended (and indexed) but not yet written to the journal
+        self._writing = []        # the batch being written right now
+        self._snapshot_mtime = None
+        self._stop = threading.Event()
+        self._wake = threading.Event()
+        self._thread = None
+        self.flushes = 0
+        self.flushed = 0
+        self.backpressured = 0
+        self.flush_errors = 0
+        self._failing = False     # the writer's last flush failed
+        self._reload()
+
+    def _flock(self, f, exclusive: bool):
+        if fcntl is not None:
+            fcntl.flock(f.fileno(), fcntl.LOCK_EX if exclusive else fcntl.LOCK_SH)
+
+    def _funlock(self, f):
+        if fcntl is not None:
+            fcntl.flock(f.fileno(), fcntl.LOCK_UN)
+
+    def _read_snapshot(self) -> List[dict]:
+        try:
+            with open(self.path, 'r', encoding='utf-8') as f:
+                return json.load(f)
+        except Exception:
+            return []
+
+    def _snapshot_stamp(self):
+        try:
+            return os.stat(self.path).st_mtime_ns
+        except OSError:
+            return None
+
+    @staticmethod
+    def _read_journal(f, offset: int):
+        """(new offset, items) for the complete journal lines of `f` from `offset` on."""
+        f.seek(offset)
+        items = []
+        for line in f:
+            if not line.endswith(b'\n'):
+                break  # a writer is mid-line; pick it up next time
+            offset += len(line)
+            try:
+                items.append(json.loads(line))
+            except ValueError:
+                continue
+        return offset, items
+
+    def _journal_size(self) -> int:
+        try:
+            return os.path.getsize(self.journal_path)
+        except OSError:
+            return 0
+
+    def _sync_locked(self, f, force: bool = False):
+        """Bring the index up to date; caller holds `_io_lock` and a lock on the journal file `f`.
+        Files are read without `_lock`, which is only taken to swap the results in."""
+        stamp = self._snapshot_stamp()
+        size = f.seek(0, os.SEEK_END)
+        if force or stamp != self._snapshot_mtime or size < self._offset:
+            # first load, or another worker compacted: rebuild from the snapshot
+            index = MemoryIndex()
+            for item in self._read_snapshot():
+                index.add(item)
+            offset, items = self._read_journal(f, 0)
+            for item in items:
+                index.add(item)
+            with self._lock:
+                for item in self._writing + self._queue:
+                    index.add(item)  # still ours to write; keep them readable
+                self._index = index
+                self._offset = offset
+                self._pending = len(items)
+                self._snapshot_mtime = stamp
+            return
+        if size == self._offset:
+            return
+        offset, items = self._read_journal(f, self._offset)
+        with self._lock:
+            for item in items:
+                self._index.add(item)
+            self._offset = offset
+            self._pending += len(items)
+
+    def _with_journal(self, exclusive: bool, fn):
+        with open(self.journal_path, 'ab+') as f:
+            self._flock(f, exclusive)
+            try:
+                return fn(f)
+            finally:
+                self._funlock(f)
+
+    def _reload(self):
+        with self._io_lock:
+            try:
+                self._with_journal(False, lambda f: self._sync_locked(f, force=True))
+            except OSError:
+                pass
+
+    def _sync(self):
+        """Pick up entries other workers appended, or reload after their compaction."""
+        if self._snapshot_stamp() == self._snapshot_mtime and self._journal_size() == self._offset:
+            return
+        if not self._io_lock.acquire(blocking=False):
+            return  # our own flush or compaction is under way and leaves the index in step
+        try:
+            self._with_journal(False, self._sync_locked)
+        except OSError:
+            pass  # keep serving what is already indexed
+        finally:
+            self._io_lock.release()
+
+    def _take_queue(self) -> list:
+        """Swap the queue out for writing; caller holds `_lock`."""
+        batch, self._queue = self._queue, []
+        self._writing = batch
+        self._drained.notify_all()
+        return batch
+
+    def _write_batch(self, f, batch: list):
+        """Write `batch` to the journal `f` (held exclusively, already synced) as one batch.
+        On failure the batch goes back to the front of the queue to be retried."""
+        try:
+            if not batch:
+                return
+            data = b''.join((json.dumps(item, ensure_ascii=False) + '\n').encode('utf-8') for item in batch)
+            end = f.seek(0, os.SEEK_END)
+            if end != self._offset:
+                # torn last line from a crashed writer: terminate it so ours stays parseable
+                f.write(b'\n')
+                end += 1
+            f.write(data)
+            f.flush()
+            with self._lock:
+                self._offset = end + len(data)
+                self._pending += len(batch)
+                self.flushes += 1
+                self.flushed += len(batch)
+        except BaseException:
+            with self._lock:
+                self._queue = batch + self._queue
+            raise
+        finally:
+            self._writing = []
+
+    def append(self, item: dict):
+        with self._lock:
+            self._ensure_writer()
+            ready = True
+            if len(self._queue) >= self.max_queue:
+                self.backpressured += 1
+                self._wake.set()
+                # no point waiting on a writer whose flushes are failing (e.g. unwritable disk)
+                ready = not self._failing and self._drained.wait_for(lambda: len(self._queue) < self.max_queue,
+                                                                     self.max_wait)
+        if not ready:
+            self.flush()  # the writer is stuck or far behind: pay for the write here
+        with self._lock:
+            self._index.add(item)
+            self._queue.append(item)
+            if len(self._queue) >= self.flush_batch:
+                self._wake.set()
+
+    def flush(self):
+        """Write queued appends to the journal now."""
+
+        def write(f):
+            self._sync_locked(f)  # apply anything other workers wrote first so our offset stays in step
+            with self._lock:
+                batch = self._take_queue()
+            self._write_batch(f, batch)
+
+        with self._io_lock:
+            if self._queue:
+                self._with_journal(True, write)
+
+    @property
+    def queue_depth(self) -> int:
+        return len(self._queue) + len(self._writing)
+
+    def stats(self) -> dict:
+        return {
+            'queue_depth': self.queue_depth,
+            'max_queue': self.max_queue,
+            'flushes': self.flushes,
+            'flushed': self.flushed,
+            'backpressured': self.backpressured,
+            'flush_errors': self.flush_errors,
+            'uncompacted': self._pending,
+        }
+
+    def items(self) -> List[dict]:
+        self._sync()
+        with self._lock:
+            return self._index.items()
+
+    def recent(self, limit: int) -> List[dict]:
+        self._sync()
+        with self._lock:
+            return self._index.recent(limit)
+
+    def search(self, query: str, limit: int = 5) -> List[dict]:
+        self._sync()
+        with self._lock:
+            return self._index.search(query, limit)
+
+    def compact(self):
+        """Fold the journal into the snapshot and truncate it."""
+
+        def fold(f):
+            self._sync_locked(f)
+            with self._lock:
+                batch = self._take_queue()
+                # the journal plus `batch`; anything appended from here on stays queued for the journal
+                items = self._index.items()
+            self._write_batch(f, batch)
+            if not self._pending:
+                return
+            tmp = self.path + '.tmp'
+            with open(tmp, 'w', encoding='utf-8') as out:
+                json.dump(items, out, ensure_ascii=False, indent=2)
+                out.flush()
+                os.fsync(out.fileno())
+            os.replace(tmp, self.path)
+            f.truncate(0)
+            with self._lock:
+                self._offset = 0
+                self._pending = 0
+                self._snapshot_mtime = self._snapshot_stamp()
+
+        with self._io_lock:
+            self._with_journal(True, fold)
+
+    def _ensure_writer(self):
+        if self._thread is None or not self._thread.is_alive():
+            self._stop.clear()
+            self._thread = threading.Thread(target=self._writer_loop, name='memory-writer', daemon=True)
+            self._thread.start()
+
+    def _writer_loop(self):
+        next_compaction = time.monotonic() + self.compact_interval
+        while not self._stop.is_set():
+            self._wake.wait(self.flush_interval)
+            self._wake.clear()
+            try:
+                self.flush()
+                self._failing = False
+            except Exception:
+                self.flush_errors += 1  # the queue is kept and retried on the next tick
+                self._failing = True
+            if time.monotonic() >= next_compaction:
+                next_compaction = time.monotonic() + self.compact_interval
+                if self._pending >= self.compact_every:
+                    try:
+                        self.compact()
+                    except Exception:
+                        pass
+
+    def close(self):
+        self._stop.set()
+        self._wake.set()
+        if self._thread is not None:
+            self._thread.join(timeout=5)
+        try:
+            self.flush()
+            self.compact()
+        except Exception:
+            pass
@@ -0,0 +1,237 @@
+import threading
+import time
+from bisect import bisect_left
+from typing import Callable, Dict, Iterable, List, Optional, Tuple
+
+# Prometheus text exposition without a client library. Hot-path calls (inc, observe)
+# are a dict lookup and a few additions under a lock. Values that other objects
+# already count (cache hits, store sizes, queue depth) are read at scrape time by
+# callbacks, so they cost nothing per request.
+
+CONTENT_TYPE = 'text/plain; version=0.0.4; charset=utf-8'
+LATENCY_BUCKETS = (0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0)
+
+Sample = Tuple[Dict[str, str], float]
+
+
+def _escape(value) -> str:
+    return str(value).replace('\\', '\\\\').replace('\n', '\\n').replace('"', '\\"')
+
+
+def _labels(names: Iterable[str], values: Iterable, extra: str = '') -> str:
+    parts = [f'{n}="{_escape(v)}"' for n, v in zip(names, values)]
+    if extra:
+        parts.append(extra)
+    return '{' + ','.join(parts) + '}' if parts else ''
+
+
+def _num(v: float) -> str:
+    if v == float('inf'):
+        return '+Inf'
+    return repr(float(v)) if not float(v).is_integer() else str(int(v))
+
+
+class _Family:
+    type = ''
+
+    def __init__(self, name: str, help: str, labelnames: Iterable[str] = ()):
+        self.name = name
+        self.help = help
+        self.labelnames = tuple(labelnames)
+        self._lock = threading.Lock()
+
+    def _key(self, labels: dict) -> tuple:
+        return tuple(str(labels.get(n, '')) for n in self.labelnames)
+
+    def header(self) -> List[str]:
+        return [f'# HELP {self.name} {self.help}', f'# TYPE {self.name} {self.type}']
+
+
+class Counter(_Family):
+    type = 'counter'
+
+    def __init__(self, name: str, help: str, labelnames: Iterable[str] = ()):
+        super().__init__(name, help, labelnames)
+        self._values: Dict[tuple, float] = {}
+
+    def inc(self, amount: float = 1, **labels):
+        key = self._key(labels)
+        with self._lock:
+            self._values[key] = self._values.get(key, 0) + amount
+
+    def render(self) -> List[str]:
+        with self._lock:
+            items = list(self._values.items())
+        return self.header() + [f'{self.name}{_labels(self.labelnames, k)} {_num(v)}' for k, v in items]
+
+
+class Gauge(Counter):
+    type = 'gauge'
+
+    def set(self, value: float, **labels):
+        with self._lock:
+            self._values[self._key(labels)] = value
+
+    def dec(self, amount: float = 1, **labels):
+        self.inc(-amount, **labels)
+
+
+class Histogram(_Family):
+    type = 'histogram'
+
+    def __init__(self, name: str, help: str, labelnames: Iterable[str] = (), buckets=LATENCY_BUCKETS):
+        super().__init__(name, help, labelnames)
+        self.buckets = tuple(sorted(buckets))
+        self._series: Dict[tuple, list] = {}  # key -> [per-bucket counts..., +Inf count, sum]
+
+    def observe(self, value: float, **labels):
+        key = self._key(labels)
+        i = bisect_left(self.buckets, value)
+        with self._lock:
+            series = self._series.get(key)
+            if series is None:
+                series = self._series[key] = [0] * (len(self.buckets) + 2)
+            series[i] += 1
+            series[-1] += value
+
+    def time(self, **labels):
+        return _Timer(self, labels)
+
+    def render(self) -> List[str]:
+        with self._lock:
+            items = [(k, list(v)) for k, v in self._series.items()]
+        lines = self.header()
+        for key, series in items:
+            running = 0
+            for bound, count in zip(self.buckets + (float('inf'),), series):
+                running += count
+                le = f'le="{_num(bound)}"'
+                lines.append(f'{self.name}_bucket{_labels(self.labelnames, key, le)} {running}')
+            labels = _labels(self.labelnames, key)
+            lines.append(f'{self.name}_sum{labels} {_num(series[-1])}')
+            lines.append(f'{self.name}_count{labels} {running}')
+        return lines
+
+
+class _Timer:
+    __slots__ = ('histogram', 'labels', 'start')
+
+    def __init__(self, histogram: Histogram, labels: dict):
+        self.histogram = histogram
+        self.labels = labels
+
+    def __enter__(self):
+        self.start = time.perf_counter()
+        return self
+
+    def __exit__(self, *exc):
+        self.histogram.observe(time.perf_counter() - self.start, **self.labels)
+
+
+class Callback(_Family):
+    """A counter or gauge whose samples come from `fn()` at scrape time."""
+
+    def __init__(self, name: str, help: str, type: str, fn: Callable[[], Iterable[Sample]]):
+        super().__init__(name, help)
+        self.type = type
+        self.fn = fn
+
+    def render(self) -> List[str]:
+        try:
+            samples = list(self.fn())
+        except Exception:
+            return []
+        lines = self.header()
+        for labels, value in samples:
+            if value is None:
+                continue
+            lines.append(f'{self.name}{_labels(labels.keys(), labels.values())} {_num(value)}')
+        return lines
+
+
+class Registry:
+    def __init__(self):
+        self._families: List[_Family] = []
+
+    def register(self, family):
+        self._families.append(family)
+        return family
+
+    def counter(self, name: str, help: str, labelnames: Iterable[str] = ()) -> Counter:
+        return self.register(Counter(name, help, labelnames))
+
+    def gauge(self, name: str, help: str, labelnames: Iterable[str] = ()) -> Gauge:
+        return self.register(Gauge(name, help, labelnames))
+
+    def histogram(self, name: str, help: str, labelnames: Iterable[str] = (), buckets=LATENCY_BUCKETS) -> Histogram:
+        return self.register(Histogram(name, help, labelnames, buckets))
+
+    def callback(self, name: str, help: str, type: str, fn: Callable[[], Iterable[Sample]]) -> Callback:
+        return self.register(Callback(name, help, type, fn))
+
+    def render(self) -> str:
+        lines = []
+        for family in self._families:
+            lines.extend(family.render())
+        return '\n'.join(lines) + '\n'
+
+
+REGISTRY = Registry()
+
+STAGE_SECONDS = REGISTRY.histogram(
+    'astral_stage_seconds', 'Time spent in each stage of a chat request.', ['stage'])
+PROVIDER_SECONDS = REGISTRY.histogram(
+    'astral_provider_seconds', 'Latency of successful upstream search calls (cache hits excluded).', ['provider'])
+PROBE_SECONDS = REGISTRY.histogram(
+    'astral_health_probe_seconds', 'Latency of background provider health probes.', ['provider'])
+UPSTREAM_ERRORS = REGISTRY.counter(
+    'astral_upstream_errors_total', 'Failed calls to upstream services, by provider.', ['provider'])
+LLM_TOKENS = REGISTRY.counter(
+    'astral_llm_tokens_total', 'Tokens reported by the LLM backend, by kind (prompt or completion).', ['kind'])
+HTTP_REQUESTS = REGISTRY.counter(
+    'astral_http_requests_total', 'HTTP requests served, by route and status.', ['path', 'status'])
+HTTP_SECONDS = REGISTRY.histogram(
+    'astral_http_request_seconds', 'Time to fully serve a request, streamed body included.', ['path'])
+HTTP_IN_FLIGHT = REGISTRY.gauge(
+    'astral_http_in_flight', 'Requests currently being served.', ['path'])
+
+
+def observe_stages(timings: dict):
+    """Record a request's stage timings (seconds, as collected by Server.timed)."""
+    for stage, seconds in timings.items():
+        STAGE_SECONDS.observe(seconds, stage=stage)
+
+
+def record_usage(usage: Optional[dict]):
+    if usage:
+        LLM_TOKENS.inc(usage.get('prompt_tokens') or 0, kind='prompt')
+        LLM_TOKENS.inc(usage.get('completion_tokens') or 0, kind='completion')
+
+
+class MetricsMiddleware:
+    """ASGI middleware counting requests, in-flight requests and latency per route.
+    Paths outside `paths` share the label 'other' so label cardinality stays fixed."""
+
+    def __init__(self, app, paths: Iterable[str] = ()):
+        self.app = app
+        self.paths = frozenset(paths)
+
+    async def __call__(self, scope, receive, send):
+        if scope['type'] != 'http':
+            return await self.app(scope, receive, send)
+        path = scope['path'] if scope['path'] in self.paths else 'other'
+        status = {'code': 500}
+
+        async def send_wrapper(message):
+            if message['type'] == 'http.response.start':
+                status['code'] = message['status']
+            await send(message)
+
+        HTTP_IN_FLIGHT.inc(path=path)
+        start = time.perf_counter()
+        try:
+            await self.app(scope, receive, send_wrapper)
+        finally:
+            HTTP_IN_FLIGHT.dec(path=path)
+            HTTP_SECONDS.observe(time.perf_counter() - start, path=path)
+            HTTP_REQUESTS.inc(path=path, status=status['code'])
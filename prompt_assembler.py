@@ -0,0 +1,134 @@
+import re
+from typing import List, Optional, Tuple
+
+# Llama 3's tokenizer is a 128k BPE close to cl100k; counts are within a few percent
+DEFAULT_ENCODING = 'cl100k_base'
+
+_SENTENCE_END_RE = re.compile(r'[.!?](?=\s)|\n')
+
+
+class TokenCounter:
+    """Counts tokens with tiktoken, falling back to ~4 chars/token if the encoding
+    can't be loaded (tiktoken fetches its BPE file on first use)."""
+
+    def __init__(self, encoding: str = DEFAULT_ENCODING):
+        self.encoding_name = encoding
+        self._enc = None
+        self._loaded = False
+
+    @property
+    def enc(self):
+        if not self._loaded:
+            self._loaded = True
+            try:
+                import tiktoken
+                self._enc = tiktoken.get_encoding(self.encoding_name)
+            except Exception:
+                self._enc = None
+        return self._enc
+
+    def count(self, text: str) -> int:
+        if not text:
+            return 0
+        if self.enc is not None:
+            return len(self.enc.encode(text, disallowed_special=()))
+        return (len(text) + 3) // 4
+
+    def prefix(self, text: str, max_tokens: int) -> str:
+        """Longest prefix of `text` that fits in `max_tokens`."""
+        if self.enc is not None:
+            ids = self.enc.encode(text, disallowed_special=())
+            return text if len(ids) <= max_tokens else self.enc.decode(ids[:max_tokens])
+        return text[:max_tokens * 4]
+
+
+def truncate_at_sentence(counter: TokenCounter, text: str, max_tokens: int) -> str:
+    """Cut `text` to `max_tokens`, preferring to end on a sentence boundary."""
+    if counter.count(text) <= max_tokens:
+        return text
+    head = counter.prefix(text, max_tokens)
+    ends = [m.end() for m in _SENTENCE_END_RE.finditer(head)]
+    # only back off to a sentence end if that keeps most of the allowance
+    if ends and ends[-1] >= len(head) // 2:
+        return head[:ends[-1]].rstrip()
+    cut = head.rfind(' ')
+    return (head[:cut] if cut > 0 else head).rstrip() + '…'
+
+
+class PromptAssembler:
+    """Builds the user message for a chat turn within a token budget.
+
+    The user's own text always goes in. Web findings and then memories are added
+    in priority order (each list already ranked by relevance), each item capped at
+    `item_tokens` and cut at a sentence boundary, until `input_budget` is spent.
+    The reply allowance (max_tokens) is what the input budget leaves unused, so a
+    short prompt leaves room for a long answer; it is never below the caller's
+    `reply_floor` for the kind of turn, nor above what the context window has left.
+    """
+
+    def __init__(self, counter: Optional[TokenCounter] = None, input_budget: int = 3000,
+                 context_window: int = 128000, item_tokens: int = 250, min_reply: int = 64):
+        self.counter = counter or TokenCounter()
+        self.input_budget = input_budget
+        self.context_window = context_window
+        self.item_tokens = item_tokens
+        self.min_reply = min_reply
+        self._static = {}
+
+    def static_tokens(self, text: str) -> int:
+        """Token count of fixed text (system prompt, instructions), computed once."""
+        n = self._static.get(text)
+        if n is None:
+            n = self._static[text] = self.counter.count(text)
+        return n
+
+    def _fill(self, header: str, items: List[str], budget: int) -> Tuple[List[str], int]:
+        """Header plus as many (truncated) items as fit in `budget`; ([], 0) if none fit."""
+        used = self.static_tokens(header)
+        lines = [header]
+        for item in items:
+            room = min(self.item_tokens, budget - used)
+            if room < 16:
+                break
+            line = truncate_at_sentence(self.counter, item, room)
+            used += self.counter.count(line) + 1
+            lines.append(line)
+        if len(lines) == 1:
+            return [], 0
+        return lines, used
+
+    def assemble(self, system: str, user_text: str, web: List[str], web_instructions: str,
+                 memories: List[str], reply_floor: int, history_tokens: int = 0) -> dict:
+        """Build one turn's user message.
+        `history_tokens` is what earlier conversation turns sent alongside it already use.
+        Returns a dict with 'user_content', 'prompt_tokens', 'max_tokens' and the number
+        of 'web' and 'memories' items that made it into the prompt.
+        """
+        tail = "User:\n" + user_text + "\n\nAstral:"
+        used = self.static_tokens(system) + self.counter.count(tail) + history_tokens
+        budget = self.input_budget - used
+
+        web_text = mem_text = ''
+        web_items = mem_items = 0
+        if web:
+            lines, n = self._fill("Web findings:", web, budget - self.static_tokens(web_instructions))
+            if lines:
+                web_text = "\n" + "\n\n".join(lines) + "\n\n" + web_instructions
+                n += self.static_tokens(web_instructions)
+                used += n
+                budget -= n
+                web_items = len(lines) - 1
+        if memories:
+            lines, n = self._fill("Relevant memories:", memories, budget)
+            if lines:
+                mem_text = "\n".join(lines) + "\n\n"
+                used += n
+                mem_items = len(lines) - 1
+
+        return {
+            'user_content': mem_text + web_text + tail,
+            'prompt_tokens': used,
+            'max_tokens': min(max(self.min_reply, reply_floor, self.input_budget - used), self.context_window - used),
+            'web': web_items,
+            'memories': mem_items,
+        }
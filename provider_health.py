@@ -0,0 +1,181 @@
+import asyncio
+import time
+from collections import deque
+from typing import Awaitable, Callable, Dict, Optional
+
+CLOSED = 'closed'        # healthy, calls go through
+OPEN = 'open'            # failing, calls are skipped until the reset timeout passes
+HALF_OPEN = 'half_open'  # one trial call is allowed to decide whether to close again
+
+
+class CircuitBreaker:
+    """Per-provider circuit breaker. All methods are O(1) and never do I/O.
+
+    After `failure_threshold` consecutive failures the breaker opens and the
+    provider is skipped (a negative cache of the failure) for `reset_timeout`
+    seconds. Then one half-open trial is let through: success closes the breaker,
+    failure re-opens it with the timeout doubled, up to `max_reset_timeout`.
+    """
+
+    def __init__(self, name: str, failure_threshold: int = 3, reset_timeout: float = 15.0, max_reset_timeout: float = 300.0):
+        self.name = name
+        self.failure_threshold = failure_threshold
+        self.base_reset_timeout = reset_timeout
+        self.max_reset_timeout = max_reset_timeout
+        self.reset_timeout = reset_timeout
+        self.state = CLOSED
+        self.failures = 0
+        self.opened_at = 0.0
+        self.trial_in_flight = False
+        self.trial_started = 0.0
+        self.total_failures = 0
+        self.total_skipped = 0
+
+    def allow(self) -> bool:
+        if self.state == CLOSED:
+            return True
+        if self.state == OPEN and time.monotonic() - self.opened_at >= self.reset_timeout:
+            self.state = HALF_OPEN
+            self.trial_in_flight = False
+        if self.state == HALF_OPEN:
+            now = time.monotonic()
+            # a trial whose caller vanished (cancelled request) must not block recovery forever
+            if not self.trial_in_flight or now - self.trial_started >= self.reset_timeout:
+                self.trial_in_flight = True
+                self.trial_started = now
+                return True
+        self.total_skipped += 1
+        return False
+
+    def record_success(self):
+        self.state = CLOSED
+        self.failures = 0
+        self.trial_in_flight = False
+        self.reset_timeout = self.base_reset_timeout
+
+    def record_failure(self):
+        self.failures += 1
+        self.total_failures += 1
+        if self.state == HALF_OPEN:
+            self.reset_timeout = min(self.reset_timeout * 2, self.max_reset_timeout)
+            self._open()
+        elif self.state == CLOSED and self.failures >= self.failure_threshold:
+            self._open()
+
+    def _open(self):
+        self.state = OPEN
+        self.opened_at = time.monotonic()
+        self.trial_in_flight = False
+
+    def snapshot(self) -> dict:
+        return {
+            'state': self.state,
+            'consecutive_failures': self.failures,
+            'total_failures': self.total_failures,
+            'total_skipped': self.total_skipped,
+            'reset_timeout': self.reset_timeout,
+        }
+
+
+class LatencyWindow:
+    """Latencies of the last `size` successful calls, for percentile estimates."""
+
+    def __init__(self, size: int = 200, min_samples: int = 20):
+        self.samples = deque(maxlen=size)
+        self.min_samples = min_samples
+        self._sorted = None
+
+    def observe(self, seconds: float):
+        self.samples.append(seconds)
+        self._sorted = None
+
+    def quantile(self, q: float) -> Optional[float]:
+        """The q-quantile, or None until `min_samples` calls have been seen."""
+        if len(self.samples) < self.min_samples:
+            return None
+        if self._sorted is None:
+            self._sorted = sorted(self.samples)
+        return self._sorted[min(len(self._sorted) - 1, int(q * len(self._sorted)))]
+
+
+class HealthMonitor:
+    """Holds one CircuitBreaker per provider and probes providers in the background.
+
+    Request handlers only call `allow` / `record_*`, which read or update breaker
+    state in memory; probes run in a background task started with `start()`.
+    A probe is an async callable that raises (or returns False) when the provider
+    is unhealthy. Providers with `probe_when_closed=False` (e.g. metered APIs) are
+    only probed to recover from the open state.
+    """
+
+    def __init__(self, interval: float = 30.0, probe_timeout: float = 5.0):
+        self.interval = interval
+        self.probe_timeout = probe_timeout
+        self.breakers: Dict[str, CircuitBreaker] = {}
+        self.latencies: Dict[str, LatencyWindow] = {}
+        self._probes: Dict[str, Callable[[], Awaitable]] = {}
+        self._probe_when_closed: Dict[str, bool] = {}
+        self._task: Optional[asyncio.Task] = None
+
+    def register(self, name: str, probe: Optional[Callable[[], Awaitable]] = None, probe_when_closed: bool = True, **breaker_kwargs):
+        self.breakers[name] = CircuitBreaker(name, **breaker_kwargs)
+        self.latencies[name] = LatencyWindow()
+        if probe is not None:
+            self._probes[name] = probe
+            self._probe_when_closed[name] = probe_when_closed
+
+    def allow(self, name: str) -> bool:
+        breaker = self.breakers.get(name)
+        return breaker is None or breaker.allow()
+
+    def record_success(self, name: str, latency: Optional[float] = None):
+        breaker = self.breakers.get(name)
+        if breaker is not None:
+            breaker.record_success()
+        if latency is not None and name in self.latencies:
+            self.latencies[name].observe(latency)
+
+    def p95(self, name: str) -> Optional[float]:
+        window = self.latencies.get(name)
+        return window.quantile(0.95) if window is not None else None
+
+    def record_failure(self, name: str):
+        breaker = self.breakers.get(name)
+        if breaker is not None:
+            breaker.record_failure()
+
+    def snapshot(self) -> dict:
+        return {name: {**b.snapshot(), 'p95': self.p95(name)} for name, b in self.breakers.items()}
+
+    async def _probe(self, name: str):
+        breaker = self.breakers[name]
+        if breaker.state == CLOSED and not self._probe_when_closed[name]:
+            return
+        if breaker.state != CLOSED and not breaker.allow():
+            return  # still inside the open window, or a trial is already running
+        try:
+            ok = await asyncio.wait_for(self._probes[name](), timeout=self.probe_timeout)
+        except Exception:
+            ok = False
+        if ok is False:
+            breaker.record_failure()
+        else:
+            breaker.record_success()
+
+    async def _run(self):
+        while True:
+            await asyncio.gather(*[self._probe(name) for name in self._probes], return_exceptions=True)
+            await asyncio.sleep(self.interval)
+
+    def start(self):
+        if self._task is None or self._task.done():
+            self._task = asyncio.get_running_loop().create_task(self._run())
+
+    async def stop(self):
+        if self._task is not None:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+            self._task = None
@@ -0,0 +1,101 @@
+import asyncio
+import html
+import os
+import re
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor
+from typing import List, Optional
+from urllib.parse import parse_qs, urlparse
+
+# Pulls search results out of provider HTML with lxml (libxml2) and targeted XPath
+# instead of building a BeautifulSoup tree of the whole page. Page parses run on a
+# dedicated pool so a large page never stalls the event loop:
+#
+#   PARSE_POOL     'thread' (default) or 'process'
+#   PARSE_WORKERS  pool size (default 2)
+#
+# libxml2 does most of the parse without holding the GIL, so threads are usually
+# enough; 'process' isolates parsing completely at the cost of pickling each page.
+
+_TAG_RE = re.compile(r'<[^>]*>')
+_SPACE_RE = re.compile(r'\s+')
+
+_DDG_RESULT_LINKS = "//a[contains(concat(' ', normalize-space(@class), ' '), ' result__a ')]"
+# the result block around a link: DDG wraps each hit in div.result (div.result__body inside it)
+_DDG_RESULT_BLOCK = ("ancestor::div[contains(concat(' ', normalize-space(@class), ' '), ' result ')"
+                     " or contains(concat(' ', normalize-space(@class), ' '), ' result__body ')][1]")
+_DDG_SNIPPET = ".//*[contains(concat(' ', normalize-space(@class), ' '), ' result__snippet ')][1]"
+
+
+def strip_tags(fragment: str) -> str:
+    """Plain text of a small HTML fragment such as a search snippet ('<span class="searchmatch">x</span>')."""
+    return html.unescape(_TAG_RE.sub('', fragment or ''))
+
+
+def _text(el) -> str:
+    return _SPACE_RE.sub(' ', el.text_content()).strip()
+
+
+def _result_url(href: Optional[str]) -> Optional[str]:
+    """Absolute result URL; DDG's '//duckduckgo.com/l/?uddg=<url>' redirects are unwrapped."""
+    if not href:
+        return None
+    if href.startswith('//') or href.startswith('/l/'):
+        target = parse_qs(urlparse(href).query).get('uddg')
+        if target:
+            return target[0]
+        return 'https:' + href if href.startswith('//') else None
+    return href if href.startswith('http') else None
+
+
+def parse_duckduckgo(page: str, max_results: int = 5) -> List[dict]:
+    """[{'url', 'text'}] from a DuckDuckGo HTML results page, snippet preferred over the title."""
+    if not page:
+        return []
+    import lxml.html  # not on the import path of a cold start; a no-op after the first parse
+    doc = lxml.html.fromstring(page)
+    anchors = doc.xpath(_DDG_RESULT_LINKS)
+    structured = bool(anchors)
+    if not structured:
+        # unfamiliar layout: any outbound link
+        anchors = doc.xpath("//a[starts-with(@href, 'http')]")
+    out = []
+    for a in anchors:
+        url = _result_url(a.get('href'))
+        if not url:
+            continue
+        snippet = ''
+        if structured:
+            block = a.xpath(_DDG_RESULT_BLOCK)
+            container = block[0] if block else a.getparent()
+            found = container.xpath(_DDG_SNIPPET) if container is not None else []
+            if found:
+                snippet = _text(found[0])
+        out.append({'url': url, 'text': (snippet or _text(a))[:1600]})
+        if len(out) >= max_results:
+            break
+    return out
+
+
+def _make_pool():
+    workers = int(os.environ.get('PARSE_WORKERS', 2))
+    if os.environ.get('PARSE_POOL', 'thread') == 'process':
+        return ProcessPoolExecutor(max_workers=workers)
+    return ThreadPoolExecutor(max_workers=workers, thread_name_prefix='parse')
+
+
+_pool = None
+
+
+async def run_parse(fn, *args):
+    """`fn(*args)` on the parse pool; `fn` must be a module-level function for the process pool."""
+    global _pool
+    if _pool is None:
+        _pool = _make_pool()
+    return await asyncio.get_running_loop().run_in_executor(_pool, fn, *args)
+
+
+def shutdown():
+    global _pool
+    if _pool is not None:
+        _pool.shutdown(wait=False, cancel_futures=True)
+        _pool = None
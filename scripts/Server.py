@@ -9,7 +9,7 @@ import json
 from typing import Optional, List
 from datetime import datetime
 import multiprocessing
-from groq import Groq 
+import sys
 app = FastAPI(title="Astral Server")
 
 # Allow browser-based frontends to call this API (adjust origins as needed)
@@ -24,6 +24,14 @@ app.add_middleware(
 # Resolve model path relative to this `scripts/` directory (models/ is inside `scripts/`)
 SCRIPT_DIR = os.path.abspath(os.path.dirname(__file__))
 PROJECT_ROOT = os.path.abspath(os.path.join(SCRIPT_DIR, '..'))
+
+# Request ids and trace spans come from the main server's tracing module (TRACE_EXPORT etc.)
+sys.path.insert(0, PROJECT_ROOT)
+import tracing
+from web_router import router_from_env
+app.add_middleware(tracing.TracingMiddleware)
+web_router = router_from_env()
+
 MEMORY_PATH = os.path.join(PROJECT_ROOT, 'memory.json')
 API_KEY = os.getenv("GROW_API_KEY")
 MAX_CONTEXT = 128000  # Llama3.1-70b has 131072 context
@@ -33,7 +41,18 @@ TOP_P = 0.9
 CPU_THREADS = min(4, multiprocessing.cpu_count())
 REPLY_MAX_TOKENS=2048
 
-client = Groq(api_key=API_KEY)
+_client = None
+
+
+def groq_client():
+    """Groq client, created on first use."""
+    global _client
+    if _client is None:
+        from groq import Groq
+        _client = Groq(api_key=API_KEY)
+    return _client
+
+
 MODEL_NAME = "llama-3.3-70b-versatile"
 
 SYSTEM_PROMPT = """
@@ -254,8 +273,8 @@ def is_internet_available(timeout: int = 3) -> bool:
 def wiki_search(query: str, max_results: int = 3):
     """Search Wikipedia via the public API and return list of dicts with 'url' and 'text'."""
     out = []
+    span = tracing.span('search.wikipedia')
     try:
-        print(f"Wikipedia search for: {query}")  # Debug log
         api = 'https://en.wikipedia.org/w/api.php'
         params = {
             'action': 'query',
@@ -266,7 +285,7 @@ def wiki_search(query: str, max_results: int = 3):
         }
         r = requests.get(api, params=params, timeout=10, headers={'User-Agent': 'Mozilla/5.0'})
         data = r.json()
-        print(f"Wikipedia API response status: {r.status_code}")  # Debug log
+        span.set(status=r.status_code)
         for item in data.get('query', {}).get('search', []):
             pageid = item.get('pageid')
             title = item.get('title')
@@ -280,7 +299,7 @@ def wiki_search(query: str, max_results: int = 3):
                 pages = ed.get('query', {}).get('pages', {})
                 extract = pages.get(str(pageid), {}).get('extract', '')
             except Exception as e:
-                print(f"Wikipedia extract error for {pageid}: {e}")  # Debug log
+                span.event('extract_error', pageid=pageid, error=str(e))
                 extract = ''
 
             if not extract:
@@ -290,7 +309,9 @@ def wiki_search(query: str, max_results: int = 3):
             url = f'https://en.wikipedia.org/?curid={pageid}'
             out.append({'url': url, 'text': extract})
     except Exception as e:
-        print(f"Wikipedia search error: {e}")  # Debug log
+        span.record_exception(e)
+    span.set(results=len(out))
+    span.end()
     return out
 
 
@@ -359,25 +380,24 @@ def general_search(query: str, max_results: int = 5):
     key = query.strip().lower()
     cache_key = f"gs:{key}:{max_results}"
     if cache_key in _web_cache:
+        tracing.current_span().set(cached=True)
         return _web_cache[cache_key]
 
     results = []
     # Prefer Bing when available
     if os.environ.get('BING_API_KEY'):
-        print("Trying Bing search")  # Debug log
-        results = bing_search(query, max_results=max_results)
-        print(f"Bing results: {len(results)}")  # Debug log
+        with tracing.span('search.bing') as span:
+            results = bing_search(query, max_results=max_results)
+            span.set(results=len(results))
 
     if not results:
-        print("Trying DuckDuckGo search")  # Debug log
-        results = duckduckgo_search(query, max_results=max_results)
-        print(f"DuckDuckGo results: {len(results)}")  # Debug log
+        with tracing.span('search.duckduckgo') as span:
+            results = duckduckgo_search(query, max_results=max_results)
+            span.set(results=len(results))
 
     # Always include wiki results for authoritative references
     try:
-        print("Adding Wikipedia results")  # Debug log
         w = wiki_search(query, max_results=2)
-        print(f"Wikipedia results: {len(w)}")  # Debug log
         # merge unique urls
         seen = {r['url'] for r in results}
         for r in w:
@@ -387,7 +407,7 @@ def general_search(query: str, max_results: int = 5):
                 if len(results) >= max_results:
                     break
     except Exception as e:
-        print(f"Wikipedia search error: {e}")  # Debug log
+        tracing.current_span().record_exception(e)
 
     _web_cache[cache_key] = results
     # keep cache small
@@ -398,27 +418,10 @@ def general_search(query: str, max_results: int = 5):
 
 
 def should_use_web(text: str) -> bool:
-    """Heuristic to decide whether a query likely needs up-to-date web info.
+    """Whether a query likely needs up-to-date web info (see web_router in the project root).
     The client can still force the web via `use_web` flag.
     """
-    if not text:
-        return False
-    lower = text.lower()
-    # explicit user flag words
-    triggers = ['latest', 'recent', 'current', 'news', 'update', 'updates', 'version', 'versions', 'released', 'release', 'announced', 'trend', 'trending', 'today']
-    for t in triggers:
-        if t in lower:
-            return True
-    # common version/year patterns
-    import re
-    if re.search(r'20\d{2}', text):
-        return True
-    # technical queries about packages, install, or compatibility
-    tech_triggers = ['install', 'how to install', 'compatibl', 'compatibility', 'npm', 'pypi', 'github', 'stack overflow', 'stackoverflow']
-    for t in tech_triggers:
-        if t in lower:
-            return True
-    return False
+    return web_router.route(text)['use_web']
 
 @app.post("/chat")
 def chat(msg: Message):
@@ -434,31 +437,31 @@ def chat(msg: Message):
     web_findings = ''
     # Always attempt web search for every message to stay up-to-date, but use the info only when needed
     use_web_flag = bool(msg.use_web) or should_use_web(msg.text)
-    try:
-        print(f"Performing web search for: {msg.text}")  # Debug log
-        q = (msg.web_query or msg.text)[:800]
-        snippets = wiki_search(q, max_results=2)
-        print(f"Wikipedia results: {len(snippets)}")  # Debug log
-        other = general_search(q, max_results=4)
-        print(f"General search results: {len(other)}")  # Debug log
-        combined = []
-        seen = set()
-        for s in (snippets or []) + (other or []):
-            url = s.get('url') or ''
-            if url in seen:
-                continue
-            seen.add(url)
-            combined.append(s)
-
-        if combined and use_web_flag:
-            parts = ["Web findings:"]
-            for s in combined:
-                parts.append(f"- Source: {s.get('url')}\n  Excerpt: {s.get('text','')[:800]}")
-            web_findings = "\n" + "\n\n".join(parts) + "\n\n"
-            print("Web findings added to prompt")  # Debug log
-    except Exception as e:
-        print(f"Web search error: {e}")  # Log for debugging on Render
-        web_findings = ''
+    with tracing.span('search', use_web=use_web_flag) as search_span:
+        try:
+            q = (msg.web_query or msg.text)[:800]
+            snippets = wiki_search(q, max_results=2)
+            with tracing.span('search.general') as span:
+                other = general_search(q, max_results=4)
+                span.set(results=len(other))
+            combined = []
+            seen = set()
+            for s in (snippets or []) + (other or []):
+                url = s.get('url') or ''
+                if url in seen:
+                    continue
+                seen.add(url)
+                combined.append(s)
+
+            if combined and use_web_flag:
+                parts = ["Web findings:"]
+                for s in combined:
+                    parts.append(f"- Source: {s.get('url')}\n  Excerpt: {s.get('text','')[:800]}")
+                web_findings = "\n" + "\n\n".join(parts) + "\n\n"
+                search_span.set(findings=len(combined))
+        except Exception as e:
+            search_span.record_exception(e)
+            web_findings = ''
 
     # Encourage the model to use web findings when present to produce a complete answer
     web_instructions = ''
@@ -484,7 +487,7 @@ def chat(msg: Message):
     # For Groq, we can use higher max_tokens since context is larger
     reply_max = max(20, requested)
 
-    response = client.chat.completions.create(
+    response = groq_client().chat.completions.create(
         model=MODEL_NAME,
         messages=messages,
         max_tokens=reply_max,
@@ -347,6 +347,48 @@ function fallbackReply(userText) {
 Would you like advice or just to talk more?`;
 }
 
+/* =========================
+   SESSION
+========================= */
+// Stable per-browser id so the server keeps this user's memories separate from everyone else's
+function getSessionId() {
+  let id = localStorage.getItem('astralSessionId');
+  if (!id) {
+    id = crypto.randomUUID ? crypto.randomUUID() : Date.now().toString(36) + Math.random().toString(36).slice(2);
+    localStorage.setItem('astralSessionId', id);
+  }
+  return id;
+}
+
+/* =========================
+   SERVER-SENT EVENTS
+========================= */
+async function readEventStream(body, onEvent) {
+  const reader = body.getReader();
+  const decoder = new TextDecoder();
+  let buffer = '';
+
+  while (true) {
+    const { value, done } = await reader.read();
+    if (done) break;
+    buffer += decoder.decode(value, { stream: true });
+
+    // events are separated by a blank line
+    let sep;
+    while ((sep = buffer.indexOf('\n\n')) !== -1) {
+      const raw = buffer.slice(0, sep);
+      buffer = buffer.slice(sep + 2);
+      let event = 'message';
+      let data = '';
+      raw.split('\n').forEach(line => {
+        if (line.startsWith('event:')) event = line.slice(6).trim();
+        else if (line.startsWith('data:')) data += line.slice(5).trim();
+      });
+      if (data) onEvent(event, JSON.parse(data));
+    }
+  }
+}
+
 /* =========================
    SEND MESSAGE
 ========================= */
@@ -386,26 +428,42 @@ async function handleSend() {
   } catch (e) {}
 
   try {
-    const resp = await fetch(`https://astral-nlaf.onrender.com/chat`, {
+    const resp = await fetch(`https://astral-nlaf.onrender.com/chat/stream`, {
       method: 'POST',
-      headers: { 'Content-Type': 'application/json' },
-      body: JSON.stringify({ text }),
+      headers: { 'Content-Type': 'application/json', 'X-Session-Id': getSessionId() },
+      body: JSON.stringify({ text, session_id: getSessionId(), chat_id: currentChatId }),
       signal: controller.signal,
     });
 
-    let reply = '';
-    if (!resp.ok) throw new Error('Server error');
-    const data = await resp.json();
-    reply = data.reply || '[No response]';
+    if (!resp.ok || !resp.body) throw new Error('Server error');
 
     const lastIndex = htmlResult.length - 1;
+    let reply = '';
+    let lastAIText = null;
+
+    // Show tokens as they arrive instead of waiting for the whole reply
+    await readEventStream(resp.body, (event, data) => {
+      if (event === 'delta') {
+        if (!lastAIText) {
+          htmlResult[lastIndex].thinking = false;
+          renderHtmlResult();
+          lastAIText = displayContainer.querySelectorAll('.ai-response .text')[displayContainer.querySelectorAll('.ai-response .text').length - 1];
+        }
+        reply += data.text;
+        lastAIText.textContent = reply;
+        scrollToBottom();
+      } else if (event === 'done') {
+        reply = data.reply ?? reply;
+      } else if (event === 'error') {
+        throw new Error(data.error || 'Server error');
+      }
+    });
+
+    reply = reply.trim() || '[No response]';
     htmlResult[lastIndex].thinking = false;
     htmlResult[lastIndex].aiText = reply;
 
     renderHtmlResult();
-
-    const lastAIText = displayContainer.querySelectorAll('.ai-response .text')[displayContainer.querySelectorAll('.ai-response .text').length - 1];
-    typeText(lastAIText, reply);
     speak(reply);
 
   } catch (err) {
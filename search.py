@@ -0,0 +1,308 @@
+import asyncio
+import os
+import time
+from functools import partial
+
+import deadlines
+import metrics
+import result_extract
+import tracing
+from http_pool import outbound
+from provider_health import HealthMonitor
+from singleflight import SingleFlight
+from web_cache import WebCache
+
+# Overridable so load tests can point the providers at local stand-ins (bench/bench_load.py)
+WIKI_API = os.environ.get('WIKI_API', 'https://en.wikipedia.org/w/api.php')
+DDG_URL = os.environ.get('DDG_URL', 'https://html.duckduckgo.com/html/')
+BING_ENDPOINT = os.environ.get('BING_ENDPOINT', 'https://api.bing.microsoft.com/v7.0/search')
+
+
+async def _probe_wikipedia():
+    r = await outbound.head(WIKI_API)
+    return r.status_code < 500
+
+
+async def _probe_duckduckgo():
+    r = await outbound.head(DDG_URL)
+    return r.status_code < 500
+
+
+async def _probe_bing():
+    # metered API: only probed while its breaker is open, see register() below
+    r = await outbound.get(BING_ENDPOINT, params={'q': 'test', 'count': 1},
+                               headers={'Ocp-Apim-Subscription-Key': os.environ.get('BING_API_KEY', '')})
+    return r.status_code < 500 and r.status_code != 429
+
+
+# Every provider result goes through this cache. Encyclopedia text changes slowly,
+# web results (news) go stale quickly. Set WEB_CACHE_PATH to persist across restarts.
+WEB_CACHE_TTL = {'wikipedia': 6 * 3600, 'duckduckgo': 30 * 60, 'bing': 30 * 60}
+web_cache = WebCache(max_entries=1024, ttls=WEB_CACHE_TTL, path=os.environ.get('WEB_CACHE_PATH'))
+
+# Provider health is tracked in the background; request handlers only read breaker state
+def _timed_probe(name: str, probe):
+    async def run():
+        with metrics.PROBE_SECONDS.time(provider=name):
+            return await probe()
+    return run
+
+
+health = HealthMonitor(interval=30.0)
+health.register('wikipedia', _timed_probe('wikipedia', _probe_wikipedia))
+health.register('duckduckgo', _timed_probe('duckduckgo', _probe_duckduckgo))
+health.register('bing', _timed_probe('bing', _probe_bing), probe_when_closed=False)
+
+
+def _succeeded(name: str, started: float):
+    latency = time.monotonic() - started
+    health.record_success(name, latency)
+    metrics.PROVIDER_SECONDS.observe(latency, provider=name)
+
+
+def _failed(name: str):
+    health.record_failure(name)
+    metrics.UPSTREAM_ERRORS.inc(provider=name)
+
+
+async def _wiki_snippets(query: str, max_results: int) -> dict:
+    """Plain-text search snippets by pageid, used only for pages that came back without an extract."""
+    params = {'action': 'query', 'list': 'search', 'srsearch': query, 'format': 'json', 'srlimit': max_results}
+    try:
+        r = await outbound.get(WIKI_API, params=params, timeout=10)
+        hits = r.json().get('query', {}).get('search', [])
+    except Exception:
+        return {}
+    return {item.get('pageid'): result_extract.strip_tags(item.get('snippet', '')) for item in hits}
+
+
+async def wiki_search(query: str, max_results: int = 3):
+    """Search Wikipedia via the public API and return list of dicts with 'url' and 'text'.
+    Search hits and their extracts come back in one request (generator=search); a second
+    request for search snippets is only made if some page has no extract.
+    """
+    cached = web_cache.get('wikipedia', query, max_results)
+    if cached is not None:
+        tracing.current_span().set(cached=True)
+        return cached
+    out = []
+    try:
+        params = {
+            'action': 'query',
+            'generator': 'search',
+            'gsrsearch': query,
+            'gsrlimit': max_results,
+            'prop': 'extracts',
+            # TextExtracts only returns several extracts per call for the intro section
+            'exintro': 1,
+            'explaintext': 1,
+            'exchars': 2000,
+            'exlimit': max_results,
+            'format': 'json',
+        }
+        t0 = time.monotonic()
+        r = await outbound.get(WIKI_API, params=params, timeout=10)
+        r.raise_for_status()
+        pages = r.json().get('query', {}).get('pages', {})
+        # generator results are keyed by pageid; `index` carries the search rank
+        pages = sorted(pages.values(), key=lambda p: p.get('index', 0))
+        snippets = {}
+        if any(not p.get('extract') for p in pages):
+            snippets = await _wiki_snippets(query, max_results)
+        for page in pages:
+            pageid = page.get('pageid')
+            extract = page.get('extract') or snippets.get(pageid, '')
+            url = f'https://en.wikipedia.org/?curid={pageid}'
+            out.append({'url': url, 'text': extract})
+        _succeeded('wikipedia', t0)
+        if out:
+            web_cache.set('wikipedia', query, max_results, out)
+    except deadlines.DeadlineExceeded:
+        tracing.current_span().set(deadline_exceeded=True)  # our request's budget ran out, not the provider
+    except Exception as e:
+        tracing.current_span().record_exception(e)
+        _failed('wikipedia')
+    return out
+
+
+async def duckduckgo_search(query: str, max_results: int = 5):
+    """Perform a lightweight DuckDuckGo HTML search (no API key required).
+    Returns list of {'url':..., 'text':...}
+    """
+    cached = web_cache.get('duckduckgo', query, max_results)
+    if cached is not None:
+        tracing.current_span().set(cached=True)
+        return cached
+    out = []
+    try:
+        t0 = time.monotonic()
+        r = await outbound.post(DDG_URL, data={'q': query}, timeout=12)
+        r.raise_for_status()
+        # parsed off the event loop; only the result links and their snippets are visited
+        out = await result_extract.run_parse(result_extract.parse_duckduckgo, r.text, max_results)
+        _succeeded('duckduckgo', t0)
+        if out:
+            web_cache.set('duckduckgo', query, max_results, out)
+    except deadlines.DeadlineExceeded:
+        tracing.current_span().set(deadline_exceeded=True)  # our request's budget ran out, not the provider
+    except Exception as e:
+        tracing.current_span().record_exception(e)
+        _failed('duckduckgo')
+    return out
+
+
+async def bing_search(query: str, max_results: int = 5):
+    """Use Bing Web Search API if `BING_API_KEY` env var is set. Returns same shape as other search fns."""
+    cached = web_cache.get('bing', query, max_results)
+    if cached is not None:
+        tracing.current_span().set(cached=True)
+        return cached
+    out = []
+    key = os.environ.get('BING_API_KEY')
+    if not key:
+        return out
+    try:
+        headers = {'Ocp-Apim-Subscription-Key': key}
+        params = {'q': query, 'count': max_results}
+        t0 = time.monotonic()
+        r = await outbound.get(BING_ENDPOINT, headers=headers, params=params, timeout=12)
+        r.raise_for_status()
+        data = r.json()
+        for item in data.get('webPages', {}).get('value', []):
+            out.append({'url': item.get('url'), 'text': (item.get('snippet') or '')[:1600]})
+        _succeeded('bing', t0)
+        if out:
+            web_cache.set('bing', query, max_results, out)
+    except deadlines.DeadlineExceeded:
+        tracing.current_span().set(deadline_exceeded=True)  # our request's budget ran out, not the provider
+    except Exception as e:
+        tracing.current_span().record_exception(e)
+        _failed('bing')
+    return out
+
+
+# Total time a request may spend on web search; providers still running after it are cancelled
+SEARCH_DEADLINE = 8.0
+
+# Concurrent identical provider calls (same provider, normalized query and size) share one request
+searches = SingleFlight()
+
+
+# A hedge to the fallback web provider fires once the primary has taken longer than its
+# p95 latency (HEDGE_DEFAULT_DELAY until enough calls have been timed)
+HEDGE_DEFAULT_DELAY = 1.5
+HEDGE_MIN_DELAY = 0.25
+hedge_stats = {'hedged_calls': 0, 'hedges_fired': 0, 'fallback_won': 0}
+
+
+async def _hedged(primary: str, primary_call, fallback: str, fallback_call):
+    """Result of `primary_call()`, or of `fallback_call()` if the primary is slower than its
+    p95 or fails; whichever non-empty result arrives first wins and the other is cancelled."""
+    hedge_stats['hedged_calls'] += 1
+    delay = max(HEDGE_MIN_DELAY, health.p95(primary) or HEDGE_DEFAULT_DELAY)
+    span = tracing.current_span()
+    span.set(hedge_delay=round(delay, 3))
+    tasks = {asyncio.ensure_future(primary_call()): primary}
+    try:
+        done, _ = await asyncio.wait(tasks, timeout=delay)
+        for t in done:
+            if not t.cancelled() and t.exception() is None and t.result():
+                return t.result()
+        hedge_stats['hedges_fired'] += 1
+        span.event('hedge_fired', provider=fallback)
+        tasks[asyncio.ensure_future(fallback_call())] = fallback
+        pending = set(tasks)
+        while pending:
+            done, pending = await asyncio.wait(pending, return_when=asyncio.FIRST_COMPLETED)
+            for t in done:
+                if not t.cancelled() and t.exception() is None and t.result():
+                    if tasks[t] == fallback:
+                        hedge_stats['fallback_won'] += 1
+                    span.set(winner=tasks[t])
+                    return t.result()
+        return []
+    finally:
+        for t in tasks:
+            if not t.done():
+                t.cancel()
+
+
+async def _traced(name: str, fn, *args):
+    """`await fn(*args)` in a span named after the provider, noting how many results came back."""
+    with tracing.span(f'search.{name}') as span:
+        results = await fn(*args)
+        span.set(results=len(results))
+        return results
+
+
+def _providers(query: str, max_results: int):
+    """Provider calls for one search, in the order their results are merged.
+    Providers whose circuit breaker is open are skipped without a network call.
+    Bing (when configured) is hedged with DuckDuckGo rather than queried alongside it.
+    """
+    def usable(name, n):
+        # a fresh cached result is served even while the provider's breaker is open
+        return web_cache.contains(name, query, n) or health.allow(name)
+
+    def call(name, fn, n):
+        return partial(_traced, name, searches.do, web_cache.key(name, query, n), partial(fn, query, max_results=n))
+
+    def when_usable(name, n, fn):
+        # the hedge fallback's breaker is only asked once the hedge fires: a half-open
+        # breaker's single trial must not be spent on a call that never happens
+        async def run():
+            return await call(name, fn, n)() if usable(name, n) else []
+        return run
+
+    calls = []
+    if usable('wikipedia', 2):
+        calls.append(('wikipedia', call('wikipedia', wiki_search, 2)()))
+    bing = bool(os.environ.get('BING_API_KEY')) and usable('bing', max_results)
+    if bing:
+        # a hedge that runs past the search deadline counts against the primary
+        calls.append(('bing', _traced('hedge', _hedged, 'bing', call('bing', bing_search, max_results),
+                                      'duckduckgo', when_usable('duckduckgo', max_results, duckduckgo_search))))
+    elif usable('duckduckgo', max_results):
+        calls.append(('duckduckgo', call('duckduckgo', duckduckgo_search, max_results)()))
+    return calls
+
+
+async def search_all(query: str, max_results: int = 6, deadline: float = SEARCH_DEADLINE, reserve: float = 0.0):
+    """Query every provider exactly once, concurrently, and merge the results.
+    Returns by `deadline` seconds, or earlier if the request's own deadline (less `reserve`
+    seconds kept for later stages) comes first, with whatever has arrived, deduplicated by URL.
+    """
+    try:
+        budget = deadlines.budget(deadline, reserve)
+    except deadlines.DeadlineExceeded:
+        return []
+    calls = _providers(query, max_results)
+    if not calls:
+        return []
+    tasks = [asyncio.ensure_future(coro) for _, coro in calls]
+    try:
+        done, pending = await asyncio.wait(tasks, timeout=budget)
+    finally:
+        # also reached when the request itself is cancelled
+        for t in tasks:
+            if not t.done():
+                t.cancel()
+    if budget >= deadline:
+        for (name, _), t in zip(calls, tasks):
+            if t in pending:
+                # ran past the full search deadline: counts against the provider like an error
+                # (not when the request's own, shorter budget is what ran out)
+                _failed(name)
+
+    results = []
+    seen = set()
+    for t in tasks:
+        if t not in done or t.cancelled() or t.exception() is not None:
+            continue
+        for r in t.result():
+            url = r.get('url') or ''
+            if not url or url in seen:
+                continue
+            seen.add(url)
+            results.append(r)
+    return results[:max_results]
@@ -0,0 +1,104 @@
+import asyncio
+from typing import Awaitable, Callable, Dict, Hashable, Optional
+
+
+class _Flight:
+    __slots__ = ('future', 'waiters', 'abandoned')
+
+    def __init__(self, future: asyncio.Future):
+        self.future = future
+        self.waiters = 0
+        self.abandoned = False
+
+
+class SingleFlight:
+    """Coalesces concurrent identical async calls onto one in-flight future.
+
+    The first caller for a key (the leader) starts the work as its own task; callers
+    arriving while it runs wait on the same future instead of repeating it. Results
+    are not kept once the flight lands, so this complements a cache rather than
+    replacing one.
+
+    - An exception reaches every waiter, and the next call for the key starts fresh.
+    - A cancelled waiter only stops waiting. The work is cancelled when its last
+      waiter leaves, and a later caller starts a new flight instead of inheriting
+      the cancellation.
+
+    `begin(key)` lets a caller that produces the result by hand, like a streaming
+    response, lead a flight. It must resolve the returned future with set_result
+    or set_exception.
+    """
+
+    def __init__(self):
+        self._flights: Dict[Hashable, _Flight] = {}
+        self.leaders = 0
+        self.coalesced = 0
+        self.errors = 0
+        self.cancelled = 0
+
+    def _live(self, key: Hashable) -> Optional[_Flight]:
+        flight = self._flights.get(key)
+        if flight is None or flight.abandoned or flight.future.done():
+            return None
+        return flight
+
+    def _register(self, key: Hashable, future: asyncio.Future) -> _Flight:
+        self.leaders += 1
+        flight = self._flights[key] = _Flight(future)
+        future.add_done_callback(lambda f: self._landed(key, flight))
+        return flight
+
+    def _landed(self, key: Hashable, flight: _Flight):
+        if self._flights.get(key) is flight:
+            del self._flights[key]
+        if flight.future.cancelled():
+            self.cancelled += 1
+        elif flight.future.exception() is not None:  # also marks it retrieved when nobody waits
+            self.errors += 1
+
+    async def _wait(self, flight: _Flight):
+        flight.waiters += 1
+        try:
+            return await asyncio.shield(flight.future)
+        except asyncio.CancelledError:
+            if flight.waiters == 1 and not flight.future.done() and isinstance(flight.future, asyncio.Task):
+                flight.abandoned = True
+                flight.future.cancel()
+            raise
+        finally:
+            flight.waiters -= 1
+
+    def running(self, key: Optional[Hashable]) -> bool:
+        return key is not None and self._live(key) is not None
+
+    async def do(self, key: Optional[Hashable], fn: Callable[[], Awaitable]):
+        """Await `fn()`, or the identical call already in flight for `key`. A None key never coalesces."""
+        if key is None:
+            return await fn()
+        flight = self._live(key)
+        if flight is None:
+            flight = self._register(key, asyncio.ensure_future(fn()))
+        else:
+            self.coalesced += 1
+        return await self._wait(flight)
+
+    async def wait(self, key: Hashable):
+        """Join the flight for `key`; call only when `running(key)` is true."""
+        flight = self._live(key)
+        if flight is None:
+            raise KeyError(key)
+        self.coalesced += 1
+        return await self._wait(flight)
+
+    def begin(self, key: Hashable) -> asyncio.Future:
+        """Lead a flight whose result the caller sets by hand."""
+        return self._register(key, asyncio.get_running_loop().create_future()).future
+
+    def stats(self) -> dict:
+        return {
+            'in_flight': len(self._flights),
+            'leaders': self.leaders,
+            'coalesced': self.coalesced,
+            'errors': self.errors,
+            'cancelled': self.cancelled,
+        }
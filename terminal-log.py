@@ -1,12 +1,13 @@
-from llama_cpp import Llama
 import os
 
+from llm_backends import LlamaCppBackend
+
 # Resolve model path relative to this script (points to scripts/models/...)
 SCRIPT_DIR = os.path.abspath(os.path.dirname(__file__))
 MODEL_FILE = "mistral-7b-v0.1.Q3_K_M.gguf"
 MODEL_PATH = os.path.join(SCRIPT_DIR, "models", MODEL_FILE)
 
-llm = Llama(model_path=MODEL_PATH)
+llm = LlamaCppBackend(MODEL_PATH)
 
 # Initial prompt for XENI
 xeni_prompt = (
@@ -23,9 +24,10 @@ while True:
         print("XENI: Goodbye! Take care!")
         break
 
-    # Combine the initial prompt with user input
-    full_prompt = f"{xeni_prompt}\nUser: {user_input}\nXENI:"
-
     # Generate response
-    response = llm(full_prompt, max_tokens=200)
-    print("XENI:", response['choices'][0]['text'])
+    messages = [
+        {"role": "system", "content": xeni_prompt},
+        {"role": "user", "content": user_input},
+    ]
+    response = llm.complete(messages, max_tokens=200)
+    print("XENI:", response['text'])
@@ -0,0 +1,386 @@
+import asyncio
+import json
+import logging
+import os
+import queue
+import random
+import sys
+import threading
+import time
+import uuid
+from contextvars import ContextVar
+from typing import List, Optional
+
+# Per-request tracing. Every HTTP request gets a request id (X-Request-ID, taken from the
+# caller when present). While tracing is on, `span(...)` blocks opened anywhere under the
+# request, including in tasks and threads started from it, form that request's timing tree.
+#
+#   TRACE_EXPORT       '' (off, default), 'jsonl' or 'otlp'
+#   TRACE_SAMPLE_RATE  share of requests exported (default 0.1); slow or failed ones always are
+#   TRACE_SLOW_MS      requests at least this slow are always exported (default 3000)
+#   TRACE_JSONL_PATH   where 'jsonl' writes one trace per line (default traces.jsonl)
+#   OTLP_ENDPOINT      OTLP/HTTP JSON traces endpoint (default http://localhost:4318/v1/traces)
+#
+# Look up one request's tree with:  python tracing.py traces.jsonl <request id>
+
+log = logging.getLogger('astral.tracing')
+
+_current_span = ContextVar('trace_span', default=None)
+_request_id = ContextVar('request_id', default=None)
+
+
+class Trace:
+    __slots__ = ('trace_id', 'request_id', 'spans', 'sampled', 'max_spans')
+
+    def __init__(self, request_id: str, sampled: bool, max_spans: int):
+        self.trace_id = uuid.uuid4().hex
+        self.request_id = request_id
+        self.spans: List['Span'] = []
+        self.sampled = sampled
+        self.max_spans = max_spans
+
+
+class Span:
+    __slots__ = ('trace', 'name', 'span_id', 'parent_id', 'start_ns', 'end_ns', 'attributes', 'events', 'error',
+                 '_token')
+
+    def __init__(self, trace: Trace, name: str, parent_id: Optional[str], attributes: dict):
+        self.trace = trace
+        self.name = name
+        self.span_id = os.urandom(8).hex()
+        self.parent_id = parent_id
+        self.start_ns = time.time_ns()
+        self.end_ns = None
+        self.attributes = attributes
+        self.events = []
+        self.error = None
+
+    def set(self, **attributes):
+        self.attributes.update(attributes)
+
+    def event(self, name: str, **attributes):
+        self.events.append((time.time_ns(), name, attributes))
+
+    def record_exception(self, exc: BaseException):
+        self.error = f'{type(exc).__name__}: {exc}' if str(exc) else type(exc).__name__
+
+    def __enter__(self):
+        self._token = _current_span.set(self)
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        if isinstance(exc, asyncio.CancelledError):
+            # e.g. a provider still running at the search deadline, or the loser of a hedge
+            self.attributes['cancelled'] = True
+        elif exc is not None and self.error is None:
+            self.record_exception(exc)
+        _current_span.reset(self._token)
+        self.end()
+
+    def end(self):
+        """Finish a span that was never entered, e.g. one held across a generator's yields."""
+        if self.end_ns is None:
+            self.end_ns = time.time_ns()
+            if len(self.trace.spans) < self.trace.max_spans:
+                self.trace.spans.append(self)
+
+    @property
+    def duration_ms(self) -> float:
+        return ((self.end_ns or time.time_ns()) - self.start_ns) / 1e6
+
+
+class _NoopSpan:
+    """Stands in for a span when tracing is off or no trace is active."""
+
+    def set(self, **attributes):
+        pass
+
+    def event(self, name: str, **attributes):
+        pass
+
+    def record_exception(self, exc: BaseException):
+        pass
+
+    def end(self):
+        pass
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        return None
+
+
+NOOP = _NoopSpan()
+
+
+def _trace_record(trace: Trace, root: Span) -> dict:
+    def span_record(s: Span) -> dict:
+        return {
+            'span_id': s.span_id,
+            'parent_id': s.parent_id,
+            'name': s.name,
+            'offset_ms': round((s.start_ns - root.start_ns) / 1e6, 3),
+            'duration_ms': round(s.duration_ms, 3),
+            'attributes': s.attributes,
+            'events': [{'offset_ms': round((t - root.start_ns) / 1e6, 3), 'name': n, 'attributes': a}
+                       for t, n, a in s.events],
+            'error': s.error,
+        }
+    return {
+        'trace_id': trace.trace_id,
+        'request_id': trace.request_id,
+        'name': root.name,
+        'start': root.start_ns / 1e9,
+        'duration_ms': round(root.duration_ms, 3),
+        'error': root.error,
+        'spans': [span_record(s) for s in sorted(trace.spans, key=lambda s: s.start_ns)],
+    }
+
+
+class JsonlSink:
+    def __init__(self, path: str):
+        self.path = path
+
+    def write(self, records: List[dict]):
+        with open(self.path, 'a', encoding='utf-8') as f:
+            for record in records:
+                f.write(json.dumps(record, ensure_ascii=False, default=str) + '\n')
+
+
+class OtlpSink:
+    """Posts traces to an OTLP/HTTP collector using the JSON encoding."""
+
+    def __init__(self, endpoint: str, service_name: str = 'astral-server'):
+        import httpx
+        self.endpoint = endpoint
+        self.service_name = service_name
+        self.client = httpx.Client(timeout=5.0)
+
+    @staticmethod
+    def _value(v) -> dict:
+        if isinstance(v, bool):
+            return {'boolValue': v}
+        if isinstance(v, int):
+            return {'intValue': str(v)}
+        if isinstance(v, float):
+            return {'doubleValue': v}
+        return {'stringValue': str(v)}
+
+    def _attributes(self, attrs: dict) -> list:
+        return [{'key': k, 'value': self._value(v)} for k, v in attrs.items() if v is not None]
+
+    def _span(self, record: dict, s: dict) -> dict:
+        start = int(record['start'] * 1e9 + s['offset_ms'] * 1e6)
+        out = {
+            'traceId': record['trace_id'],
+            'spanId': s['span_id'],
+            'name': s['name'],
+            'kind': 2 if s['parent_id'] is None else 1,  # SERVER for the request, INTERNAL below it
+            'startTimeUnixNano': str(start),
+            'endTimeUnixNano': str(start + int(s['duration_ms'] * 1e6)),
+            'attributes': self._attributes({**s['attributes'], 'request.id': record['request_id']}),
+            'events': [{'timeUnixNano': str(int(record['start'] * 1e9 + e['offset_ms'] * 1e6)), 'name': e['name'],
+                        'attributes': self._attributes(e['attributes'])} for e in s['events']],
+            'status': {'code': 2, 'message': s['error']} if s['error'] else {'code': 1},
+        }
+        if s['parent_id']:
+            out['parentSpanId'] = s['parent_id']
+        return out
+
+    def write(self, records: List[dict]):
+        spans = [self._span(r, s) for r in records for s in r['spans']]
+        payload = {'resourceSpans': [{
+            'resource': {'attributes': self._attributes({'service.name': self.service_name})},
+            'scopeSpans': [{'scope': {'name': 'astral.tracing'}, 'spans': spans}],
+        }]}
+        self.client.post(self.endpoint, json=payload).raise_for_status()
+
+
+class Tracer:
+    """Creates traces and hands finished ones to a sink on a background thread.
+
+    The sampling decision is made when a request starts, but every span is recorded
+    while it runs so that slow (>= `slow_ms`) or failed requests can be exported too.
+    Export never blocks a request: traces go through a bounded queue and are
+    dropped (and counted) if the sink falls behind.
+    """
+
+    def __init__(self, sink=None, sample_rate: float = 0.1, slow_ms: float = 3000, max_spans: int = 256,
+                 queue_size: int = 1000):
+        self.sink = sink
+        self.sample_rate = sample_rate
+        self.slow_ms = slow_ms
+        self.max_spans = max_spans
+        self._queue = queue.Queue(maxsize=queue_size)
+        self._worker = None
+        self.exported = 0
+        self.dropped = 0
+        self.export_errors = 0
+
+    @property
+    def enabled(self) -> bool:
+        return self.sink is not None
+
+    def start_trace(self, name: str, request_id: Optional[str] = None, **attributes):
+        """Root span for one request. Use as a context manager; ends (and maybe exports) the trace."""
+        request_id = request_id or uuid.uuid4().hex[:16]
+        if not self.enabled:
+            return _RequestScope(self, None, request_id)
+        trace = Trace(request_id, random.random() < self.sample_rate, self.max_spans)
+        return _RequestScope(self, Span(trace, name, None, attributes), request_id)
+
+    def span(self, name: str, **attributes):
+        parent = _current_span.get()
+        if parent is None:
+            return NOOP
+        return Span(parent.trace, name, parent.span_id, attributes)
+
+    def _finish(self, root: Span):
+        trace = root.trace
+        if not (trace.sampled or root.error or root.duration_ms >= self.slow_ms):
+            return
+        try:
+            self._queue.put_nowait(_trace_record(trace, root))
+        except queue.Full:
+            self.dropped += 1
+            return
+        if self._worker is None or not self._worker.is_alive():
+            self._worker = threading.Thread(target=self._run, name='trace-exporter', daemon=True)
+            self._worker.start()
+
+    def _run(self):
+        while True:
+            batch = [self._queue.get()]
+            while len(batch) < 64:
+                try:
+                    batch.append(self._queue.get_nowait())
+                except queue.Empty:
+                    break
+            try:
+                self.sink.write(batch)
+                self.exported += len(batch)
+            except Exception as e:
+                self.export_errors += 1
+                log.warning('trace export failed: %s', e)
+
+    def flush(self, timeout: float = 5.0):
+        """Wait (up to `timeout`) for queued traces to be written, e.g. at shutdown."""
+        deadline = time.monotonic() + timeout
+        while not self._queue.empty() and time.monotonic() < deadline:
+            time.sleep(0.05)
+
+    def stats(self) -> dict:
+        return {'enabled': self.enabled, 'sample_rate': self.sample_rate, 'exported': self.exported,
+                'dropped': self.dropped, 'export_errors': self.export_errors, 'queued': self._queue.qsize()}
+
+
+class _RequestScope:
+    __slots__ = ('tracer', 'root', 'request_id', '_token')
+
+    def __init__(self, tracer: Tracer, root: Optional[Span], request_id: str):
+        self.tracer = tracer
+        self.root = root
+        self.request_id = request_id
+
+    def __enter__(self):
+        self._token = _request_id.set(self.request_id)
+        if self.root is not None:
+            self.root.__enter__()
+            return self.root
+        return NOOP
+
+    def __exit__(self, exc_type, exc, tb):
+        if self.root is not None:
+            self.root.__exit__(exc_type, exc, tb)
+            self.tracer._finish(self.root)
+        _request_id.reset(self._token)
+
+
+def tracer_from_env() -> Tracer:
+    export = os.environ.get('TRACE_EXPORT', '')
+    sink = None
+    if export == 'jsonl':
+        sink = JsonlSink(os.environ.get('TRACE_JSONL_PATH', 'traces.jsonl'))
+    elif export == 'otlp':
+        sink = OtlpSink(os.environ.get('OTLP_ENDPOINT', 'http://localhost:4318/v1/traces'))
+    elif export:
+        raise ValueError(f"TRACE_EXPORT must be '', 'jsonl' or 'otlp', got {export!r}")
+    return Tracer(sink, sample_rate=float(os.environ.get('TRACE_SAMPLE_RATE', 0.1)),
+                  slow_ms=float(os.environ.get('TRACE_SLOW_MS', 3000)))
+
+
+tracer = tracer_from_env()
+
+
+def span(name: str, **attributes):
+    """A child span of the current one; a no-op outside a traced request."""
+    return tracer.span(name, **attributes)
+
+
+def current_span():
+    return _current_span.get() or NOOP
+
+
+def request_id() -> Optional[str]:
+    return _request_id.get()
+
+
+class TracingMiddleware:
+    """ASGI middleware giving every HTTP request a request id and, when tracing is on,
+    a root span covering the whole response (streamed bodies included)."""
+
+    def __init__(self, app, tracer: Tracer = None):
+        self.app = app
+        self.tracer = tracer
+
+    async def __call__(self, scope, receive, send):
+        if scope['type'] != 'http':
+            return await self.app(scope, receive, send)
+        t = self.tracer or tracer
+        incoming = dict(scope.get('headers') or []).get(b'x-request-id')
+        rid = incoming.decode('latin-1')[:64] if incoming else None
+        with t.start_trace(f"{scope['method']} {scope['path']}", rid) as root:
+            rid_header = _request_id.get().encode('latin-1')
+
+            async def send_with_id(message):
+                if message['type'] == 'http.response.start':
+                    message['headers'] = list(message.get('headers') or []) + [(b'x-request-id', rid_header)]
+                    root.set(status=message['status'])
+                    if message['status'] >= 500 and isinstance(root, Span) and root.error is None:
+                        root.error = f"HTTP {message['status']}"
+                await send(message)
+
+            await self.app(scope, receive, send_with_id)
+
+
+def print_tree(path: str, request_id: str):
+    with open(path, encoding='utf-8') as f:
+        for line in f:
+            record = json.loads(line)
+            if request_id not in (record['request_id'], record['trace_id']):
+                continue
+            print(f"{record['name']}  request_id={record['request_id']}  {record['duration_ms']:.1f} ms"
+                  + (f"  ERROR {record['error']}" if record['error'] else ''))
+            children = {}
+            for s in record['spans']:
+                children.setdefault(s['parent_id'], []).append(s)
+
+            def walk(parent_id, depth):
+                for s in children.get(parent_id, []):
+                    attrs = ' '.join(f'{k}={v}' for k, v in s['attributes'].items())
+                    print(f"{'  ' * depth}{s['name']:<{36 - 2 * depth}} +{s['offset_ms']:>9.1f} ms "
+                          f"{s['duration_ms']:>9.1f} ms  {attrs}" + (f"  ERROR {s['error']}" if s['error'] else ''))
+                    for e in s['events']:
+                        print(f"{'  ' * (depth + 1)}! {e['name']} +{e['offset_ms']:.1f} ms {e['attributes']}")
+                    walk(s['span_id'], depth + 1)
+            walk(None, 0)
+            return True
+    print(f'no trace for {request_id} in {path}')
+    return False
+
+
+if __name__ == '__main__':
+    if len(sys.argv) != 3:
+        sys.exit('usage: python tracing.py TRACES.jsonl REQUEST_ID')
+    sys.exit(0 if print_tree(sys.argv[1], sys.argv[2]) else 1)
@@ -0,0 +1,161 @@
+import threading
+import zlib
+from typing import List, Optional
+
+import numpy as np
+
+from memory_index import tokenize
+
+
+class HashingEmbedder:
+    """Offline text embedder: signed feature hashing of words and character n-grams.
+
+    No model download or network access; the same text always maps to the same
+    L2-normalised float32 vector, in any process.
+    """
+
+    def __init__(self, dim: int = 1024, ngram_range=(3, 5)):
+        self.dim = dim
+        self.ngram_range = ngram_range
+
+    def _features(self, text: str):
+        """Yield (feature, weight): each word counts once as a whole, and once more
+        spread over its character n-grams so typos and inflections still overlap."""
+        for word in tokenize(text):
+            yield 'w:' + word, 1.0
+            padded = f'<{word}>'
+            grams = [padded[i:i + n]
+                     for n in range(self.ngram_range[0], self.ngram_range[1] + 1)
+                     for i in range(len(padded) - n + 1)]
+            weight = 1.0 / len(grams) ** 0.5
+            for gram in grams:
+                yield gram, weight
+
+    def embed(self, texts: List[str]) -> np.ndarray:
+        """Embed a batch of texts into a (len(texts), dim) float32 matrix."""
+        rows, cols, vals = [], [], []
+        for row, text in enumerate(texts):
+            for feat, weight in self._features(text):
+                h = zlib.crc32(feat.encode('utf-8'))
+                rows.append(row)
+                cols.append(h % self.dim)
+                vals.append(weight if h & 0x80000000 else -weight)
+        out = np.zeros((len(texts), self.dim), dtype=np.float32)
+        if rows:
+            np.add.at(out, (np.asarray(rows), np.asarray(cols)), np.asarray(vals, dtype=np.float32))
+        norms = np.linalg.norm(out, axis=1, keepdims=True)
+        norms[norms == 0] = 1.0
+        out /= norms
+        return out
+
+
+class VectorIndex:
+    """Memory store searched by cosine similarity over a contiguous float32 matrix.
+
+    Drop-in alternative to MemoryIndex (same add/search/recent/pop_oldest surface).
+    New memories are queued and embedded in one batch right before the next search
+    (or once `batch_size` are waiting). Search is a single matrix-vector product
+    plus argpartition.
+    """
+
+    def __init__(self, capacity: Optional[int] = None, embedder: Optional[HashingEmbedder] = None,
+                 batch_size: int = 64):
+        self.embedder = embedder or HashingEmbedder()
+        self.capacity = capacity
+        self.batch_size = batch_size
+        self._lock = threading.RLock()
+        # memories live in a ring: slot = sequence number % allocated rows (when bounded)
+        self._rows = capacity or 1024
+        self._vectors = np.zeros((self._rows, self.embedder.dim), dtype=np.float32)
+        self._items = [None] * self._rows
+        self._head = 0            # sequence number of the oldest live memory
+        self._tail = 0            # sequence number the next memory gets
+        self._embedded = 0        # sequence numbers below this have vectors
+
+    def __len__(self):
+        return self._tail - self._head
+
+    def _slot(self, seq: int) -> int:
+        return seq % self._rows
+
+    def _grow(self):
+        # unbounded stores double their matrix; live rows are re-laid out from slot 0
+        order = [self._slot(s) for s in range(self._head, self._tail)]
+        rows = self._rows * 2
+        vectors = np.zeros((rows, self.embedder.dim), dtype=np.float32)
+        vectors[:len(order)] = self._vectors[order]
+        items = [self._items[i] for i in order] + [None] * (rows - len(order))
+        self._embedded -= self._head
+        self._tail -= self._head
+        self._head = 0
+        self._vectors, self._items, self._rows = vectors, items, rows
+
+    def items(self) -> List[dict]:
+        with self._lock:
+            return [self._items[self._slot(s)] for s in range(self._head, self._tail)]
+
+    def recent(self, limit: int) -> List[dict]:
+        with self._lock:
+            start = max(self._head, self._tail - limit)
+            return [self._items[self._slot(s)] for s in range(start, self._tail)]
+
+    def add(self, item: dict):
+        with self._lock:
+            if len(self) >= self._rows:
+                if self.capacity is not None:
+                    self.pop_oldest()
+                else:
+                    self._grow()
+            seq = self._tail
+            self._items[self._slot(seq)] = item
+            self._tail += 1
+            if self._tail - self._embedded >= self.batch_size:
+                self._flush()
+            return seq
+
+    def pop_oldest(self) -> Optional[dict]:
+        with self._lock:
+            if not len(self):
+                return None
+            slot = self._slot(self._head)
+            item = self._items[slot]
+            self._items[slot] = None
+            self._head += 1
+            self._embedded = max(self._embedded, self._head)
+            return item
+
+    def _flush(self):
+        """Embed all queued memories in one batch."""
+        start = max(self._embedded, self._head)
+        if start >= self._tail:
+            return
+        seqs = range(start, self._tail)
+        slots = np.fromiter((self._slot(s) for s in seqs), dtype=np.int64, count=len(seqs))
+        vectors = self.embedder.embed([self._items[s].get('text', '') for s in slots])
+        self._vectors[slots] = vectors
+        self._embedded = self._tail
+
+    def _live_slots(self) -> np.ndarray:
+        head, tail = self._slot(self._head), self._slot(self._tail)
+        if len(self) == self._rows:
+            return np.arange(self._rows)
+        if head <= tail:
+            return np.arange(head, tail)
+        return np.concatenate([np.arange(head, self._rows), np.arange(0, tail)])
+
+    def search(self, query: str, limit: int = 5, min_score: float = 0.05) -> List[dict]:
+        """Return up to `limit` memories by cosine similarity; empty if nothing scores above `min_score`."""
+        if not query or not tokenize(query):
+            return []
+        qvec = self.embedder.embed([query])[0]
+        with self._lock:
+            if not len(self):
+                return []
+            self._flush()
+            slots = self._live_slots()
+            # one BLAS pass over the whole contiguous matrix beats gathering live rows first
+            scores = (self._vectors @ qvec)[slots]
+            k = min(limit, len(scores))
+            top = np.argpartition(-scores, k - 1)[:k]
+            top = top[np.argsort(-scores[top])]
+            return [self._items[slots[i]] for i in top if scores[i] > min_score]
@@ -0,0 +1,126 @@
+import json
+import re
+import sqlite3
+import threading
+import time
+import unicodedata
+from collections import OrderedDict
+from typing import Optional
+
+_SPACE_RE = re.compile(r'\s+')
+
+
+def normalize_query(query: str) -> str:
+    """Cache-key form of a query: NFKC, lowercased, whitespace collapsed, edge punctuation dropped."""
+    q = unicodedata.normalize('NFKC', query or '').lower()
+    q = _SPACE_RE.sub(' ', q).strip()
+    return q.strip('?!.,;:"\'')
+
+
+class WebCache:
+    """TTL + LRU cache for search provider results, optionally persisted to SQLite.
+
+    Keys are (provider, normalized query, max_results); each provider has its own
+    TTL. The in-memory layer is a true LRU (OrderedDict, move-to-end on hit). When
+    `path` is set every write also goes to a small SQLite table, and in-memory misses
+    fall back to it, so results survive restarts and spin-downs.
+    """
+
+    def __init__(self, max_entries: int = 512, default_ttl: float = 1800.0, ttls: Optional[dict] = None,
+                 path: Optional[str] = None):
+        self.max_entries = max_entries
+        self.default_ttl = default_ttl
+        self.ttls = dict(ttls or {})
+        self.path = path
+        self._entries = OrderedDict()   # key -> (expires_at, value)
+        self._lock = threading.Lock()
+        self._db = None
+        self.hits = 0
+        self.misses = 0
+        self.disk_hits = 0
+        self.evictions = 0
+        self.expirations = 0
+        if path:
+            self._db = sqlite3.connect(path, check_same_thread=False, isolation_level=None)
+            self._db.execute('PRAGMA journal_mode=WAL')
+            self._db.execute('PRAGMA synchronous=NORMAL')
+            self._db.execute('CREATE TABLE IF NOT EXISTS web_cache (key TEXT PRIMARY KEY, value TEXT, expires REAL)')
+            self._db.execute('DELETE FROM web_cache WHERE expires < ?', (time.time(),))
+
+    @staticmethod
+    def key(provider: str, query: str, max_results: int) -> str:
+        return f'{provider}:{max_results}:{normalize_query(query)}'
+
+    def ttl_for(self, provider: str) -> float:
+        return self.ttls.get(provider, self.default_ttl)
+
+    def _put_memory(self, key: str, expires: float, value):
+        self._entries[key] = (expires, value)
+        self._entries.move_to_end(key)
+        while len(self._entries) > self.max_entries:
+            self._entries.popitem(last=False)
+            self.evictions += 1
+
+    def _load_disk(self, key: str):
+        if self._db is None:
+            return None
+        row = self._db.execute('SELECT value, expires FROM web_cache WHERE key = ?', (key,)).fetchone()
+        if row is None:
+            return None
+        if row[1] < time.time():
+            self._db.execute('DELETE FROM web_cache WHERE key = ?', (key,))
+            return None
+        return row[1], json.loads(row[0])
+
+    def get(self, provider: str, query: str, max_results: int):
+        key = self.key(provider, query, max_results)
+        now = time.time()
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None and entry[0] < now:
+                del self._entries[key]
+                self.expirations += 1
+                entry = None
+            if entry is None:
+                entry = self._load_disk(key)
+                if entry is None:
+                    self.misses += 1
+                    return None
+                self.disk_hits += 1
+                self._put_memory(key, *entry)
+            else:
+                self._entries.move_to_end(key)
+            self.hits += 1
+            return entry[1]
+
+    def contains(self, provider: str, query: str, max_results: int) -> bool:
+        """Whether a fresh in-memory entry exists, without touching LRU order or counters."""
+        entry = self._entries.get(self.key(provider, query, max_results))
+        return entry is not None and entry[0] >= time.time()
+
+    def set(self, provider: str, query: str, max_results: int, value, ttl: Optional[float] = None):
+        key = self.key(provider, query, max_results)
+        expires = time.time() + (self.ttl_for(provider) if ttl is None else ttl)
+        with self._lock:
+            self._put_memory(key, expires, value)
+            if self._db is not None:
+                self._db.execute('INSERT OR REPLACE INTO web_cache (key, value, expires) VALUES (?, ?, ?)',
+                                 (key, json.dumps(value, ensure_ascii=False), expires))
+
+    def stats(self) -> dict:
+        lookups = self.hits + self.misses
+        return {
+            'entries': len(self._entries),
+            'hits': self.hits,
+            'misses': self.misses,
+            'disk_hits': self.disk_hits,
+            'evictions': self.evictions,
+            'expirations': self.expirations,
+            'hit_ratio': round(self.hits / lookups, 3) if lookups else None,
+            'persistent': self._db is not None,
+        }
+
+    def close(self):
+        if self._db is not None:
+            self._db.close()
+            self._db = None
@@ -0,0 +1,190 @@
+import datetime
+import json
+import math
+import os
+import re
+import sys
+from collections import Counter
+from typing import Iterable, List, Optional, Tuple
+
+from memory_index import tokenize
+
+# Decides whether a message needs fresh web results. A web search costs seconds,
+# so a false positive is expensive: triggers match whole words only ("update" but
+# not "updated"), and words that often appear in everyday talk ("today", "current")
+# are weak triggers that do not turn the web on by themselves, however many there
+# are: without a strong trigger, a recent year or a classifier vote their combined
+# confidence stays below the threshold.
+#
+# Every trigger is one alternative of a single compiled regex; the named group that
+# matched says which kind of trigger it was. A year only counts when it is this
+# year or the last one ("since 2019" is about the user, not the news).
+
+STRONG = ('latest', 'news', 'released', 'release', 'releases', 'announced', 'announcement', 'trending',
+          'version', 'versions', 'changelog', 'pypi', 'npm', 'github', 'stackoverflow', 'stack overflow',
+          'install', 'installing', 'how to install', 'pip install', 'compatible', 'compatibility',
+          'incompatible', 'deprecated', 'any update', 'any updates')
+WEAK = ('recent', 'recently', 'current', 'currently', 'update', 'updates', 'today', 'tonight', 'trend', 'trends',
+        'new')
+
+STRONG_CONFIDENCE = 0.8
+WEAK_CONFIDENCE = 0.35
+YEAR_CONFIDENCE = 0.7
+# weak triggers alone reach at most this share of the threshold
+WEAK_ONLY_SHARE = 0.9
+THRESHOLD = float(os.environ.get('WEB_ROUTER_THRESHOLD', 0.5))
+# share of the final confidence given to the classifier, when one is loaded
+CLASSIFIER_WEIGHT = float(os.environ.get('WEB_ROUTER_CLASSIFIER_WEIGHT', 0.5))
+
+
+def _trie(words: Iterable[str]) -> str:
+    """Regex alternation for `words` with shared prefixes factored out ("releas(?:e|ed|es)"),
+    so the engine tries each prefix once instead of once per word."""
+    root = {}
+    for word in words:
+        node = root
+        for ch in word:
+            node = node.setdefault(ch, {})
+        node[''] = {}
+
+    def build(node):
+        if list(node) == ['']:
+            return ''
+        alts = [re.escape(ch) + build(child) for ch, child in sorted(node.items()) if ch]
+        out = alts[0] if len(alts) == 1 else '(?:' + '|'.join(alts) + ')'
+        return f'(?:{out})?' if '' in node else out
+    return build(root)
+
+
+def compile_triggers(strong=STRONG, weak=WEAK) -> 're.Pattern':
+    """One pattern for every trigger, matched against lowercased text. The lookahead on
+    possible first letters lets most word starts fail before entering the alternation."""
+    first = ''.join(sorted({w[0] for w in strong + weak} | {'2'}))
+    return re.compile(rf'\b(?=[{first}])(?:(?P<strong>{_trie(strong)})|(?P<weak>{_trie(weak)})|(?P<year>20\d\d))\b')
+
+
+class WebClassifier:
+    """Naive Bayes over message words: P(needs web | words), trained on labelled messages.
+
+    Only the per-word log-likelihood ratios are kept, so a prediction is one dict
+    lookup per distinct word of the message.
+    """
+
+    def __init__(self, prior: float = 0.0, weights: Optional[dict] = None):
+        self.prior = prior            # log-odds of needing the web before seeing any word
+        self.weights = weights or {}  # word -> log P(word | web) - log P(word | no web)
+
+    @classmethod
+    def fit(cls, examples: Iterable[Tuple[str, bool]], alpha: float = 1.0, min_count: int = 2) -> 'WebClassifier':
+        counts = {True: Counter(), False: Counter()}
+        docs = {True: 0, False: 0}
+        for text, label in examples:
+            label = bool(label)
+            docs[label] += 1
+            counts[label].update(set(tokenize(text)))
+        vocab = [w for w in set(counts[True]) | set(counts[False]) if counts[True][w] + counts[False][w] >= min_count]
+        totals = {label: sum(counts[label][w] for w in vocab) + alpha * len(vocab) for label in (True, False)}
+        weights = {w: math.log((counts[True][w] + alpha) / totals[True]) - math.log((counts[False][w] + alpha) / totals[False])
+                   for w in vocab}
+        prior = math.log((docs[True] + 1) / (docs[False] + 1))
+        return cls(prior, weights)
+
+    def predict(self, text: str) -> float:
+        score = self.prior + sum(self.weights.get(w, 0.0) for w in set(tokenize(text)))
+        return 1.0 / (1.0 + math.exp(-max(-30.0, min(30.0, score))))
+
+    def save(self, path: str):
+        with open(path, 'w', encoding='utf-8') as f:
+            json.dump({'prior': self.prior, 'weights': self.weights}, f)
+
+    @classmethod
+    def load(cls, path: str) -> 'WebClassifier':
+        with open(path, encoding='utf-8') as f:
+            data = json.load(f)
+        return cls(data['prior'], data['weights'])
+
+
+# An assistant reply that cites sources came from a request that used web findings
+_CITES_WEB = re.compile(r'\[\d+\]|https?://|\bwikipedia\b|\bweb findings\b|\baccording to (?:the )?(?:sources?|excerpts?)\b',
+                        re.IGNORECASE)
+
+
+def examples_from_log(items: List[dict]) -> List[Tuple[str, bool]]:
+    """(user text, needed web) pairs from memory.json-style entries.
+
+    A user entry's own 'use_web' field is used when present; otherwise the label is
+    whether the assistant reply that follows it cites web sources.
+    """
+    examples = []
+    for i, item in enumerate(items):
+        if item.get('role') != 'user' or not item.get('text'):
+            continue
+        if 'use_web' in item:
+            examples.append((item['text'], bool(item['use_web'])))
+        elif i + 1 < len(items) and items[i + 1].get('role') == 'ai':
+            examples.append((item['text'], bool(_CITES_WEB.search(items[i + 1].get('text') or ''))))
+    return examples
+
+
+class WebRouter:
+    def __init__(self, classifier: Optional[WebClassifier] = None, threshold: float = THRESHOLD,
+                 classifier_weight: float = CLASSIFIER_WEIGHT):
+        self.pattern = compile_triggers()
+        self.classifier = classifier
+        self.threshold = threshold
+        self.classifier_weight = classifier_weight
+
+    def rule_confidence(self, text: str) -> Tuple[float, List[str]]:
+        """Noisy-or of the confidences of every trigger found, and the triggers themselves.
+        With only weak triggers found it is capped below the threshold."""
+        miss = 1.0
+        hits = []
+        weak_only = True
+        min_year = None
+        for m in self.pattern.finditer(text.lower()):
+            kind = m.lastgroup
+            if kind == 'year':
+                if min_year is None:
+                    min_year = datetime.date.today().year - 1  # per call: workers outlive New Year's Eve
+                if int(m.group()) < min_year:
+                    continue
+                miss *= 1.0 - YEAR_CONFIDENCE
+                weak_only = False
+            elif kind == 'strong':
+                miss *= 1.0 - STRONG_CONFIDENCE
+                weak_only = False
+            else:
+                miss *= 1.0 - WEAK_CONFIDENCE
+            hits.append(m.group())
+        confidence = 1.0 - miss
+        if hits and weak_only:
+            confidence = min(confidence, self.threshold * WEAK_ONLY_SHARE)
+        return confidence, hits
+
+    def route(self, text: str) -> dict:
+        """{'use_web': bool, 'confidence': 0..1, 'reason': str} for a user message."""
+        if not text:
+            return {'use_web': False, 'confidence': 0.0, 'reason': 'empty'}
+        confidence, hits = self.rule_confidence(text)
+        reason = 'triggers: ' + ', '.join(hits) if hits else 'no triggers'
+        if self.classifier is not None:
+            p = self.classifier.predict(text)
+            confidence = (1 - self.classifier_weight) * confidence + self.classifier_weight * p
+            reason += f'; classifier {p:.2f}'
+        return {'use_web': confidence >= self.threshold, 'confidence': round(confidence, 3), 'reason': reason}
+
+
+def router_from_env() -> WebRouter:
+    """The rules alone, or rules plus the classifier saved at WEB_ROUTER_MODEL."""
+    path = os.environ.get('WEB_ROUTER_MODEL')
+    return WebRouter(WebClassifier.load(path) if path else None)
+
+
+if __name__ == '__main__':
+    # python web_router.py memory.json web_router_model.json
+    if len(sys.argv) != 3:
+        sys.exit('usage: python web_router.py MEMORY.json MODEL_OUT.json')
+    with open(sys.argv[1], encoding='utf-8') as f:
+        examples = examples_from_log(json.load(f))
+    WebClassifier.fit(examples).save(sys.argv[2])
+    print(f'trained on {len(examples)} messages ({sum(l for _, l in examples)} needing web) -> {sys.argv[2]}')